@@ -13,20 +13,33 @@ Features:
 
 #!/usr/bin/env python3
 
-import pandas as pd
-from datetime import datetime, timedelta
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
+from datetime import datetime
 import os
 import sys
 
+# Shared MIS loader lives in report_utils/ at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_utils.backfill import dated_path, dated_subject, parse_run_dates
+from report_utils.mail_spool import spool_message
+from report_utils.mailer import build_message
+from report_utils.metrics import report_metrics
+from report_utils.mis_snapshot import load_mis
+from report_utils.output_cache import keep_outputs, output_key, reuse_outputs
+from report_utils.report_spec import compile_plan, load_spec
+from report_utils.report_writer import write_excel, write_workbook
+
 # Ensure Jenkins-safe console output
 sys.stdout.reconfigure(encoding="utf-8")
 
 # ================= CONFIG =================
+# Filters, date windows, columns, hospitals and recipients of this report
+# are declared in report_spec.toml next to this script
+SPEC = load_spec(os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_spec.toml"))
+PLAN = compile_plan([SPEC])
+
+# Per-stage timings and row counts (metrics/ at the repository root)
+METRICS = report_metrics(__file__)
+
 input_file = r"input folder path\Dummy Dataset.xlsx"
 
 output_file_cancelled_paid = (
@@ -39,21 +52,25 @@ output_file_cancelled = (
     r"\cancelled_patients.xlsx"
 )
 
+# Set to a path to send both reports as two sheets of one workbook
+# (a single attachment) instead of two separate files
+output_file_combined = None
+
+# Workbook(s) the report writes and attaches
+OUTPUT_FILES = (
+    [output_file_combined] if output_file_combined
+    else [output_file_cancelled_paid, output_file_cancelled]
+)
+
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 
-# Credentials from environment variables
+# Sender address; the mail sender reads EMAIL_PASSWORD itself
 FROM_EMAIL = os.getenv("EMAIL_USER")
-SMTP_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
-# Placeholder emails
-TO_EMAILS = [
-    "recipient@domain.com"
-]
-
-CC_EMAILS = [
-    "recipient@domain.com"
-]
+# Recipients (placeholders) are kept in report_spec.toml
+TO_EMAILS = SPEC["mail"]["to"]
+CC_EMAILS = SPEC["mail"]["cc"]
 
 SUBJECT = "Appointments Report"
 
@@ -69,122 +86,131 @@ BA Team
 Aster Digital Health
 """
 
-# ================= LOAD MIS =================
-try:
-    df = pd.read_excel(input_file, engine="openpyxl")
-except Exception as e:
-    print("[ERROR] Failed to read MIS file:", e)
-    sys.exit(0)
-
-df.columns = df.columns.str.strip()
-
-# Detect appointment date column
-possible_date_cols = [c for c in df.columns if "date" in c.lower()]
-if not possible_date_cols:
-    print("[ERROR] Appointment date column not found")
-    print(df.columns.tolist())
-    sys.exit(0)
-
-DATE_COL = possible_date_cols[0]
-print("[INFO] Using appointment date column:", DATE_COL)
-
-df[DATE_COL] = pd.to_datetime(df[DATE_COL], errors="coerce")
-
-# ================= FILTER DATA =================
-allowed_hospitals = [
-    "Aster Medcity",
-    "Aster MIMS Hospital, Calicut",
-    "Aster MIMS Hospital, Kannur",
-    "Aster MIMS Kottakkal",
-    "Aster Mother Hospital, Areekode"
-]
-
-yesterday = datetime.today().date() - timedelta(days=1)
+# ================= FILTER CONFIG =================
+# Hospital filter and date windows: see report_spec.toml
+# Run date; a backfill passes its own (--as-of / --from / --to)
 today = datetime.today().date()
 
-# -------- Cancelled & Paid (Yesterday) --------
-df_cp = df[df[DATE_COL].dt.date == yesterday]
-
-if "Consider Patient" in df_cp.columns:
-    df_cp = df_cp[df_cp["Consider Patient"].astype(str).str.lower().str.strip() == "yes"]
-
-cancelled_paid = df_cp[
-    (df_cp["Appt. Status"].astype(str).str.lower().str.strip() == "cancelled") &
-    (df_cp["Appt. Payment Status"].astype(str).str.lower().str.strip() == "paid") &
-    (df_cp["Hospital Name"].astype(str).str.strip().isin(allowed_hospitals))
-].copy()
-
-cols_cp = [
-    "Patient Name", "Hospital Name", "Mobile",
-    "Doctor Name", "Speciality", DATE_COL,
-    "Appt. Status", "Appt. Payment Status"
-]
-
-cancelled_paid = cancelled_paid[[c for c in cols_cp if c in cancelled_paid.columns]].drop_duplicates()
-
-os.makedirs(os.path.dirname(output_file_cancelled_paid), exist_ok=True)
-cancelled_paid.to_excel(output_file_cancelled_paid, index=False)
-
-print("[OK] Cancelled & Paid report generated:", output_file_cancelled_paid)
-
-# -------- Cancelled (Yesterday + Today) --------
-df_c = df[
-    (df["Appt. Status"].astype(str).str.lower().str.strip() == "cancelled") &
-    (df[DATE_COL].dt.date.isin([yesterday, today])) &
-    (df["Hospital Name"].astype(str).str.strip().isin(allowed_hospitals))
-].copy()
+# MIS columns this report reads (only these are loaded)
+MIS_COLUMNS = PLAN.columns()
+
+
+def output_files(as_of):
+    """
+    OUTPUT_FILES of run date ``as_of`` (dated unless it is today).
+    """
+    return [dated_path(path, as_of, today) for path in OUTPUT_FILES]
+
+
+# ================= REPORT STAGE =================
+def run_report(df, as_of=None, send=True):
+    """
+    Builds both cancelled reports from a loaded MIS frame and emails them.
+    The frame may be shared with other reports, so it is not modified.
+
+    ``as_of`` is the run date (default today); ``send=False`` only writes
+    the workbook(s).
+    """
+    as_of = as_of or today
+    outputs = output_files(as_of)
+
+    # Both reports come from the shared plan (one mask per predicate)
+    with METRICS.stage("filter") as st:
+        frames = PLAN.evaluate(df, as_of=as_of)
+        st.rows = sum(len(f) for f in frames.values())
+
+    # -------- Cancelled & Paid (Yesterday) --------
+    cancelled_paid = frames["cancelled_paid"]
+
+    # -------- Cancelled (Yesterday + Today) --------
+    df_c = frames["cancelled_recent"]
+
+    # -------- Save --------
+    with METRICS.stage("write", rows=len(cancelled_paid) + len(df_c)):
+        if output_file_combined:
+            # One workbook, one sheet per report, written in a single pass
+            write_workbook(outputs[0], {
+                "Cancelled_Paid_Yesterday": cancelled_paid,
+                "Cancelled_Yesterday_Today": df_c,
+            })
+            print("[OK] Cancelled reports generated:", outputs[0])
+        else:
+            write_excel(cancelled_paid, outputs[0])
+            print("[OK] Cancelled & Paid report generated:", outputs[0])
+
+            write_excel(df_c, outputs[1])
+            print("[OK] Cancelled appointments report generated:", outputs[1])
+
+    METRICS.count("rows_cancelled_paid", len(cancelled_paid))
+    METRICS.count("rows_cancelled_recent", len(df_c))
+
+    # ================= SEND EMAIL =================
+    if send:
+        send_report(as_of)
+        METRICS.count("rows_sent", len(cancelled_paid) + len(df_c))
+
+
+def send_report(as_of=None):
+    """
+    Queues the report workbook(s) of run date ``as_of`` for delivery.
+    """
+    as_of = as_of or today
+    try:
+        with METRICS.stage("mail"):
+            msg = build_message(
+                FROM_EMAIL, TO_EMAILS, CC_EMAILS, dated_subject(SUBJECT, as_of, today), BODY,
+                attachments=output_files(as_of)
+            )
+
+            # Queued in the mail spool; the sender delivers it (with SMTP debug output)
+            spool_message(
+                msg, TO_EMAILS + CC_EMAILS, SMTP_SERVER, SMTP_PORT,
+                FROM_EMAIL, debug=True, run_date=as_of
+            )
+
+        print("[OK] Email queued for delivery with both reports")
+
+    except Exception as e:
+        print("[ERROR] Email could not be queued")
+        print(str(e))
 
-if "Patient" in df_c.columns:
-    df_c = df_c[df_c["Patient"].astype(str).str.lower().str.strip() == "yes"]
 
-cols_c = [
-    "Patient Name", "Hospital Name",
-    "Mobile", "Doctor Name",
-    "Speciality", DATE_COL
-]
-
-df_c = df_c[[c for c in cols_c if c in df_c.columns]].drop_duplicates()
-
-os.makedirs(os.path.dirname(output_file_cancelled), exist_ok=True)
-df_c.to_excel(output_file_cancelled, index=False)
-
-print("[OK] Cancelled appointments report generated:", output_file_cancelled)
-
-# ================= SEND EMAIL =================
-try:
-    msg = MIMEMultipart()
-    msg["From"] = FROM_EMAIL
-    msg["To"] = ", ".join(TO_EMAILS)
-    msg["Cc"] = ", ".join(CC_EMAILS)
-    msg["Subject"] = SUBJECT
-    msg.attach(MIMEText(BODY, "plain"))
-
-    for path in [output_file_cancelled_paid, output_file_cancelled]:
-        with open(path, "rb") as f:
-            part = MIMEBase("application", "octet-stream")
-            part.set_payload(f.read())
-
-        encoders.encode_base64(part)
-
-        part.add_header(
-            "Content-Disposition",
-            f"attachment; filename={os.path.basename(path)}"
-        )
-
-        msg.attach(part)
-
-    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-    server.set_debuglevel(1)
-    server.starttls()
-
-    server.login(FROM_EMAIL, SMTP_PASSWORD)
-
-    server.sendmail(FROM_EMAIL, TO_EMAILS + CC_EMAILS, msg.as_string())
-
-    server.quit()
-
-    print("[OK] Email sent successfully with both attachments")
-
-except Exception as e:
-    print("[ERROR] Email sending failed")
-    print(str(e))
+# ================= LOAD MIS =================
+if __name__ == "__main__":
+    info = lambda message: print(f"[INFO] {message}")
+
+    # Today, or the run dates of a backfill (see report_utils/backfill.py)
+    RUN = parse_run_dates()
+    if RUN.backfill:
+        info(f"Backfill: {RUN}")
+
+    pending = []
+    try:
+        # Same MIS, spec, day and code as an earlier build: reuse its
+        # workbook(s) (--force or REPORT_CACHE_FORCE=1 rebuilds)
+        for as_of in RUN.dates:
+            with METRICS.stage("cache"):
+                CACHE_KEY = output_key(input_file, SPEC, as_of, [__file__])
+                reused = reuse_outputs(CACHE_KEY, output_files(as_of), log=info)
+
+            if not reused:
+                pending.append((as_of, CACHE_KEY))
+            elif RUN.mail:
+                send_report(as_of)
+
+        if pending:
+            # One load for every pending day; the row pre-filter (union of
+            # the days' windows) only cuts the rows that get loaded
+            with METRICS.stage("load") as st:
+                df = load_mis(
+                    input_file, columns=MIS_COLUMNS,
+                    filters=PLAN.prefilter(pending[0][0], pending[-1][0])
+                )
+                st.rows = len(df)
+    except Exception as e:
+        print("[ERROR] Failed to read MIS file:", e)
+        sys.exit(0)
+
+    for as_of, CACHE_KEY in pending:
+        run_report(df, as_of, send=RUN.mail)
+        keep_outputs(CACHE_KEY, output_files(as_of), log=info)
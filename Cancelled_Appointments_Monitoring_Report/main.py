@@ -12,15 +12,21 @@ Both reports are emailed automatically as attachments.
 Author: SKANDA N RAJ
 """
 
-import pandas as pd
-from datetime import datetime, timedelta
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
+from datetime import datetime
 import os
 from dotenv import load_dotenv
+import sys
+
+# Shared MIS loader lives in report_utils/ at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_utils.backfill import dated_path, dated_subject, parse_run_dates
+from report_utils.mail_spool import spool_message
+from report_utils.mailer import build_message
+from report_utils.metrics import report_metrics
+from report_utils.mis_snapshot import load_mis
+from report_utils.output_cache import keep_outputs, output_key, reuse_outputs
+from report_utils.report_spec import compile_plan, load_spec, mail_text
+from report_utils.report_writer import write_excel, write_workbook
 
 
 # ================= ENVIRONMENT =================
@@ -30,6 +36,14 @@ load_dotenv()
 
 # ================= CONFIGURATION =================
 
+# Filters, date windows, columns, hospitals and recipients of this report
+# are declared in report_spec.toml next to this script
+SPEC = load_spec(os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_spec.toml"))
+PLAN = compile_plan([SPEC])
+
+# Per-stage timings and row counts (metrics/ at the repository root)
+METRICS = report_metrics(__file__)
+
 # Input MIS file
 input_file = r"input folder \Dummy Dataset.xlsx"
 
@@ -37,183 +51,161 @@ input_file = r"input folder \Dummy Dataset.xlsx"
 output_file_cancelled_paid = r"output folder path/cancelled_paid_yesterday.xlsx"
 output_file_cancelled = r"output folder path/cancelled_patients.xlsx"
 
+# Set to a path to send both reports as two sheets of one workbook
+# (a single attachment) instead of two separate files
+output_file_combined = None
+
+# Workbook(s) the report writes and attaches
+OUTPUT_FILES = (
+    [output_file_combined] if output_file_combined
+    else [output_file_cancelled_paid, output_file_cancelled]
+)
+
 # SMTP Configuration
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 
-# Load credentials securely from environment variables
+# Sender address; the mail sender reads EMAIL_PASSWORD itself
 FROM_EMAIL = os.getenv("EMAIL_USER")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
 # Email Recipients (generic for public repo)
-TO_EMAILS = ["recipient@domain.com"]
-CC_EMAILS = ["recipient@domain.com"]
+TO_EMAILS = SPEC["mail"]["to"]
+CC_EMAILS = SPEC["mail"]["cc"]
 
-SUBJECT = "Appointments Report"
+# Subject and body: [mail] in report_spec.toml (mail_text)
 
-BODY = """Hi Team,
 
-Please find attached the latest reports:
+# ================= BUSINESS RULE: DATES =================
 
-1. Cancelled & Paid appointments from yesterday.
-2. Cancelled appointments (yesterday and today).
+# Hospital filter and date windows: see report_spec.toml
+# Run date; a backfill passes its own (python main.py --as-of / --from / --to)
+today = datetime.today().date()
 
-Best regards,
-Analytics Team
-"""
+# MIS columns this report reads (only these are loaded)
+MIS_COLUMNS = PLAN.columns()
 
 
-# ================= STEP 1: LOAD MIS DATA =================
+def output_files(as_of):
+    """
+    OUTPUT_FILES of run date ``as_of`` (dated unless it is today).
+    """
+    return [dated_path(path, as_of, today) for path in OUTPUT_FILES]
 
-df = pd.read_excel(input_file, engine="openpyxl")
 
-# Clean column names
-df.columns = df.columns.str.strip()
+# ================= REPORT STAGE =================
 
-# Detect appointment date column dynamically
-possible_date_cols = [col for col in df.columns if "date" in col.lower()]
+def run_report(df, as_of=None, send=True):
+    """
+    Generates both cancelled reports from a loaded MIS frame and emails them.
 
-if not possible_date_cols:
-    print("❌ Appointment date column not found")
-    print(df.columns.tolist())
-    raise SystemExit
+    The frame may be shared with other reports (see report_utils.pipeline),
+    so it is never modified here; filtered copies are.
 
-DATE_COL = possible_date_cols[0]
-print(f"✅ Using column '{DATE_COL}' as appointment date")
+    ``as_of`` is the run date (default today); ``send=False`` only writes
+    the workbook(s).
+    """
+    as_of = as_of or today
+    outputs = output_files(as_of)
 
-# Convert to datetime
-df[DATE_COL] = pd.to_datetime(df[DATE_COL], errors='coerce')
+    # Both reports are evaluated through the shared plan, so the
+    # cancelled/hospital masks are computed once for the frame
+    with METRICS.stage("filter") as st:
+        frames = PLAN.evaluate(df, as_of=as_of)
+        st.rows = sum(len(f) for f in frames.values())
 
 
-# ================= BUSINESS RULE: HOSPITAL FILTER =================
+    # ================= REPORT 1: CANCELLED & PAID (YESTERDAY) =================
 
-# Generic hospital names for public repository
-allowed_hospitals = [
-      "Aster Medcity",
-    "Aster MIMS Hospital, Calicut",
-    "Aster MIMS Hospital, Kannur",
-    "Aster MIMS Kottakkal",
-    "Aster Mother Hospital, Areekode"
-]
+    cancelled_paid = frames["cancelled_paid"]
 
 
-# ================= REPORT 1: CANCELLED & PAID (YESTERDAY) =================
+    # ================= REPORT 2: CANCELLED (YESTERDAY + TODAY) =================
 
-yesterday = datetime.today().date() - timedelta(days=1)
+    df_c = frames["cancelled_recent"]
 
-# Filter yesterday data
-df_cp = df[df[DATE_COL].dt.date == yesterday]
 
-# Optional filter: Consider Patient = Yes
-if "Consider Patient" in df_cp.columns:
-    df_cp = df_cp[
-        df_cp['Consider Patient']
-        .astype(str).str.lower().str.strip() == "yes"
-    ]
+    # ================= SAVE REPORTS =================
 
-# Apply filters
-cancelled_paid = df_cp[
-    (df_cp['Appt. Status'].astype(str).str.strip().str.lower() == "cancelled") &
-    (df_cp['Appt. Payment Status'].astype(str).str.strip().str.lower() == "paid") &
-    (df_cp['Hospital Name'].astype(str).str.strip().isin(allowed_hospitals))
-].copy()
+    with METRICS.stage("write", rows=len(cancelled_paid) + len(df_c)):
+        if output_file_combined:
+            # One workbook, one sheet per report, written in a single pass
+            write_workbook(outputs[0], {
+                "Cancelled_Paid_Yesterday": cancelled_paid,
+                "Cancelled_Yesterday_Today": df_c,
+            })
+            print(f"✅ Cancelled reports generated: {outputs[0]}")
+        else:
+            write_excel(cancelled_paid, outputs[0])
+            print(f"✅ Cancelled & Paid report generated: {outputs[0]}")
 
-# Select required columns
-cols_cp = [
-    'Patient Name',
-    'Hospital Name',
-    'Mobile',
-    'Doctor Name',
-    'Speciality',
-    DATE_COL,
-    'Appt. Status',
-    'Appt. Payment Status'
-]
+            write_excel(df_c, outputs[1])
+            print(f"✅ Cancelled appointments report generated: {outputs[1]}")
 
-cols_cp_available = [col for col in cols_cp if col in cancelled_paid.columns]
-cancelled_paid = cancelled_paid[cols_cp_available].drop_duplicates()
 
-# Save report
-os.makedirs(os.path.dirname(output_file_cancelled_paid), exist_ok=True)
-cancelled_paid.to_excel(output_file_cancelled_paid, index=False)
+    METRICS.count("rows_cancelled_paid", len(cancelled_paid))
+    METRICS.count("rows_cancelled_recent", len(df_c))
 
-print(f"✅ Cancelled & Paid report generated: {output_file_cancelled_paid}")
+    # ================= STEP 2: SEND EMAIL =================
 
+    if send:
+        send_report(as_of)
+        METRICS.count("rows_sent", len(cancelled_paid) + len(df_c))
 
-# ================= REPORT 2: CANCELLED (YESTERDAY + TODAY) =================
 
-today = datetime.today().date()
+def send_report(as_of=None):
+    """
+    Queues the report workbook(s) of run date ``as_of`` for delivery.
+    """
+    as_of = as_of or today
+    subject, body = mail_text(SPEC, as_of)
+    with METRICS.stage("mail") as st:
+        msg = build_message(
+            FROM_EMAIL, TO_EMAILS, CC_EMAILS, dated_subject(subject, as_of, today), body,
+            attachments=output_files(as_of)
+        )
 
-df_c = df[
-    (df['Appt. Status'].astype(str).str.strip().str.lower() == "cancelled") &
-    (df[DATE_COL].dt.date.isin([yesterday, today])) &
-    (df['Hospital Name'].astype(str).str.strip().isin(allowed_hospitals))
-].copy()
-
-# Optional column check
-if "Patient" in df_c.columns:
-    df_c = df_c[
-        df_c['Patient']
-        .astype(str).str.lower().str.strip() == "yes"
-    ]
-
-cols_c = [
-    'Patient Name',
-    'Hospital Name',
-    'Mobile',
-    'Doctor Name',
-    'Speciality',
-    DATE_COL
-]
-
-cols_c_available = [col for col in cols_c if col in df_c.columns]
-df_c = df_c[cols_c_available].drop_duplicates()
-
-# Save report
-os.makedirs(os.path.dirname(output_file_cancelled), exist_ok=True)
-df_c.to_excel(output_file_cancelled, index=False)
-
-print(f"✅ Cancelled appointments report generated: {output_file_cancelled}")
-
-
-# ================= STEP 2: SEND EMAIL =================
-
-msg = MIMEMultipart()
-msg["From"] = FROM_EMAIL
-msg["To"] = ", ".join(TO_EMAILS)
-msg["Cc"] = ", ".join(CC_EMAILS)
-msg["Subject"] = SUBJECT
-msg.attach(MIMEText(BODY, "plain"))
-
-# Attach first report
-with open(output_file_cancelled_paid, "rb") as f:
-    part = MIMEBase("application", "octet-stream")
-    part.set_payload(f.read())
-encoders.encode_base64(part)
-part.add_header(
-    "Content-Disposition",
-    f"attachment; filename={os.path.basename(output_file_cancelled_paid)}"
-)
-msg.attach(part)
-
-# Attach second report
-with open(output_file_cancelled, "rb") as f:
-    part = MIMEBase("application", "octet-stream")
-    part.set_payload(f.read())
-encoders.encode_base64(part)
-part.add_header(
-    "Content-Disposition",
-    f"attachment; filename={os.path.basename(output_file_cancelled)}"
-)
-msg.attach(part)
-
-# Send email
-try:
-    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-    server.starttls()
-    server.login(FROM_EMAIL, EMAIL_PASSWORD)
-    server.sendmail(FROM_EMAIL, TO_EMAILS + CC_EMAILS, msg.as_string())
-    server.quit()
-    print("📧 Email sent successfully with both attachments!")
-except Exception as e:
-    print("❌ Error sending email:", e)
+        # Queued in the mail spool; the scheduler's sender delivers it
+        try:
+            spool_message(
+                msg, TO_EMAILS + CC_EMAILS, SMTP_SERVER, SMTP_PORT,
+                FROM_EMAIL, run_date=as_of
+            )
+            print("📧 Email queued for delivery with both reports!")
+        except Exception as e:
+            print("❌ Error queueing email:", e)
+            st.failed = True
+
+
+# ================= STEP 1: LOAD MIS DATA =================
+
+if __name__ == "__main__":
+    # Today, or the run dates of a backfill (see report_utils/backfill.py)
+    RUN = parse_run_dates()
+
+    # A rerun on the same MIS, spec, day and code reuses the earlier
+    # workbook(s) without parsing the MIS (python main.py --force rebuilds)
+    pending = []
+    for as_of in RUN.dates:
+        with METRICS.stage("cache"):
+            CACHE_KEY = output_key(input_file, SPEC, as_of, [__file__])
+            reused = reuse_outputs(CACHE_KEY, output_files(as_of))
+
+        if not reused:
+            pending.append((as_of, CACHE_KEY))
+        elif RUN.mail:
+            send_report(as_of)
+
+    if pending:
+        # One load covers every pending day. The row pre-filter (union of
+        # the days' windows) only cuts the rows that get loaded; the report
+        # still applies its own rules.
+        with METRICS.stage("load") as st:
+            df = load_mis(
+                input_file, columns=MIS_COLUMNS,
+                filters=PLAN.prefilter(pending[0][0], pending[-1][0])
+            )
+            st.rows = len(df)
+
+        for as_of, CACHE_KEY in pending:
+            run_report(df, as_of, send=RUN.mail)
+            keep_outputs(CACHE_KEY, output_files(as_of))
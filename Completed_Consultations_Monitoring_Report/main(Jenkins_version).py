@@ -14,61 +14,44 @@ Features:
 #!/usr/bin/env python3
 
 import os
-import hashlib
 import pandas as pd
 from datetime import datetime, timedelta
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
 import sys
 
+# Shared MIS loader lives in report_utils/ at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_utils.backfill import dated_path, dated_subject, parse_run_dates
+from report_utils.mail_spool import spool_message
+from report_utils.mailer import build_message
+from report_utils.metrics import report_metrics
+from report_utils.mis_snapshot import load_mis
+from report_utils.report_spec import compile_plan, load_spec
+from report_utils.report_writer import write_excel
+from report_utils.row_keys import already_sent, drop_duplicate_rows, row_keys
+from report_utils.sent_keys import SentKeyStore
+
 # Ensure Jenkins-safe console output
 sys.stdout.reconfigure(encoding="utf-8")
 
-# ===================== MAIL HELPER =====================
-def send_mail_with_attachment(
-    smtp_server, smtp_port, from_email, password,
-    to_emails, cc_emails, subject, body, attachment_path
-):
-    msg = MIMEMultipart()
-    msg["From"] = from_email
-    msg["To"] = ", ".join(to_emails)
-    msg["Cc"] = ", ".join(cc_emails) if cc_emails else ""
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "plain"))
-
-    if attachment_path:
-        if not os.path.exists(attachment_path):
-            raise FileNotFoundError(f"Attachment not found: {attachment_path}")
-        with open(attachment_path, "rb") as f:
-            part = MIMEBase("application", "octet-stream")
-            part.set_payload(f.read())
-        encoders.encode_base64(part)
-        part.add_header(
-            "Content-Disposition",
-            f'attachment; filename="{os.path.basename(attachment_path)}"'
-        )
-        msg.attach(part)
-
-    recipients = to_emails + (cc_emails or [])
-
-    server = smtplib.SMTP(smtp_server, smtp_port)
-    server.set_debuglevel(1)
-    try:
-        server.ehlo()
-        server.starttls()
-        server.ehlo()
-        server.login(from_email, password)
-        server.sendmail(from_email, recipients, msg.as_string())
-    finally:
-        server.quit()
-
 # ===================== CONFIG =====================
 
+# Status filter, date window, columns and recipients of this report are
+# declared in report_spec.toml next to this script
+SPEC = load_spec(os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_spec.toml"))
+PLAN = compile_plan([SPEC])
+
+# Per-stage timings and row counts (metrics/ at the repository root)
+METRICS = report_metrics(__file__)
+
 INPUT_FILE = r"input folder path\Dummy Dataset.xlsx"
 
+# MIS columns this report reads (only these are loaded).
+# Includes every alias accepted by first_existing() below.
+MIS_COLUMNS = PLAN.columns()
+
+# Sheet of the export: "Export" when the workbook has one, else the first
+MIS_SHEETS = ["Export"]
+
 OUTPUT_DIR = r"output folder path"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -80,37 +63,42 @@ OUTPUT_FILE = os.path.join(
 STATE_DIR = os.path.join(OUTPUT_DIR, "state")
 os.makedirs(STATE_DIR, exist_ok=True)
 
-STATE_FILE = os.path.join(STATE_DIR, "sent_completed_keys.csv")
+# Sent-log (SQLite); the old CSV sent-log is imported on the first run
+STATE_DB = os.path.join(STATE_DIR, "sent_completed_keys.sqlite")
+LEGACY_STATE_FILE = os.path.join(STATE_DIR, "sent_completed_keys.csv")
 
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 
-# Credentials from environment variables
+# Sender address; the mail sender reads EMAIL_PASSWORD itself
 FROM_EMAIL = os.getenv("EMAIL_USER")
-SMTP_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
 # Placeholder emails
-TO_EMAILS = [
-    "recepitent@domain.com"
-]
-
-CC_EMAILS = [
-    "recipient@domain.com"
-]
+TO_EMAILS = SPEC["mail"]["to"]
+CC_EMAILS = SPEC["mail"]["cc"]
 
+# Run date; a backfill passes its own (--as-of / --from / --to)
 today = datetime.today().date()
-end_date = today - timedelta(days=1)
-start_date = end_date - timedelta(days=14)
 
+
+def window(as_of):
+    """
+    (start, end) of the 15 days before run date ``as_of``.
+    """
+    end_date = as_of - timedelta(days=1)
+    return end_date - timedelta(days=14), end_date
+
+
+# {start} / {end} = the 15-day window of the run date
 SUBJECT = (
-    f"Completed Consultations (Last 15 Days) "
-    f"- {start_date:%d/%m/%Y} to {end_date:%d/%m/%Y}"
+    "Completed Consultations (Last 15 Days) "
+    "- {start:%d/%m/%Y} to {end:%d/%m/%Y}"
 )
 
-BODY = f"""Hi Team,
+BODY = """Hi Team,
 
 Please find attached the completed consultations (Appt. Status = done)
-for the last 15 days ({start_date:%d/%m/%Y} to {end_date:%d/%m/%Y})
+for the last 15 days ({start:%d/%m/%Y} to {end:%d/%m/%Y})
 across all units.
 
 Columns:
@@ -134,131 +122,157 @@ def to_date(series):
     s = pd.to_datetime(series, errors="coerce")
     return s.dt.date
 
-def load_sent_keys(path):
-    if not os.path.exists(path):
-        return set()
-    try:
-        dfk = pd.read_csv(path, dtype=str)
-        if "key" in dfk.columns:
-            return set(dfk["key"].dropna())
-    except Exception:
-        pass
-    return set()
-
-def save_append_keys(path, keys):
-    df = pd.DataFrame({"key": keys})
-    df.to_csv(path, mode="a", index=False, header=not os.path.exists(path))
-
-def mk_row_hash(*values):
-    normed = []
-    for v in values:
-        s = "" if v is None else str(v)
-        s = " ".join(s.strip().lower().split())
-        normed.append(s)
-    return hashlib.md5("|".join(normed).encode("utf-8")).hexdigest()
-
-# ===================== LOAD MIS =====================
-try:
-    try:
-        df = pd.read_excel(INPUT_FILE, sheet_name="Export", engine="openpyxl")
-    except Exception:
-        df = pd.read_excel(INPUT_FILE, engine="openpyxl")
-except Exception as e:
-    print("[ERROR] Could not read MIS file:", e)
-    sys.exit(0)
-
-df.columns = df.columns.map(lambda x: str(x).strip())
-
-# Column mapping
-col_patient = first_existing(["Patient Name"], df.columns)
-col_mobile = first_existing(["Mobile", "Contact Number", "Phone"], df.columns)
-col_uhid = first_existing(["UHID", "Uhid"], df.columns)
-col_doctor = first_existing(["Doctor Name"], df.columns)
-col_spec = first_existing(["Speciality", "Specialty"], df.columns)
-col_unit = first_existing(["Hospital Name", "Unit"], df.columns)
-col_status = first_existing(["Appt. Status", "Appointment Status"], df.columns)
-col_appt_date = first_existing(["Appointment Date", "Appt Date"], df.columns)
-col_completed_dt = first_existing(["Completed DateTime"], df.columns)
-col_appt_id = first_existing(["Appointment ID"], df.columns)
-
-required = [
-    col_patient, col_mobile, col_uhid,
-    col_doctor, col_spec, col_unit,
-    col_status, col_appt_date
-]
-
-if any(c is None for c in required):
-    print("[ERROR] Missing required columns")
-    sys.exit(0)
-
-df[col_appt_date] = pd.to_datetime(df[col_appt_date], errors="coerce")
-df["__appt_date_only"] = df[col_appt_date].dt.date
-
-mask = (
-    (df[col_status].astype(str).str.lower().str.strip() == "done") &
-    (df["__appt_date_only"] >= start_date) &
-    (df["__appt_date_only"] <= end_date)
-)
-
-df_f = df.loc[mask].copy()
-
-if "Consider Patient" in df_f.columns:
-    df_f = df_f[df_f["Consider Patient"].astype(str).str.lower().str.strip() == "yes"]
-
-done_date = (
-    to_date(df_f[col_completed_dt]).fillna(to_date(df_f[col_appt_date]))
-    if col_completed_dt in df_f.columns
-    else to_date(df_f[col_appt_date])
-)
 
-out = pd.DataFrame({
-    "Patient Name": df_f[col_patient],
-    "Contact Number": df_f[col_mobile],
-    "UHID": df_f[col_uhid],
-    "Date of Completed Appointment": done_date,
-    "Doctor Name": df_f[col_doctor],
-    "Speciality": df_f[col_spec],
-    "Unit": df_f[col_unit],
-})
-
-# Dedup logic
-if col_appt_id and col_appt_id in df_f.columns:
-    out["__key"] = df_f[col_appt_id].astype(str).apply(mk_row_hash)
-else:
-    out["__key"] = out.apply(
-        lambda r: mk_row_hash(
-            r["Patient Name"], r["UHID"],
-            r["Doctor Name"], r["Unit"],
-            r["Date of Completed Appointment"]
-        ),
-        axis=1
+# ===================== REPORT STAGE =====================
+def run_report(df, as_of=None, send=True):
+    """
+    Emails completed consultations from the last 15 days that were not
+    sent before. The MIS frame is shared and is not modified.
+
+    ``as_of`` is the run date (default today). With ``send=False`` the
+    workbook is written but the sent-log is left untouched, so the rows
+    count as unsent for later runs.
+    """
+    as_of = as_of or today
+    start_date, end_date = window(as_of)
+    output_file = dated_path(OUTPUT_FILE, as_of, today)
+
+    # Column mapping
+    col_patient = first_existing(["Patient Name"], df.columns)
+    col_mobile = first_existing(["Mobile", "Contact Number", "Phone"], df.columns)
+    col_uhid = first_existing(["UHID", "Uhid"], df.columns)
+    col_doctor = first_existing(["Doctor Name"], df.columns)
+    col_spec = first_existing(["Speciality", "Specialty"], df.columns)
+    col_unit = first_existing(["Hospital Name", "Unit"], df.columns)
+    col_status = first_existing(["Appt. Status", "Appointment Status"], df.columns)
+    col_appt_date = first_existing(["Appointment Date", "Appt Date"], df.columns)
+    col_completed_dt = first_existing(["Completed DateTime"], df.columns)
+    col_appt_id = first_existing(["Appointment ID"], df.columns)
+
+    required = [
+        col_patient, col_mobile, col_uhid,
+        col_doctor, col_spec, col_unit,
+        col_status, col_appt_date
+    ]
+
+    if any(c is None for c in required):
+        print("[ERROR] Missing required columns")
+        sys.exit(0)
+
+    # Done, last 15 days, Consider Patient = Yes (shared plan). The plan
+    # resolves the same aliases as first_existing(), so the names match.
+    with METRICS.stage("filter") as st:
+        df_f = PLAN.select(df, "completed_15days", as_of=as_of)
+        st.rows = len(df_f)
+
+    done_date = (
+        to_date(df_f[col_completed_dt]).fillna(to_date(df_f[col_appt_date]))
+        if col_completed_dt in df_f.columns
+        else to_date(df_f[col_appt_date])
     )
 
-sent_keys = load_sent_keys(STATE_FILE)
-out_new = out[~out["__key"].isin(sent_keys)].drop_duplicates()
+    out = pd.DataFrame({
+        "Patient Name": df_f[col_patient],
+        "Contact Number": df_f[col_mobile],
+        "UHID": df_f[col_uhid],
+        "Date of Completed Appointment": done_date,
+        "Doctor Name": df_f[col_doctor],
+        "Speciality": df_f[col_spec],
+        "Unit": df_f[col_unit],
+    })
+
+    # Dedup logic: vectorised 64-bit keys (report_utils/row_keys.py)
+    if col_appt_id and col_appt_id in df_f.columns:
+        key_frame = df_f[[col_appt_id]].astype(str)
+        key_cols = None
+    else:
+        key_frame = out
+        key_cols = [
+            "Patient Name", "UHID",
+            "Doctor Name", "Unit",
+            "Date of Completed Appointment"
+        ]
+
+    with METRICS.stage("keys", rows=len(out)):
+        out["__key"] = row_keys(key_frame, key_cols)
+
+    # Locked until the mail is queued; nothing is recorded on failure
+    with SentKeyStore(STATE_DB, keep_days=15, legacy_csv=LEGACY_STATE_FILE) as store, \
+            store.transaction():
+
+        with METRICS.stage("dedup") as st:
+            if send:
+                evicted = store.evict(start_date)
+                print(f"[INFO] Sent-log: {evicted} expired key(s) evicted")
+                METRICS.count("keys_evicted", evicted)
+
+            # Also recognises MD5 keys written before the switch to 64-bit keys
+            sent = already_sent(store, key_frame, out["__key"], key_cols)
+            out_new = drop_duplicate_rows(out[~sent.to_numpy()])
+            st.rows = len(out_new)
+        METRICS.count("rows_produced", len(out_new))
+
+        if out_new.empty:
+            print(f"[INFO] No new completed consultations to send ({as_of})")
+            return
+
+        with METRICS.stage("write", rows=len(out_new)):
+            write_excel(
+                out_new.drop(columns="__key"),
+                output_file,
+                sheet_name="Completed_Last15Days"
+            )
+
+        print("[OK] Excel generated:", output_file)
+
+        if not send:
+            return
+        METRICS.count("rows_sent", len(out_new))
+
+        # Queued in the mail spool; the sender delivers it (with SMTP debug output)
+        with METRICS.stage("mail"):
+            subject = SUBJECT.format(start=start_date, end=end_date)
+            msg = build_message(
+                FROM_EMAIL, TO_EMAILS, CC_EMAILS,
+                dated_subject(subject, as_of, today) + f" | New rows: {len(out_new)}",
+                BODY.format(start=start_date, end=end_date),
+                attachments=[output_file]
+            )
+            spool_message(
+                msg, TO_EMAILS + CC_EMAILS, SMTP_SERVER, SMTP_PORT,
+                FROM_EMAIL, debug=True, run_date=as_of
+            )
+
+        print("[OK] Email queued for delivery")
+
+        # Row date = appointment date, which is what the window filters on
+        store.add(out_new["__key"], df_f.loc[out_new.index, col_appt_date])
+
+    print("[OK] Sent-log updated:", STATE_DB)
 
-if out_new.empty:
-    print("[INFO] No new completed consultations to send")
-    sys.exit(0)
 
-out_new.drop(columns="__key").to_excel(
-    OUTPUT_FILE,
-    index=False,
-    sheet_name="Completed_Last15Days"
-)
-
-print("[OK] Excel generated:", OUTPUT_FILE)
-
-send_mail_with_attachment(
-    SMTP_SERVER, SMTP_PORT,
-    FROM_EMAIL, SMTP_PASSWORD,
-    TO_EMAILS, CC_EMAILS,
-    SUBJECT + f" | New rows: {len(out_new)}",
-    BODY,
-    OUTPUT_FILE
-)
+# ===================== LOAD MIS =====================
+if __name__ == "__main__":
+    # Today, or the run dates of a backfill (see report_utils/backfill.py)
+    RUN = parse_run_dates()
+    if RUN.backfill:
+        print(f"[INFO] Backfill: {RUN}")
 
-print("[OK] Email sent")
+    # One load for every run date; the row pre-filter (union of the
+    # windows) only cuts the rows that get loaded
+    MIS_FILTERS = PLAN.prefilter(RUN.first, RUN.last)
 
-save_append_keys(STATE_FILE, out_new["__key"].tolist())
-print("[OK] Sent-log updated:", STATE_FILE)
+    try:
+        with METRICS.stage("load") as st:
+            df = load_mis(
+                INPUT_FILE, sheet_name=MIS_SHEETS,
+                columns=MIS_COLUMNS, filters=MIS_FILTERS
+            )
+            st.rows = len(df)
+    except Exception as e:
+        print("[ERROR] Could not read MIS file:", e)
+        sys.exit(0)
+
+    # Days in order: each mailed day records its rows before the next
+    for as_of in RUN.dates:
+        run_report(df, as_of, send=RUN.mail)
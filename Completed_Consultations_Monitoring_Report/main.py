@@ -9,22 +9,28 @@ This script:
 - Filters last 15 days window
 - Keeps Consider Patient = Yes (if exists)
 - Avoids re-sending already emailed records
-- Maintains persistent sent-log state
+- Maintains persistent sent-log state (SQLite, old keys evicted)
 - Sends only NEW rows via email
 
 Author: SKANDA N RAJ
 """
 
 import os
-import hashlib
-import pandas as pd
 from datetime import datetime, timedelta
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
 from dotenv import load_dotenv
+import sys
+
+# Shared MIS loader lives in report_utils/ at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_utils.backfill import dated_path, dated_subject, parse_run_dates
+from report_utils.mail_spool import spool_message
+from report_utils.mailer import build_message
+from report_utils.metrics import report_metrics
+from report_utils.mis_snapshot import load_mis
+from report_utils.report_spec import compile_plan, load_spec, mail_text
+from report_utils.report_writer import write_excel
+from report_utils.row_keys import already_sent, drop_duplicate_rows, row_keys
+from report_utils.sent_keys import SentKeyStore
 
 
 # ================= ENVIRONMENT =================
@@ -32,8 +38,19 @@ load_dotenv()
 
 # ================= CONFIG =================
 
+# Status filter, date window, columns and recipients of this report are
+# declared in report_spec.toml next to this script
+SPEC = load_spec(os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_spec.toml"))
+PLAN = compile_plan([SPEC])
+
+# Per-stage timings and row counts (metrics/ at the repository root)
+METRICS = report_metrics(__file__)
+
 INPUT_FILE = r"input folder path\Dummy Dataset.xlsx"
 
+# MIS columns this report reads (only these are loaded)
+MIS_COLUMNS = PLAN.columns()
+
 OUTPUT_DIR = r"output folder path"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -45,197 +62,168 @@ OUTPUT_FILE = os.path.join(
 STATE_DIR = os.path.join(OUTPUT_DIR, "state")
 os.makedirs(STATE_DIR, exist_ok=True)
 
-STATE_FILE = os.path.join(STATE_DIR, "sent_completed_keys.csv")
+# Keys of rows already emailed (indexed, evicted once out of the window).
+# The old CSV sent-log is imported into it on the first run.
+STATE_DB = os.path.join(STATE_DIR, "sent_completed_keys.sqlite")
+LEGACY_STATE_FILE = os.path.join(STATE_DIR, "sent_completed_keys.csv")
 
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 
 FROM_EMAIL = os.getenv("EMAIL_USER")
-SMTP_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
-TO_EMAILS = [
-    "recipient@domain.com"
-]
-
-CC_EMAILS = ["recipient@domain.com"]
+TO_EMAILS = SPEC["mail"]["to"]
+CC_EMAILS = SPEC["mail"]["cc"]
 
+# Run date; a backfill passes its own (--as-of / --from / --to)
 today = datetime.today().date()
-end_date = today - timedelta(days=1)
-start_date = end_date - timedelta(days=14)
-
-SUBJECT = (
-    f"Completed Consultations (Last 15 Days) — "
-    f"{start_date:%d/%m/%Y} to {end_date:%d/%m/%Y}"
-)
-
-BODY = f"""Hi Team,
 
-Please find attached the completed consultations (Status = Done)
-for the last 15 days ({start_date:%d/%m/%Y} to {end_date:%d/%m/%Y}).
 
-Best regards,
-Analytics Team
-"""
-
-
-# ================= MAIL HELPER =================
-def send_mail_with_attachment(
-    smtp_server, smtp_port, from_email, password,
-    to_emails, cc_emails, subject, body, attachment_path
-):
-    msg = MIMEMultipart()
-    msg["From"] = from_email
-    msg["To"] = ", ".join(to_emails)
-    msg["Cc"] = ", ".join(cc_emails) if cc_emails else ""
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "plain"))
-
-    if attachment_path and os.path.exists(attachment_path):
-        with open(attachment_path, "rb") as f:
-            part = MIMEBase("application", "octet-stream")
-            part.set_payload(f.read())
-        encoders.encode_base64(part)
-        part.add_header(
-            "Content-Disposition",
-            f'attachment; filename="{os.path.basename(attachment_path)}"'
-        )
-        msg.attach(part)
-
-    recipients = to_emails + (cc_emails or [])
-
-    server = smtplib.SMTP(smtp_server, smtp_port)
-    try:
-        server.starttls()
-        server.login(from_email, password)
-        server.sendmail(from_email, recipients, msg.as_string())
-    finally:
-        server.quit()
-
-
-# ================= HELPERS =================
-def mk_row_hash(*values) -> str:
-    normed = []
-    for v in values:
-        s = "" if v is None else str(v)
-        s = " ".join(s.strip().lower().split())
-        normed.append(s)
-    joined = "|".join(normed)
-    return hashlib.md5(joined.encode("utf-8")).hexdigest()
-
-
-def load_sent_keys(path: str) -> set:
-    if not os.path.exists(path):
-        return set()
-    try:
-        dfk = pd.read_csv(path, dtype=str)
-        return set(dfk["key"].dropna()) if "key" in dfk.columns else set()
-    except Exception:
-        return set()
+def window(as_of):
+    """
+    (start, end) of the 15 days before run date ``as_of``.
+    """
+    end_date = as_of - timedelta(days=1)
+    return end_date - timedelta(days=14), end_date
 
 
-def save_append_keys(path: str, keys: list):
-    df = pd.DataFrame({"key": keys})
-    df.to_csv(path, mode="a", index=False, header=not os.path.exists(path))
+# Subject and body: [mail] in report_spec.toml (mail_text)
 
 
-# ================= READ MIS =================
-try:
-    df = pd.read_excel(INPUT_FILE, engine="openpyxl")
-except Exception as e:
-    raise SystemExit(f"❌ Could not read MIS workbook: {e}")
-
-df.columns = df.columns.map(lambda x: str(x).strip())
-
-required_cols = [
+# Columns that identify a row across runs (see report_utils/row_keys.py)
+KEY_COLUMNS = [
     "Patient Name",
-    "Mobile",
     "UHID",
     "Doctor Name",
-    "Speciality",
     "Hospital Name",
-    "Appt. Status",
     "Appointment Date",
 ]
 
-missing = [c for c in required_cols if c not in df.columns]
-if missing:
-    raise SystemExit(f"❌ Missing required columns: {missing}")
 
-# ================= FILTER =================
-df["Appointment Date"] = pd.to_datetime(
-    df["Appointment Date"],
-    errors="coerce"
-)
 
-df["__date_only"] = df["Appointment Date"].dt.date
 
-mask = (
-    (df["Appt. Status"].str.lower().str.strip() == "done") &
-    (df["__date_only"] >= start_date) &
-    (df["__date_only"] <= end_date)
-)
-
-df_f = df.loc[mask].copy()
-
-if "Consider Patient" in df_f.columns:
-    df_f = df_f[
-        df_f["Consider Patient"].astype(str)
-        .str.lower().str.strip() == "yes"
+# ================= REPORT STAGE =================
+def run_report(df, as_of=None, send=True):
+    """
+    Sends the completed consultations from the last 15 days that were not
+    emailed before. The MIS frame is shared and is not modified.
+
+    ``as_of`` is the run date (default today). With ``send=False`` the
+    workbook is written but the sent-log is left untouched, so the rows
+    count as unsent for later runs.
+    """
+    as_of = as_of or today
+    start_date, end_date = window(as_of)
+    output_file = dated_path(OUTPUT_FILE, as_of, today)
+    required_cols = [
+        "Patient Name",
+        "Mobile",
+        "UHID",
+        "Doctor Name",
+        "Speciality",
+        "Hospital Name",
+        "Appt. Status",
+        "Appointment Date",
     ]
 
-out = df_f[[
-    "Patient Name",
-    "Mobile",
-    "UHID",
-    "Appointment Date",
-    "Doctor Name",
-    "Speciality",
-    "Hospital Name"
-]].copy()
-
-# ================= DEDUP =================
-row_keys = out.apply(
-    lambda r: mk_row_hash(
-        r["Patient Name"],
-        r["UHID"],
-        r["Doctor Name"],
-        r["Hospital Name"],
-        r["Appointment Date"]
-    ),
-    axis=1
-)
-
-out["__key"] = row_keys
+    missing = [c for c in required_cols if c not in df.columns]
+    if missing:
+        raise SystemExit(f"❌ Missing required columns: {missing}")
+
+    # ================= FILTER =================
+    # Done, last 15 days, Consider Patient = Yes (shared plan)
+    with METRICS.stage("filter") as st:
+        df_f = PLAN.select(df, "completed_15days", as_of=as_of)
+        st.rows = len(df_f)
+
+    out = df_f[[
+        "Patient Name",
+        "Mobile",
+        "UHID",
+        "Appointment Date",
+        "Doctor Name",
+        "Speciality",
+        "Hospital Name"
+    ]].copy()
+
+    # ================= DEDUP =================
+    # One vectorised pass over the key columns (64-bit keys)
+    with METRICS.stage("keys", rows=len(out)):
+        out["__key"] = row_keys(out, KEY_COLUMNS)
+
+    # The store stays locked until the mail is queued, so a concurrent run
+    # cannot pick the same rows; if anything below fails, nothing is
+    # recorded and the rows are sent next time
+    with SentKeyStore(STATE_DB, keep_days=15, legacy_csv=LEGACY_STATE_FILE) as store, \
+            store.transaction():
+
+        with METRICS.stage("dedup") as st:
+            # Rows before the window can never be selected again
+            if send:
+                METRICS.count("keys_evicted", store.evict(start_date))
+
+            # Also recognises MD5 keys written before the switch to 64-bit keys
+            sent = already_sent(store, out, out["__key"], KEY_COLUMNS)
+            out_new = drop_duplicate_rows(out[~sent.to_numpy()])
+            st.rows = len(out_new)
+        METRICS.count("rows_produced", len(out_new))
+
+        if out_new.empty:
+            print(f"✅ No new completed consultations to send ({as_of}).")
+            return
+
+        with METRICS.stage("write", rows=len(out_new)):
+            write_excel(out_new.drop(columns="__key"), output_file)
+
+        print(f"✅ New rows to send: {len(out_new)} ({output_file})")
+
+        if not send:
+            return
+        METRICS.count("rows_sent", len(out_new))
+
+        # Queued in the mail spool; the scheduler's sender delivers it
+        subject, body = mail_text(SPEC, as_of)
+        with METRICS.stage("mail"):
+            msg = build_message(
+                FROM_EMAIL,
+                TO_EMAILS,
+                CC_EMAILS,
+                dated_subject(subject, as_of, today) + f" | New rows: {len(out_new)}",
+                body,
+                attachments=[output_file]
+            )
+            spool_message(
+                msg,
+                TO_EMAILS + CC_EMAILS,
+                SMTP_SERVER,
+                SMTP_PORT,
+                FROM_EMAIL,
+                run_date=as_of
+            )
+
+        store.add(out_new["__key"], out_new["Appointment Date"])
+
+    print("📧 Email queued and state updated successfully.")
 
-sent_keys = load_sent_keys(STATE_FILE)
-out_new = out[~out["__key"].isin(sent_keys)].drop_duplicates()
 
-if out_new.empty:
-    print("✅ No new completed consultations to send.")
-    raise SystemExit(0)
-
-out_new.drop(columns="__key").to_excel(
-    OUTPUT_FILE,
-    index=False
-)
-
-print(f"✅ New rows to send: {len(out_new)}")
-
-send_mail_with_attachment(
-    SMTP_SERVER,
-    SMTP_PORT,
-    FROM_EMAIL,
-    SMTP_PASSWORD,
-    TO_EMAILS,
-    CC_EMAILS,
-    SUBJECT + f" | New rows: {len(out_new)}",
-    BODY,
-    OUTPUT_FILE
-)
-
-save_append_keys(
-    STATE_FILE,
-    out_new["__key"].astype(str).tolist()
-)
+# ================= READ MIS =================
+if __name__ == "__main__":
+    # Today, or the run dates of a backfill (see report_utils/backfill.py)
+    RUN = parse_run_dates()
 
-print("📧 Email sent and state updated successfully.")
+    # One load covers every run date. The row pre-filter (union of the
+    # windows) only cuts the rows that get loaded; the report still
+    # applies its own rules.
+    try:
+        with METRICS.stage("load") as st:
+            df = load_mis(
+                INPUT_FILE, columns=MIS_COLUMNS,
+                filters=PLAN.prefilter(RUN.first, RUN.last)
+            )
+            st.rows = len(df)
+    except Exception as e:
+        raise SystemExit(f"❌ Could not read MIS workbook: {e}")
+
+    # Days in order: each mailed day records its rows before the next
+    for as_of in RUN.dates:
+        run_report(df, as_of, send=RUN.mail)
@@ -12,19 +12,31 @@ Features:
 """
 
 import os
-import pandas as pd
 from datetime import datetime, timedelta
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
 import sys
 
+# Shared MIS loader lives in report_utils/ at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_utils.backfill import dated_path, dated_subject, parse_run_dates
+from report_utils.mail_spool import spool_message
+from report_utils.mailer import build_message
+from report_utils.metrics import report_metrics
+from report_utils.mis_snapshot import load_mis
+from report_utils.output_cache import keep_outputs, output_key, reuse_outputs
+from report_utils.report_spec import compile_plan, load_spec
+from report_utils.report_writer import write_excel
+
 # Ensure UTF-8 safe printing
 sys.stdout.reconfigure(encoding="utf-8")
 
 # --- CONFIG ---
+# Filters, date window, columns, hospitals and recipients of this report
+# are declared in report_spec.toml next to this script
+SPEC = load_spec(os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_spec.toml"))
+PLAN = compile_plan([SPEC])
+
+# Per-stage timings and row counts (metrics/ at the repository root)
+METRICS = report_metrics(__file__)
 
 # Use relative paths for GitHub portability
 input_file = r"input folder path\Dummy Dataset.xlsx"
@@ -33,93 +45,122 @@ output_file_cancelled = r"output folder path\Dropout_Consultations_Karnataka.xls
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 
-# Load credentials from environment variables
+# Sender address; the mail sender reads EMAIL_PASSWORD itself
 FROM_EMAIL = os.getenv("EMAIL_USER")
-SMTP_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
 # Email recipients (placeholders)
-TO_EMAILS = [
-    "recipient@domain.com"
-]
+TO_EMAILS = SPEC["mail"]["to"]
+CC_EMAILS = SPEC["mail"]["cc"]
 
-CC_EMAILS = [
-    "recipient@domain.com"
-]
+# Run date; a backfill passes its own (--as-of / --from / --to)
+today = datetime.today().date()
 
-yesterday = datetime.today().date() - timedelta(days=1)
-SUBJECT = f"Yesterday Dropout Consultations Report - {yesterday.strftime('%d/%m/%Y')}"
-BODY = f"""Hi Team,
+# {day} = the day before the run date
+SUBJECT = "Yesterday Dropout Consultations Report - {day:%d/%m/%Y}"
+BODY = """Hi Team,
 
-Attached is the dropout consultations report for {yesterday.strftime('%d/%m/%Y')}.
+Attached is the dropout consultations report for {day:%d/%m/%Y}.
 
 Regards,
 BA Team
 """
 
-# --- PROCESS DATA ---
-df = pd.read_excel(input_file, engine="openpyxl")
-df.columns = df.columns.str.strip()
-
-date_cols = [c for c in df.columns if "date" in c.lower()]
-if not date_cols:
-    print("[ERROR] Appointment date column not found")
-    sys.exit(1)
-
-DATE_COL = date_cols[0]
-df[DATE_COL] = pd.to_datetime(df[DATE_COL], errors="coerce")
-
-allowed_hospitals = [
-    "Aster CMI Hospital",
-    "Aster RV Hospital",
-    "Aster Whitefield Hospital",
-]
-
-df_c = df[
-    (df["Appt. Status"].astype(str).str.lower().str.strip() == "cancelled") &
-    (df[DATE_COL].dt.date == yesterday) &
-    (df["Hospital Name"].astype(str).isin(allowed_hospitals))
-].copy()
-
-if "Consider Patient" in df_c.columns:
-    df_c = df_c[df_c["Consider Patient"].astype(str).str.lower() == "yes"]
-
-cols = ["Patient Name", "Hospital Name", "Mobile", "Doctor Name", "Speciality", DATE_COL]
-df_c = df_c[[c for c in cols if c in df_c.columns]].drop_duplicates()
-
-os.makedirs(os.path.dirname(output_file_cancelled), exist_ok=True)
-df_c.to_excel(output_file_cancelled, index=False)
-
-print("[OK] Excel report generated")
-
-# --- SEND EMAIL ---
-try:
-    msg = MIMEMultipart()
-    msg["From"] = FROM_EMAIL
-    msg["To"] = ", ".join(TO_EMAILS)
-    msg["Cc"] = ", ".join(CC_EMAILS)
-    msg["Subject"] = SUBJECT
-    msg.attach(MIMEText(BODY, "plain"))
-
-    with open(output_file_cancelled, "rb") as f:
-        part = MIMEBase("application", "octet-stream")
-        part.set_payload(f.read())
-    encoders.encode_base64(part)
-    part.add_header(
-        "Content-Disposition",
-        f"attachment; filename={os.path.basename(output_file_cancelled)}"
-    )
-    msg.attach(part)
-
-    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-    server.set_debuglevel(1)
-    server.starttls()
-    server.login(FROM_EMAIL, SMTP_PASSWORD)
-    server.sendmail(FROM_EMAIL, TO_EMAILS + CC_EMAILS, msg.as_string())
-    server.quit()
-
-    print("[OK] Email sent successfully")
-
-except Exception as e:
-    print("[ERROR] Email sending failed")
-    print(str(e))
-    sys.exit(1)
+# Hospital filter: see report_spec.toml
+
+# MIS columns this report reads (only these are loaded)
+MIS_COLUMNS = PLAN.columns()
+
+# --- REPORT STAGE ---
+def run_report(df, as_of=None, send=True):
+    """
+    Builds yesterday's dropout report from a loaded MIS frame and emails it.
+    The frame may be shared with other reports, so it is not modified.
+
+    ``as_of`` is the run date (default today); ``send=False`` only writes
+    the workbook.
+    """
+    as_of = as_of or today
+
+    # --- PROCESS DATA ---
+    with METRICS.stage("filter") as st:
+        df_c = PLAN.select(df, "dropout_consultations", as_of=as_of)
+        st.rows = len(df_c)
+
+    with METRICS.stage("write", rows=len(df_c)):
+        write_excel(df_c, dated_path(output_file_cancelled, as_of, today))
+
+    print(f"[OK] Excel report generated ({as_of})")
+
+    METRICS.count("rows_produced", len(df_c))
+
+    # --- SEND EMAIL ---
+    if send:
+        send_report(as_of)
+        METRICS.count("rows_sent", len(df_c))
+
+
+def send_report(as_of=None):
+    """
+    Queues the report workbook of run date ``as_of``; exits with code 1
+    when that fails.
+    """
+    as_of = as_of or today
+    day = as_of - timedelta(days=1)
+    try:
+        with METRICS.stage("mail"):
+            msg = build_message(
+                FROM_EMAIL, TO_EMAILS, CC_EMAILS,
+                dated_subject(SUBJECT.format(day=day), as_of, today), BODY.format(day=day),
+                attachments=[dated_path(output_file_cancelled, as_of, today)]
+            )
+
+            # Queued in the mail spool; the sender delivers it (with SMTP debug output)
+            spool_message(
+                msg, TO_EMAILS + CC_EMAILS, SMTP_SERVER, SMTP_PORT,
+                FROM_EMAIL, debug=True, run_date=as_of
+            )
+
+        print("[OK] Email queued for delivery")
+
+    except Exception as e:
+        print("[ERROR] Email could not be queued")
+        print(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Same MIS, spec, day and code as an earlier build: reuse its workbook
+    # (--force or REPORT_CACHE_FORCE=1 rebuilds)
+    info = lambda message: print(f"[INFO] {message}")
+
+    # Today, or the run dates of a backfill (see report_utils/backfill.py)
+    RUN = parse_run_dates()
+    if RUN.backfill:
+        info(f"Backfill: {RUN}")
+
+    pending = []
+    for as_of in RUN.dates:
+        with METRICS.stage("cache"):
+            CACHE_KEY = output_key(input_file, SPEC, as_of, [__file__])
+            reused = reuse_outputs(
+                CACHE_KEY, [dated_path(output_file_cancelled, as_of, today)], log=info
+            )
+
+        if not reused:
+            pending.append((as_of, CACHE_KEY))
+        elif RUN.mail:
+            send_report(as_of)
+
+    if pending:
+        # One load for every pending day; the row pre-filter (union of the
+        # days' windows) only cuts the rows that get loaded
+        with METRICS.stage("load") as st:
+            df = load_mis(
+                input_file, columns=MIS_COLUMNS,
+                filters=PLAN.prefilter(pending[0][0], pending[-1][0])
+            )
+            st.rows = len(df)
+
+        for as_of, CACHE_KEY in pending:
+            run_report(df, as_of, send=RUN.mail)
+            keep_outputs(CACHE_KEY, [dated_path(output_file_cancelled, as_of, today)], log=info)
@@ -17,19 +17,33 @@ Author: SKANDA N RAJ
 """
 
 import os
-import pandas as pd
-from datetime import datetime, timedelta
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
+from datetime import datetime
 from dotenv import load_dotenv
+import sys
+
+# Shared MIS loader lives in report_utils/ at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_utils.backfill import dated_path, dated_subject, parse_run_dates
+from report_utils.mail_spool import spool_message
+from report_utils.mailer import build_message
+from report_utils.metrics import report_metrics
+from report_utils.mis_snapshot import load_mis
+from report_utils.output_cache import keep_outputs, output_key, reuse_outputs
+from report_utils.report_spec import compile_plan, load_spec, mail_text
+from report_utils.report_writer import write_excel
 
 # Load environment variables
 load_dotenv()
 
 # --- CONFIG ---
+# Filters, date window, columns, hospitals and recipients of this report
+# are declared in report_spec.toml next to this script
+SPEC = load_spec(os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_spec.toml"))
+PLAN = compile_plan([SPEC])
+
+# Per-stage timings and row counts (metrics/ at the repository root)
+METRICS = report_metrics(__file__)
+
 input_file = r"input folder path\Dummy Dataset.xlsx"
 output_file_cancelled = r"output folder path\Dropout_Consultations_Karnataka.xlsx"
 
@@ -38,93 +52,106 @@ SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 
 FROM_EMAIL = os.getenv("EMAIL_USER")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
-
-TO_EMAILS = [
-    "recipient@domain.com"
-]
-
-CC_EMAILS = ["recipient@domain.com"]
-
-yesterday = datetime.today().date() - timedelta(days=1)
-
-SUBJECT = f"Yesterday's Dropout Consultations Report - {yesterday.strftime('%d/%m/%Y')}"
-
-BODY = f"""Hi Team,
-
-This report contains patients who reached the payment page but did not complete the payment yesterday ({yesterday.strftime('%d/%m/%Y')}).
-
-Best regards,
-Analytics Team
-"""
 
-# --- STEP 1: Process MIS Report ---
-df = pd.read_excel(input_file, engine="openpyxl")
-df.columns = df.columns.str.strip()
-
-# Detect appointment date column
-possible_date_cols = [col for col in df.columns if "date" in col.lower()]
-if not possible_date_cols:
-    print("❌ Appointment date column not found")
-    print(df.columns.tolist())
-    raise SystemExit
-
-DATE_COL = possible_date_cols[0]
-df[DATE_COL] = pd.to_datetime(df[DATE_COL], errors="coerce")
-
-allowed_hospitals = [
-   "Aster CMI Hospital",
-    "Aster RV Hospital",
-    "Aster Whitefield Hospital",
-]
-
-df_c = df[
-    (df["Appt. Status"].astype(str).str.strip().str.lower() == "cancelled") &
-    (df[DATE_COL].dt.date == yesterday) &
-    (df["Hospital Name"].astype(str).str.strip().isin(allowed_hospitals))
-].copy()
-
-# Optional: filter "Consider Patient" = Yes if column exists
-if "Consider Patient" in df_c.columns:
-    df_c = df_c[df_c["Consider Patient"].astype(str).str.lower().str.strip() == "yes"]
-
-# Select required columns that exist
-cols_c = ["Patient Name", "Hospital Name", "Mobile", "Doctor Name", "Speciality", DATE_COL]
-cols_c_available = [col for col in cols_c if col in df_c.columns]
-df_c = df_c[cols_c_available].drop_duplicates()
-
-# Save to Excel (make folder if needed)
-os.makedirs(os.path.dirname(output_file_cancelled), exist_ok=True)
-df_c.to_excel(output_file_cancelled, index=False)
-print(f"✅ Cancelled appointments report generated: {output_file_cancelled}")
-
-# --- STEP 2: Send Email ---
-msg = MIMEMultipart()
-msg["From"] = FROM_EMAIL
-msg["To"] = ", ".join(TO_EMAILS)
-msg["Cc"] = ", ".join(CC_EMAILS)
-msg["Subject"] = SUBJECT
-msg.attach(MIMEText(BODY, "plain"))
-
-# Attach Excel file
-with open(output_file_cancelled, "rb") as f:
-    part = MIMEBase("application", "octet-stream")
-    part.set_payload(f.read())
-
-encoders.encode_base64(part)
-part.add_header(
-    "Content-Disposition",
-    f"attachment; filename={os.path.basename(output_file_cancelled)}"
-)
-msg.attach(part)
-
-# Connect to SMTP and send
-try:
-    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-    server.starttls()
-    server.login(FROM_EMAIL, EMAIL_PASSWORD)
-    server.sendmail(FROM_EMAIL, TO_EMAILS + CC_EMAILS, msg.as_string())
-    server.quit()
-    print("📧 Email sent successfully with the attachment!")
-except Exception as e:
-    print("❌ Error sending email:", e)
+TO_EMAILS = SPEC["mail"]["to"]
+CC_EMAILS = SPEC["mail"]["cc"]
+
+# Run date; a backfill passes its own (python main.py --as-of / --from / --to)
+today = datetime.today().date()
+
+# Subject and body: [mail] in report_spec.toml (mail_text)
+
+# Hospital filter: see report_spec.toml
+
+# MIS columns this report reads (only these are loaded)
+MIS_COLUMNS = PLAN.columns()
+
+# --- REPORT STAGE ---
+def run_report(df, as_of=None, send=True):
+    """
+    Builds yesterday's dropout report from a loaded MIS frame and emails it.
+    The frame may be shared with other reports, so it is not modified.
+
+    ``as_of`` is the run date (default today); ``send=False`` only writes
+    the workbook.
+    """
+    as_of = as_of or today
+    output_file = dated_path(output_file_cancelled, as_of, today)
+
+    # --- STEP 1: Process MIS Report ---
+
+    # Yesterday's cancelled rows at the selected hospitals, evaluated through
+    # the shared plan (masks are reused by other reports on the same frame)
+    with METRICS.stage("filter") as st:
+        df_c = PLAN.select(df, "dropout_consultations", as_of=as_of)
+        st.rows = len(df_c)
+
+    # Save to Excel (folder is created if needed)
+    with METRICS.stage("write", rows=len(df_c)):
+        write_excel(df_c, output_file)
+    print(f"✅ Cancelled appointments report generated: {output_file}")
+
+    METRICS.count("rows_produced", len(df_c))
+
+    # --- STEP 2: Send Email ---
+    if send:
+        send_report(as_of)
+        METRICS.count("rows_sent", len(df_c))
+
+
+def send_report(as_of=None):
+    """
+    Queues the report workbook of run date ``as_of`` for delivery.
+    """
+    as_of = as_of or today
+    subject, body = mail_text(SPEC, as_of)
+    with METRICS.stage("mail") as st:
+        msg = build_message(
+            FROM_EMAIL, TO_EMAILS, CC_EMAILS,
+            dated_subject(subject, as_of, today), body,
+            attachments=[dated_path(output_file_cancelled, as_of, today)]
+        )
+
+        # Queued in the mail spool; the scheduler's sender delivers it
+        try:
+            spool_message(
+                msg, TO_EMAILS + CC_EMAILS, SMTP_SERVER, SMTP_PORT,
+                FROM_EMAIL, run_date=as_of
+            )
+            print("📧 Email queued for delivery with the attachment!")
+        except Exception as e:
+            print("❌ Error queueing email:", e)
+            st.failed = True
+
+
+if __name__ == "__main__":
+    # Today, or the run dates of a backfill (see report_utils/backfill.py)
+    RUN = parse_run_dates()
+
+    # A rerun on the same MIS, spec, day and code reuses the earlier
+    # workbook without parsing the MIS (python main.py --force rebuilds)
+    pending = []
+    for as_of in RUN.dates:
+        with METRICS.stage("cache"):
+            CACHE_KEY = output_key(input_file, SPEC, as_of, [__file__])
+            reused = reuse_outputs(CACHE_KEY, [dated_path(output_file_cancelled, as_of, today)])
+
+        if not reused:
+            pending.append((as_of, CACHE_KEY))
+        elif RUN.mail:
+            send_report(as_of)
+
+    if pending:
+        # One load covers every pending day. The row pre-filter (union of
+        # the days' windows) only cuts the rows that get loaded; the report
+        # still applies its own rules.
+        with METRICS.stage("load") as st:
+            df = load_mis(
+                input_file, columns=MIS_COLUMNS,
+                filters=PLAN.prefilter(pending[0][0], pending[-1][0])
+            )
+            st.rows = len(df)
+
+        for as_of, CACHE_KEY in pending:
+            run_report(df, as_of, send=RUN.mail)
+            keep_outputs(CACHE_KEY, [dated_path(output_file_cancelled, as_of, today)])
@@ -12,18 +12,32 @@ Features:
 import os
 import pandas as pd
 from datetime import datetime, timedelta
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
 import sys
 
+# Shared MIS loader lives in report_utils/ at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_utils.backfill import dated_path, dated_subject, parse_run_dates
+from report_utils.mail_spool import spool_message
+from report_utils.mailer import build_message
+from report_utils.metrics import report_metrics
+from report_utils.mis_snapshot import load_mis
+from report_utils.output_cache import keep_outputs, output_key, reuse_outputs
+from report_utils.report_spec import compile_plan, load_spec, resolve_column
+from report_utils.report_writer import write_excel
+
 # Ensure UTF-8 safe printing
 sys.stdout.reconfigure(encoding="utf-8")
 
 # --- CONFIG ---
 
+# Filters, date window, columns and recipients of this report are
+# declared in report_spec.toml next to this script
+SPEC = load_spec(os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_spec.toml"))
+PLAN = compile_plan([SPEC])
+
+# Per-stage timings and row counts (metrics/ at the repository root)
+METRICS = report_metrics(__file__)
+
 # Jenkins / GitHub compatible paths
 input_file = r"input folder path\Dummy Dataset.xlsx"
 output_file = r"output folder path\prescription_no_yesterday.xlsx"
@@ -31,134 +45,137 @@ output_file = r"output folder path\prescription_no_yesterday.xlsx"
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 
-# Load credentials from environment variables
+# Sender address; the mail sender reads EMAIL_PASSWORD itself
 FROM_EMAIL = os.getenv("EMAIL_USER")
-SMTP_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
 # Email recipients (placeholders)
-TO_EMAILS = [
-    "recipient@domain.com"
-]
-
-CC_EMAILS = [
-    "recipient@domain.com"
-]
+TO_EMAILS = SPEC["mail"]["to"]
+CC_EMAILS = SPEC["mail"]["cc"]
 
-yesterday = datetime.today().date() - timedelta(days=1)
+# Run date; a backfill passes its own (--as-of / --from / --to)
+today = datetime.today().date()
 
-SUBJECT = f"Missing Prescriptions - {yesterday.strftime('%d/%m/%Y')}"
+# {day} = the day before the run date
+SUBJECT = "Missing Prescriptions - {day:%d/%m/%Y}"
 
-BODY = f"""Hi Team,
+BODY = """Hi Team,
 
 This report contains patients who did not receive a prescription yesterday,
 despite having a valid instant paid appointment.
 
-Date: {yesterday.strftime('%d/%m/%Y')}
+Date: {day:%d/%m/%Y}
 
 Best regards,
 BA Team
 """
 
-# --- LOAD DATA ---
-df = pd.read_excel(input_file, engine="openpyxl")
-df.columns = df.columns.str.strip()
-
-print("[INFO] Columns found in MIS:", df.columns.tolist())
-
-# Normalize column names
-col_map = {c.lower(): c for c in df.columns}
-
-needed_keys = [
-    "is prescription generated",
-    "consider patient",
-    "appt. payment status",
-    "procedure type",
-    "appointment date",
-    "hospital name",
-    "mobile"
-]
-
-needed = {key: col_map.get(key) for key in needed_keys}
-print("[INFO] Column mapping:", needed)
-
-if needed["appointment date"] is None:
-    print("[ERROR] Appointment Date column not found")
-    sys.exit(1)
-
-df[needed["appointment date"]] = pd.to_datetime(
-    df[needed["appointment date"]], errors="coerce"
-).dt.date
-
-# --- FILTER DATA ---
-filtered = df[
-    (df[needed["is prescription generated"]].astype(str).str.lower().str.strip() == "no") &
-    (df[needed["consider patient"]].astype(str).str.lower().str.strip() == "yes") &
-    (df[needed["appt. payment status"]].astype(str).str.lower().str.strip().isin(["paid", "cash"])) &
-    (df[needed["procedure type"]].astype(str).str.lower().str.strip() == "instant") &
-    (df[needed["appointment date"]] == yesterday) &
-    (df[needed["hospital name"]].astype(str).str.lower().str.strip() == "aster digital health")
-].copy()
-
-filtered["Missing Prescriptions (Yesterday)"] = "Yes"
-filtered["Total"] = 1
-
-required_cols = [
-    needed["appointment date"],
-    "Appointment Time",
-    "UHID",
-    "Patient Name",
-    "Doctor Name",
-    needed["mobile"],
-    "Missing Prescriptions (Yesterday)",
-    "Total"
-]
-
-final = filtered[[c for c in required_cols if c in filtered.columns]]
-
-# Add total row
-if not final.empty:
-    total_row = {col: "" for col in final.columns}
-    total_row["Patient Name"] = "Total Patients"
-    total_row["Total"] = final["Total"].sum()
-    final = pd.concat([final, pd.DataFrame([total_row])], ignore_index=True)
-
-os.makedirs(os.path.dirname(output_file), exist_ok=True)
-final.to_excel(output_file, index=False)
-
-print("[OK] Excel report generated")
-
-# --- SEND EMAIL ---
-try:
-    msg = MIMEMultipart()
-    msg["From"] = FROM_EMAIL
-    msg["To"] = ", ".join(TO_EMAILS)
-    msg["Cc"] = ", ".join(CC_EMAILS)
-    msg["Subject"] = SUBJECT
-    msg.attach(MIMEText(BODY, "plain"))
-
-    with open(output_file, "rb") as f:
-        part = MIMEBase("application", "octet-stream")
-        part.set_payload(f.read())
-
-    encoders.encode_base64(part)
-    part.add_header(
-        "Content-Disposition",
-        f"attachment; filename={os.path.basename(output_file)}"
-    )
-
-    msg.attach(part)
-
-    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-    server.set_debuglevel(1)   # shows SMTP conversation in Jenkins logs
-    server.starttls()
-
-    server.login(FROM_EMAIL, SMTP_PASSWORD)
-    server.sendmail(FROM_EMAIL, TO_EMAILS + CC_EMAILS, msg.as_string())
-    server.quit()
-
-    print("[OK] Email sent successfully")
-
-except Exception as e:
-    print("[ERROR] Email sending failed")
-    print(str(e))
-    sys.exit(1)
+# MIS columns this report reads (only these are loaded)
+MIS_COLUMNS = PLAN.columns()
+
+# --- REPORT STAGE ---
+def run_report(df, as_of=None, send=True):
+    """
+    Builds yesterday's missing prescription report from a loaded MIS frame
+    and emails it. The frame may be shared with other reports, so it is
+    not modified.
+
+    ``as_of`` is the run date (default today); ``send=False`` only writes
+    the workbook.
+    """
+    as_of = as_of or today
+
+    # --- FILTER DATA ---
+    with METRICS.stage("filter") as st:
+        filtered = PLAN.select(df, "missing_prescriptions", as_of=as_of)
+        st.rows = len(filtered)
+    date_col = resolve_column(filtered, SPEC["date_column"])
+    filtered[date_col] = filtered[date_col].dt.date
+
+    filtered["Missing Prescriptions (Yesterday)"] = "Yes"
+    filtered["Total"] = 1
+
+    final = filtered
+
+    # Add total row
+    if not final.empty:
+        total_row = {col: "" for col in final.columns}
+        total_row["Patient Name"] = "Total Patients"
+        total_row["Total"] = final["Total"].sum()
+        final = pd.concat([final, pd.DataFrame([total_row])], ignore_index=True)
+
+    with METRICS.stage("write", rows=len(final)):
+        write_excel(final, dated_path(output_file, as_of, today))
+
+    print(f"[OK] Excel report generated ({as_of})")
+
+    METRICS.count("rows_produced", len(filtered))
+
+    # --- SEND EMAIL ---
+    if send:
+        send_report(as_of)
+        METRICS.count("rows_sent", len(filtered))
+
+
+def send_report(as_of=None):
+    """
+    Queues the report workbook of run date ``as_of``; exits with code 1
+    when that fails.
+    """
+    as_of = as_of or today
+    day = as_of - timedelta(days=1)
+    try:
+        with METRICS.stage("mail"):
+            msg = build_message(
+                FROM_EMAIL, TO_EMAILS, CC_EMAILS,
+                dated_subject(SUBJECT.format(day=day), as_of, today), BODY.format(day=day),
+                attachments=[dated_path(output_file, as_of, today)]
+            )
+
+            # Queued in the mail spool; the sender delivers it (with SMTP debug output)
+            spool_message(
+                msg, TO_EMAILS + CC_EMAILS, SMTP_SERVER, SMTP_PORT,
+                FROM_EMAIL, debug=True, run_date=as_of
+            )
+
+        print("[OK] Email queued for delivery")
+
+    except Exception as e:
+        print("[ERROR] Email could not be queued")
+        print(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Same MIS, spec, day and code as an earlier build: reuse its workbook
+    # (--force or REPORT_CACHE_FORCE=1 rebuilds)
+    info = lambda message: print(f"[INFO] {message}")
+
+    # Today, or the run dates of a backfill (see report_utils/backfill.py)
+    RUN = parse_run_dates()
+    if RUN.backfill:
+        info(f"Backfill: {RUN}")
+
+    pending = []
+    for as_of in RUN.dates:
+        with METRICS.stage("cache"):
+            CACHE_KEY = output_key(input_file, SPEC, as_of, [__file__])
+            reused = reuse_outputs(CACHE_KEY, [dated_path(output_file, as_of, today)], log=info)
+
+        if not reused:
+            pending.append((as_of, CACHE_KEY))
+        elif RUN.mail:
+            send_report(as_of)
+
+    if pending:
+        # One load for every pending day; the row pre-filter (union of the
+        # days' windows) only cuts the rows that get loaded
+        with METRICS.stage("load") as st:
+            df = load_mis(
+                input_file, columns=MIS_COLUMNS,
+                filters=PLAN.prefilter(pending[0][0], pending[-1][0])
+            )
+            st.rows = len(df)
+
+        for as_of, CACHE_KEY in pending:
+            run_report(df, as_of, send=RUN.mail)
+            keep_outputs(CACHE_KEY, [dated_path(output_file, as_of, today)], log=info)
@@ -17,14 +17,21 @@ Author: Your Name
 """
 
 import pandas as pd
-from datetime import datetime, timedelta
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
+from datetime import datetime
 import os
 from dotenv import load_dotenv
+import sys
+
+# Shared MIS loader lives in report_utils/ at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_utils.backfill import dated_path, dated_subject, parse_run_dates
+from report_utils.mail_spool import spool_message
+from report_utils.mailer import build_message
+from report_utils.metrics import report_metrics
+from report_utils.mis_snapshot import load_mis
+from report_utils.output_cache import keep_outputs, output_key, reuse_outputs
+from report_utils.report_spec import compile_plan, load_spec, mail_text, resolve_column
+from report_utils.report_writer import write_excel
 
 
 # ================= ENVIRONMENT =================
@@ -32,6 +39,14 @@ load_dotenv()
 
 # ================= CONFIG =================
 
+# Filters, date window, columns and recipients of this report are
+# declared in report_spec.toml next to this script
+SPEC = load_spec(os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_spec.toml"))
+PLAN = compile_plan([SPEC])
+
+# Per-stage timings and row counts (metrics/ at the repository root)
+METRICS = report_metrics(__file__)
+
 # Use project-relative paths (GitHub friendly)
 input_file = r"input folder path\Dummy Dataset.xlsx"
 output_file = r"output folder path\prescription_no_yesterday.xlsx"
@@ -40,136 +55,129 @@ SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 
 FROM_EMAIL = os.getenv("EMAIL_USER")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
-
-TO_EMAILS = [
-    "recipient@domain.com"
-]
 
-CC_EMAILS = ["recipient@domain.com"]
+TO_EMAILS = SPEC["mail"]["to"]
+CC_EMAILS = SPEC["mail"]["cc"]
 
 
 # ================= DATE LOGIC =================
-yesterday = (datetime.today() - timedelta(days=1)).date()
-SUBJECT = f"Missing Prescriptions - {yesterday:%d/%m/%Y}"
-
-BODY = """Hi Team,
-
-This report contains patients who did not receive a prescription yesterday, despite having a valid instant paid appointment.
-
-Best regards,
-Analytics Team
-"""
-
-
-# ================= STEP 1: LOAD & FILTER DATA =================
-df = pd.read_excel(input_file, engine="openpyxl")
-df.columns = df.columns.str.strip()
-
-print("Available columns:", df.columns.tolist())
-
-# Normalize column names for mapping
-col_map = {c.lower(): c for c in df.columns}
-
-needed_keys = [
-    "is prescription generated",
-    "consider patient",
-    "appt. payment status",
-    "procedure type",
-    "appointment date",
-    "hospital name",
-    "mobile"
-]
-
-needed = {key: col_map.get(key) for key in needed_keys}
-print("Mapped columns:", needed)
-
-# Ensure Appointment Date exists
-if needed["appointment date"] is None:
-    print("❌ Appointment Date column not found")
-    raise SystemExit
-
-df[needed["appointment date"]] = pd.to_datetime(
-    df[needed["appointment date"]],
-    errors="coerce"
-).dt.date
-
-
-# ================= APPLY FILTERS =================
-filtered = df[
-    (df[needed["is prescription generated"]].astype(str).str.strip().str.lower() == "no") &
-    (df[needed["consider patient"]].astype(str).str.strip().str.lower() == "yes") &
-    (df[needed["appt. payment status"]].astype(str).str.strip().str.lower().isin(["paid", "cash"])) &
-    (df[needed["procedure type"]].astype(str).str.strip().str.lower() == "instant") &
-    (df[needed["appointment date"]] == yesterday) &
-    (df[needed["hospital name"]].astype(str).str.strip().str.lower() == "aster digital health")
-].copy()
-
-
-# ================= ADD BUSINESS COLUMNS =================
-filtered["Missing Prescriptions (Yesterday)"] = "Yes"
-filtered["Total"] = 1
-
-
-# ================= SELECT REQUIRED COLUMNS =================
-required_cols = [
-    needed["appointment date"],
-    "Appointment Time",
-    "UHID",
-    "Patient Name",
-    "Doctor Name",
-    needed["mobile"],
-    "Missing Prescriptions (Yesterday)",
-    "Total"
-]
-
-available_cols = [col for col in required_cols if col in filtered.columns]
-final = filtered[available_cols]
-
-
-# ================= APPEND SUMMARY ROW =================
-if not final.empty:
-    total_row = {col: "" for col in final.columns}
-    total_row["Patient Name"] = "Total Patients"
-    total_row["Total"] = final["Total"].sum()
-    final = pd.concat([final, pd.DataFrame([total_row])], ignore_index=True)
-
+# Run date; a backfill passes its own (python main.py --as-of / --from / --to)
+today = datetime.today().date()
 
-# ================= EXPORT EXCEL =================
-os.makedirs(os.path.dirname(output_file), exist_ok=True)
-final.to_excel(output_file, index=False)
+# Subject and body: [mail] in report_spec.toml (mail_text)
 
-print(f"✅ Report generated: {output_file}")
 
+# MIS columns this report reads (only these are loaded)
+MIS_COLUMNS = PLAN.columns()
 
-# ================= SEND EMAIL =================
-msg = MIMEMultipart()
-msg["From"] = FROM_EMAIL
-msg["To"] = ", ".join(TO_EMAILS)
-msg["Cc"] = ", ".join(CC_EMAILS)
-msg["Subject"] = SUBJECT
 
-msg.attach(MIMEText(BODY, "plain"))
 
-with open(output_file, "rb") as f:
-    part = MIMEBase("application", "octet-stream")
-    part.set_payload(f.read())
+# ================= REPORT STAGE =================
+def run_report(df, as_of=None, send=True):
+    """
+    Builds yesterday's missing prescription report from a loaded MIS frame
+    and emails it. The frame may be shared with other reports, so it is
+    not modified.
 
-encoders.encode_base64(part)
-part.add_header(
-    "Content-Disposition",
-    f"attachment; filename={os.path.basename(output_file)}"
-)
-msg.attach(part)
-
-try:
-    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-    server.starttls()
-    server.login(FROM_EMAIL, EMAIL_PASSWORD)
-    server.sendmail(FROM_EMAIL, TO_EMAILS + CC_EMAILS, msg.as_string())
-    server.quit()
-
-    print("📧 Email sent successfully!")
-
-except Exception as e:
-    print("❌ Error sending email:", e)
+    ``as_of`` is the run date (default today); ``send=False`` only writes
+    the workbook.
+    """
+    as_of = as_of or today
+    output = dated_path(output_file, as_of, today)
+
+    # ================= APPLY FILTERS =================
+
+    # Yesterday's rows and the prescription/payment/hospital filters come
+    # from the shared plan; column names are matched case-insensitively
+    with METRICS.stage("filter") as st:
+        filtered = PLAN.select(df, "missing_prescriptions", as_of=as_of)
+        st.rows = len(filtered)
+    date_col = resolve_column(filtered, SPEC["date_column"])
+    filtered[date_col] = filtered[date_col].dt.date
+
+
+    # ================= ADD BUSINESS COLUMNS =================
+    filtered["Missing Prescriptions (Yesterday)"] = "Yes"
+    filtered["Total"] = 1
+    final = filtered
+
+
+    # ================= APPEND SUMMARY ROW =================
+    if not final.empty:
+        total_row = {col: "" for col in final.columns}
+        total_row["Patient Name"] = "Total Patients"
+        total_row["Total"] = final["Total"].sum()
+        final = pd.concat([final, pd.DataFrame([total_row])], ignore_index=True)
+
+
+    # ================= EXPORT EXCEL =================
+    with METRICS.stage("write", rows=len(final)):
+        write_excel(final, output)
+
+    print(f"✅ Report generated: {output}")
+
+
+    METRICS.count("rows_produced", len(filtered))
+
+    # ================= SEND EMAIL =================
+    if send:
+        send_report(as_of)
+        METRICS.count("rows_sent", len(filtered))
+
+
+def send_report(as_of=None):
+    """
+    Queues the report workbook of run date ``as_of`` for delivery.
+    """
+    as_of = as_of or today
+    subject, body = mail_text(SPEC, as_of)
+    with METRICS.stage("mail") as st:
+        msg = build_message(
+            FROM_EMAIL, TO_EMAILS, CC_EMAILS, dated_subject(subject, as_of, today), body,
+            attachments=[dated_path(output_file, as_of, today)]
+        )
+
+        # Queued in the mail spool; the scheduler's sender delivers it
+        try:
+            spool_message(
+                msg, TO_EMAILS + CC_EMAILS, SMTP_SERVER, SMTP_PORT,
+                FROM_EMAIL, run_date=as_of
+            )
+            print("📧 Email queued for delivery!")
+
+        except Exception as e:
+            print("❌ Error queueing email:", e)
+            st.failed = True
+
+
+if __name__ == "__main__":
+    # Today, or the run dates of a backfill (see report_utils/backfill.py)
+    RUN = parse_run_dates()
+
+    # A rerun on the same MIS, spec, day and code reuses the earlier
+    # workbook without parsing the MIS (python main.py --force rebuilds)
+    pending = []
+    for as_of in RUN.dates:
+        with METRICS.stage("cache"):
+            CACHE_KEY = output_key(input_file, SPEC, as_of, [__file__])
+            reused = reuse_outputs(CACHE_KEY, [dated_path(output_file, as_of, today)])
+
+        if not reused:
+            pending.append((as_of, CACHE_KEY))
+        elif RUN.mail:
+            send_report(as_of)
+
+    if pending:
+        # One load covers every pending day. The row pre-filter (union of
+        # the days' windows) only cuts the rows that get loaded; the report
+        # still applies its own rules.
+        with METRICS.stage("load") as st:
+            df = load_mis(
+                input_file, columns=MIS_COLUMNS,
+                filters=PLAN.prefilter(pending[0][0], pending[-1][0])
+            )
+            st.rows = len(df)
+
+        for as_of, CACHE_KEY in pending:
+            run_report(df, as_of, send=RUN.mail)
+            keep_outputs(CACHE_KEY, [dated_path(output_file, as_of, today)])
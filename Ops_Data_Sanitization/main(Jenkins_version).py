@@ -14,10 +14,18 @@ Features:
 
 #!/usr/bin/env python3
 
-import pandas as pd
 import os
 import sys
 
+# Shared MIS loader lives in report_utils/ at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_utils.metrics import report_metrics
+from report_utils.mis_shards import is_sharded
+from report_utils.mis_snapshot import column_key, load_mis
+from report_utils.output_cache import keep_outputs, output_key, reuse_outputs
+from report_utils.report_writer import can_write_chunks, write_chunks, write_excel
+from report_utils.xlsx_stream import stream_columns
+
 # Ensure Jenkins-safe console output
 sys.stdout.reconfigure(encoding="utf-8")
 sys.stderr.reconfigure(encoding="utf-8")
@@ -30,8 +38,12 @@ input_file = r"input folder path\Dummy Dataset.xlsx"
 # Get the folder where the input file is located
 input_folder = os.path.dirname(input_file)
 
-# Save output in the same folder
+# Save output in the same folder (a .parquet name writes Parquet)
 output_file = os.path.join(input_folder, "Ops_Data_Sanitization.xlsx")
+
+# True = copy the kept columns row by row into the output, memory flat
+# however large the MIS is. False = load them into pandas first.
+STREAM_COLUMNS = True
 # ================= COLUMNS TO KEEP =================
 columns_to_keep = [
     "UHID",
@@ -71,34 +83,100 @@ columns_to_keep = [
     "Event Left Time Doctor"
 ]
 
+# Only the kept columns are loaded from the MIS
+MIS_COLUMNS = columns_to_keep
+
+# Per-stage timings and row counts (metrics/ at the repository root)
+METRICS = report_metrics(__file__)
+
+
+# ================= SANITIZATION STAGE =================
+def report_missing(missing_cols):
+    if missing_cols:
+        print("[WARN] Missing columns (not present in MIS):")
+        for col in missing_cols:
+            print(" -", col)
+
+
+def run_report(df):
+    """
+    Writes the sanitized copy of a loaded MIS frame (required columns only).
+    The frame may be shared with other reports, so it is not modified.
+    """
+
+    # ================= FILTER COLUMNS =================
+    available_cols = [c for c in columns_to_keep if c in df.columns]
+    missing_cols = [c for c in columns_to_keep if c not in df.columns]
+
+    filtered_df = df[available_cols]
+
+    report_missing(missing_cols)
+
+    # ================= SAVE OUTPUT =================
+    METRICS.count("columns_missing", len(missing_cols))
+
+    try:
+        with METRICS.stage("write", rows=len(filtered_df)):
+            if output_file.lower().endswith(".parquet"):
+                write_chunks(output_file, [filtered_df])
+            else:
+                write_excel(filtered_df, output_file)
+        print("[OK] Cleaned file created:", output_file)
+    except Exception as e:
+        print("[ERROR] Failed to save output Excel")
+        print(str(e))
+        sys.exit(1)
+
+
+def run_streaming():
+    """
+    Copies the required columns from the MIS workbook to the output chunk
+    by chunk, without loading the MIS into pandas.
+    """
+    try:
+        with METRICS.stage("stream") as st:
+            with stream_columns(input_file, columns_to_keep) as (kept, chunks):
+                found = {column_key(c) for c in kept}
+                missing_cols = [c for c in columns_to_keep if column_key(c) not in found]
+                report_missing(missing_cols)
+                METRICS.count("columns_missing", len(missing_cols))
+
+                st.rows = write_chunks(output_file, chunks)
+        print(f"[OK] Cleaned file created ({st.rows} rows):", output_file)
+    except Exception as e:
+        print("[ERROR] Failed to create the cleaned file")
+        print(str(e))
+        sys.exit(1)
+
 
 # ================= LOAD EXCEL =================
-try:
-    df = pd.read_excel(input_file, engine="openpyxl")
-    print("[OK] Loaded rows:", len(df))
-except Exception as e:
-    print("[ERROR] Failed to read MIS Excel file")
-    print(str(e))
-    sys.exit(1)
-
-
-# ================= FILTER COLUMNS =================
-available_cols = [c for c in columns_to_keep if c in df.columns]
-missing_cols = [c for c in columns_to_keep if c not in df.columns]
-
-filtered_df = df[available_cols]
-
-if missing_cols:
-    print("[WARN] Missing columns (not present in MIS):")
-    for col in missing_cols:
-        print(" -", col)
-
-
-# ================= SAVE OUTPUT =================
-try:
-    filtered_df.to_excel(output_file, index=False)
-    print("[OK] Cleaned file created:", output_file)
-except Exception as e:
-    print("[ERROR] Failed to save output Excel")
-    print(str(e))
-    sys.exit(1)
+if __name__ == "__main__":
+    info = lambda message: print(f"[INFO] {message}")
+
+    # Streaming needs xlsxwriter (pyarrow for .parquet output) and a single
+    # workbook; a sharded export (glob or manifest) loads through load_mis
+    streaming = STREAM_COLUMNS and can_write_chunks(output_file) and not is_sharded(input_file)
+
+    try:
+        # Same MIS, column list and code as an earlier build: reuse its
+        # file (--force or REPORT_CACHE_FORCE=1 rebuilds)
+        with METRICS.stage("cache"):
+            CACHE_KEY = output_key(input_file, columns_to_keep, code_paths=[__file__])
+            if reuse_outputs(CACHE_KEY, [output_file], log=info):
+                sys.exit(0)
+
+        if not streaming:
+            with METRICS.stage("load") as st:
+                df = load_mis(input_file, columns=MIS_COLUMNS)
+                st.rows = len(df)
+            print("[OK] Loaded rows:", len(df))
+    except Exception as e:
+        print("[ERROR] Failed to read MIS Excel file")
+        print(str(e))
+        sys.exit(1)
+
+    if streaming:
+        run_streaming()
+    else:
+        run_report(df)
+    keep_outputs(CACHE_KEY, [output_file], log=info)
@@ -8,8 +8,17 @@ containing only required business columns.
 Author: SKANDA N RAJ
 """
 
-import pandas as pd
 import os
+import sys
+
+# Shared MIS loader lives in report_utils/ at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_utils.metrics import report_metrics
+from report_utils.mis_shards import is_sharded
+from report_utils.mis_snapshot import column_key, load_mis
+from report_utils.output_cache import keep_outputs, output_key, reuse_outputs
+from report_utils.report_writer import can_write_chunks, write_chunks, write_excel
+from report_utils.xlsx_stream import stream_columns
 
 
 # ================= CONFIG =================
@@ -17,10 +26,15 @@ import os
 # Input MIS file
 input_file = r"input folder path\Dummy Dataset.xlsx"
 
-# Output file (same folder as input)
+# Output file (same folder as input); a .parquet name writes Parquet
 input_folder = os.path.dirname(input_file)
 output_file = os.path.join(input_folder, "Ops_Data_Sanitization.xlsx")
 
+# True = copy the kept columns row by row from the workbook straight into
+# the output (memory stays flat however large the MIS is).
+# False = load the columns into pandas first (uses the MIS snapshot cache).
+STREAM_COLUMNS = True
+
 
 # ================= REQUIRED COLUMNS =================
 
@@ -62,36 +76,110 @@ columns_to_keep = [
     "Event Left Time Doctor"
 ]
 
+# Only the kept columns are loaded from the MIS
+MIS_COLUMNS = columns_to_keep
+
+# Per-stage timings and row counts (metrics/ at the repository root)
+METRICS = report_metrics(__file__)
+
+
+# ================= SANITIZATION STAGE =================
+
+def report_columns(kept, missing_cols):
+    """
+    Prints how many columns were kept and which required ones are missing.
+    """
+    print(f"✅ Columns kept: {len(kept)}")
+
+    if missing_cols:
+        print("\n⚠️ Missing columns:")
+        for col in missing_cols:
+            print(" -", col)
 
-# ================= STEP 1: READ MIS FILE =================
 
-try:
-    df = pd.read_excel(input_file, engine="openpyxl")
-    print(f"✅ Successfully loaded {len(df)} rows from: {os.path.basename(input_file)}")
-except Exception as e:
-    print(f"❌ Error reading Excel file:\n{e}")
-    exit()
+def run_report(df):
+    """
+    Writes the sanitized copy of a loaded MIS frame (required columns only).
+    The frame may be shared with other reports, so it is not modified.
+    Returns True when the cleaned file was written.
+    """
 
+    # ================= STEP 2: FILTER REQUIRED COLUMNS =================
 
-# ================= STEP 2: FILTER REQUIRED COLUMNS =================
+    available_cols = [col for col in columns_to_keep if col in df.columns]
+    missing_cols = [col for col in columns_to_keep if col not in df.columns]
 
-available_cols = [col for col in columns_to_keep if col in df.columns]
-missing_cols = [col for col in columns_to_keep if col not in df.columns]
+    filtered_df = df[available_cols]
 
-filtered_df = df[available_cols]
+    report_columns(available_cols, missing_cols)
 
-print(f"✅ Columns kept: {len(available_cols)}")
 
-if missing_cols:
-    print("\n⚠️ Missing columns:")
-    for col in missing_cols:
-        print(" -", col)
+    # ================= STEP 3: SAVE CLEANED FILE =================
 
+    with METRICS.stage("write", rows=len(filtered_df)) as st:
+        try:
+            if output_file.lower().endswith(".parquet"):
+                write_chunks(output_file, [filtered_df])
+            else:
+                write_excel(filtered_df, output_file)
+            print(f"\n✅ Cleaned file created successfully:\n{output_file}")
+        except Exception as e:
+            print(f"\n❌ Error saving file:\n{e}")
+            st.failed = True
 
-# ================= STEP 3: SAVE CLEANED FILE =================
+    METRICS.count("columns_missing", len(missing_cols))
+    return not st.failed
+
+
+def run_streaming():
+    """
+    Copies the required columns from the MIS workbook to the output chunk
+    by chunk (read-only workbook in, constant-memory writer out), without
+    loading the MIS into pandas. Returns True when the cleaned file was
+    written.
+    """
+    missing_cols = []
+
+    with METRICS.stage("stream") as st:
+        try:
+            with stream_columns(input_file, columns_to_keep) as (kept, chunks):
+                found = {column_key(c) for c in kept}
+                missing_cols = [col for col in columns_to_keep if column_key(col) not in found]
+                report_columns(kept, missing_cols)
+
+                st.rows = write_chunks(output_file, chunks)
+            print(f"\n✅ Cleaned file created successfully ({st.rows} rows):\n{output_file}")
+        except Exception as e:
+            print(f"\n❌ Error creating cleaned file:\n{e}")
+            st.failed = True
+
+    METRICS.count("columns_missing", len(missing_cols))
+    return not st.failed
+
+
+# ================= STEP 1: READ MIS FILE =================
 
-try:
-    filtered_df.to_excel(output_file, index=False)
-    print(f"\n✅ Cleaned file created successfully:\n{output_file}")
-except Exception as e:
-    print(f"\n❌ Error saving file:\n{e}")
+if __name__ == "__main__":
+    # Streaming needs xlsxwriter (pyarrow for .parquet output) and a single
+    # workbook; a sharded export (glob or manifest) loads through load_mis
+    streaming = STREAM_COLUMNS and can_write_chunks(output_file) and not is_sharded(input_file)
+
+    try:
+        # The same MIS (and column list, and code) gives the same file:
+        # reuse the earlier one without parsing (python main.py --force rebuilds)
+        with METRICS.stage("cache"):
+            CACHE_KEY = output_key(input_file, columns_to_keep, code_paths=[__file__])
+            if reuse_outputs(CACHE_KEY, [output_file]):
+                exit()
+
+        if not streaming:
+            with METRICS.stage("load") as st:
+                df = load_mis(input_file, columns=MIS_COLUMNS)
+                st.rows = len(df)
+            print(f"✅ Successfully loaded {len(df)} rows from: {os.path.basename(input_file)}")
+    except Exception as e:
+        print(f"❌ Error reading Excel file:\n{e}")
+        exit()
+
+    if run_streaming() if streaming else run_report(df):
+        keep_outputs(CACHE_KEY, [output_file])
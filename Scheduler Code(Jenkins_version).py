@@ -4,14 +4,33 @@ Healthcare Reporting Automation – Jenkins Master Scheduler
 
 This script acts as a central orchestration layer for all
 healthcare monitoring reports in this repository.
+
+Each build checks once whether today's MIS has landed and finished
+writing, runs the reports if so, and exits. Schedule it every few minutes
+(e.g. cron "H/5 * * * *"): a build that finds no MIS holds its executor
+only for the short readiness check, and a marker file keeps later builds
+from running the reports twice on the same day. The marker is written
+once the queued mail has been drained; later builds retry any mail still
+queued.
 """
 
 import os
+import json
 import datetime
-import time
 import subprocess
 import sys
 
+from report_utils.job_dag import run_dag, summarize, validate_dag
+from report_utils.mail_spool import PENDING, drain_until_empty, status
+from report_utils.metrics import (
+    RUN_ID_ENV, format_summary, new_run_id, summarise_run, write_run_prometheus
+)
+from report_utils.mis_cdc import capture_changes
+from report_utils.mis_snapshot import ensure_snapshot
+from report_utils.mis_watch import check_ready
+from report_utils.pipeline import run_pipeline
+from report_utils.run_log import RunLogger, job_name, run_job
+
 # ================= FIX FOR JENKINS UNICODE =================
 # Prevents UnicodeEncodeError in Jenkins console
 sys.stdout.reconfigure(encoding="utf-8")
@@ -25,7 +44,7 @@ PYTHON_EXE = r"C:\Users\SKANDA NAGARAJ\AppData\Local\Programs\Python\Python311\p
 # Workspace-relative MIS file
 MIS_FILE_PATH = r"E:\COURSES AND PROJECTS (DATA SCIENCE)\PROJECTS (ASTER DM HEALTHCARE)\Email Automation\Dummy Dataset.xlsx"
 
-# Jenkins script paths (repo relative)
+# Jenkins script paths (repo relative); report specs (.toml) are accepted too
 SCRIPT_PATHS = [
     r"python file path",
     r"python file path",
@@ -34,8 +53,33 @@ SCRIPT_PATHS = [
     r"python file path"
 ]
 
-RECHECK_INTERVAL_MIN = 30
-MAX_WAIT_HOURS = 6
+# Jobs that must finish before another job starts: {script: [scripts it needs]}.
+# Jobs without an entry are independent.
+SCRIPT_DEPENDENCIES = {}
+
+# Independent jobs run concurrently, each in its own process
+# (1 = one after another)
+MAX_PARALLEL_JOBS = 4
+
+# True = run reports and specs in this process, one job after another in
+# dependency order, each reading its columns from the shared MIS snapshot.
+# False = one process per job, independent jobs in parallel.
+# Either way a job whose dependency failed is skipped.
+RUN_IN_PROCESS = False
+
+# Record what changed since the previous MIS export before the reports run
+CAPTURE_MIS_CHANGES = True
+
+# How long the build keeps retrying queued report mail before finishing.
+# Mail still pending then stays in the spool and goes out with the next run.
+MAIL_DRAIN_MAX_SECONDS = 15 * 60
+
+# Seconds the MIS must stay unchanged before it counts as fully written
+MIS_STABLE_SECONDS = 20
+
+# A build after this time (HH:MM) that still finds no MIS fails, so the
+# missing export is noticed
+MIS_DEADLINE = "23:00"
 
 # Log directory
 LOG_DIR = "logs"
@@ -49,19 +93,17 @@ EXCEL_DELETE_FOLDER_3 = r"excel folder file path"
 # ============================================
 
 
-def get_log_file():
-    os.makedirs(LOG_DIR, exist_ok=True)
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    return os.path.join(LOG_DIR, f"jenkins_run_{today}.txt")
+# Records the day whose MIS was processed
+MARKER_FILE = os.path.join(LOG_DIR, "mis_processed.json")
 
 
-def log(message):
-    ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = f"[{ts}] {message}"
-    print(line, flush=True)
+# JSON lines in logs/jenkins_run_<date>.jsonl, one extra file per job for
+# its output; written by a background thread, old days gzipped
+LOGGER = RunLogger(LOG_DIR, "jenkins_run")
 
-    with open(get_log_file(), "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+
+def log(message):
+    LOGGER.log(message)
 
 
 # ================= PRE-CLEANUP =================
@@ -110,32 +152,171 @@ def is_mis_updated_today():
         return False
 
 
+# ================= MIS CHANGE CAPTURE =================
+
+def capture_mis_changes():
+    """
+    Writes the change events since the previous MIS export.
+    Failures are logged; the reports still run.
+    """
+    try:
+        capture_changes(MIS_FILE_PATH, log=log)
+    except Exception as e:
+        log(f"MIS change capture failed: {e}")
+
+
+# ================= RUN MARKER =================
+
+def processed_today():
+    try:
+        with open(MARKER_FILE, "r", encoding="utf-8") as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return marker.get("date") == datetime.date.today().isoformat()
+
+
+def mark_processed():
+    os.makedirs(LOG_DIR, exist_ok=True)
+    st = os.stat(MIS_FILE_PATH)
+    with open(MARKER_FILE, "w", encoding="utf-8") as f:
+        json.dump({
+            "date": datetime.date.today().isoformat(),
+            "mis_size": st.st_size,
+            "mis_mtime_ns": st.st_mtime_ns,
+            "finished": datetime.datetime.now().isoformat(timespec="seconds"),
+        }, f, indent=2)
+
+
 # ================= SCRIPT RUNNER =================
 
+def run_script(script):
+    """
+    Runs one job in its own process. Returns True on success.
+    """
+
+    name = os.path.basename(script)
+
+    # Report specs run through the pipeline CLI
+    if script.endswith(".toml"):
+        cmd = [PYTHON_EXE, "-m", "report_utils.pipeline", MIS_FILE_PATH, script]
+    else:
+        cmd = [PYTHON_EXE, script]
+
+    log(f"Running {name}")
+
+    try:
+
+        # Output goes to the console and the job's log stream
+        run_job(cmd, job_name(script), LOGGER)
+
+        log(f"{name} completed successfully")
+        return True
+
+    except subprocess.CalledProcessError as e:
+
+        log(f"{name} FAILED: {e}")
+        return False
+
+
+def run_in_process(script):
+    """
+    Runs one job as a pipeline stage in this process. Returns True on
+    success.
+    """
+
+    results = run_pipeline(MIS_FILE_PATH, [script], log=log)
+    return all(r["status"] == "ok" for r in results)
+
+
 def run_all_scripts():
+    """
+    Runs every job and returns True when all of them succeeded.
+    """
 
     log("Starting script execution")
 
-    for script in SCRIPT_PATHS:
+    # Every report records its stage metrics under this run id
+    run_id = new_run_id()
+    os.environ[RUN_ID_ENV] = run_id
+
+    try:
+        validate_dag(SCRIPT_PATHS, SCRIPT_DEPENDENCIES)
+    except ValueError as e:
+        # A bad SCRIPT_DEPENDENCIES fails the build before any report runs
+        log(f"Invalid job configuration: {e}")
+        sys.exit(1)
+
+    # Parse the MIS once so every report only memory-maps it
+    try:
+        ensure_snapshot(MIS_FILE_PATH)
+    except Exception as e:
+        log(f"MIS snapshot not prepared ({e}); reports will parse the workbook")
 
-        name = os.path.basename(script)
+    if RUN_IN_PROCESS:
 
-        log(f"Running {name}")
+        # Stages share this process (and the pipeline's stage registry),
+        # so they run one at a time
+        log(f"Running {len(SCRIPT_PATHS)} job(s) in-process, in dependency order")
 
-        try:
+        results = run_dag(
+            SCRIPT_PATHS, run_in_process, SCRIPT_DEPENDENCIES,
+            max_workers=1, log=log
+        )
 
-            subprocess.run([PYTHON_EXE, script], check=True)
+    else:
 
-            log(f"{name} completed successfully")
+        log(f"Running {len(SCRIPT_PATHS)} job(s), up to {MAX_PARALLEL_JOBS} in parallel")
 
-        except subprocess.CalledProcessError as e:
+        results = run_dag(
+            SCRIPT_PATHS, run_script, SCRIPT_DEPENDENCIES,
+            max_workers=MAX_PARALLEL_JOBS, log=log
+        )
 
-            log(f"{name} FAILED: {e}")
+    for line in summarize(results).splitlines():
+        log(line)
 
-            log("Continuing with next script")
+    log_run_metrics(run_id)
 
     log("All scripts processed")
 
+    return all(r["status"] == "ok" for r in results)
+
+
+# ================= RUN METRICS =================
+
+def log_run_metrics(run_id):
+    """
+    Aggregates the stage metrics every report recorded in this run, logs
+    them and writes the batch Prometheus file.
+    """
+    try:
+        summary = summarise_run(run_id)
+        for line in format_summary(summary).splitlines():
+            log(line)
+        write_run_prometheus(run_id, summary)
+    except Exception as e:
+        log(f"Run metrics not aggregated: {e}")
+
+
+# ================= MAIL SENDER =================
+
+def send_queued_mail():
+    """
+    Delivers the mail the reports queued. Jenkins ends background
+    processes with the build, so the spool is drained here, bounded by
+    MAIL_DRAIN_MAX_SECONDS.
+    """
+
+    log("Sending queued report mail")
+
+    left = drain_until_empty(log=log, max_seconds=MAIL_DRAIN_MAX_SECONDS)
+
+    if left:
+        log(f"{left} message(s) still queued; they will be retried on the next run")
+    else:
+        log("All queued mail sent")
+
 
 # ================= MAIN FLOW =================
 
@@ -143,36 +324,51 @@ def main():
 
     log("====================================")
     log("Jenkins Job Started")
-    log("Waiting for MIS update")
+    log("Checking MIS readiness")
     log("====================================")
 
-    start_time = datetime.datetime.now()
+    if processed_today():
+
+        # Mail an earlier build could not deliver is retried here
+        if status()[PENDING]:
+            log("Today's MIS was already processed. Retrying queued mail.")
+            send_queued_mail()
+        else:
+            log("Today's MIS was already processed. Nothing to do.")
+
+        sys.exit(0)
+
+    # Modified today and unchanged for MIS_STABLE_SECONDS
+    if is_mis_updated_today() and check_ready(MIS_FILE_PATH, MIS_STABLE_SECONDS, log=log):
 
-    timeout = datetime.timedelta(hours=MAX_WAIT_HOURS)
+        log("MIS updated today. Proceeding...")
 
-    while True:
+        preclean_folders()
 
-        if is_mis_updated_today():
+        if CAPTURE_MIS_CHANGES:
+            capture_mis_changes()
 
-            log("MIS updated today. Proceeding...")
+        run_all_scripts()
 
-            preclean_folders()
+        send_queued_mail()
 
-            run_all_scripts()
+        # Only after the drain: a build that dies before it reruns the
+        # reports, whose mail is queued once per run date
+        mark_processed()
 
-            log("Job completed successfully")
+        log("Job completed successfully")
 
-            sys.exit(0)
+        sys.exit(0)
 
-        if datetime.datetime.now() - start_time > timeout:
+    if datetime.datetime.now().strftime("%H:%M") >= MIS_DEADLINE:
 
-            log("MIS not updated within allowed window. Exiting job.")
+        log(f"MIS not ready by {MIS_DEADLINE}. Failing the build.")
 
-            sys.exit(1)
+        sys.exit(1)
 
-        log(f"MIS not updated. Rechecking in {RECHECK_INTERVAL_MIN} minutes")
+    log("MIS not ready yet. The next scheduled build checks again.")
 
-        time.sleep(RECHECK_INTERVAL_MIN * 60)
+    sys.exit(0)
 
 
 if __name__ == "__main__":
@@ -8,20 +8,29 @@ inside this repository.
 What It Does:
 -------------
 1. Runs daily at a fixed time (CHECK_TIME).
-2. Checks whether the MIS report has been updated today.
-3. If updated:
+2. Waits for today's MIS report: a file watcher wakes up as soon as it is
+   written, and it is used once it has stopped changing.
+3. Once ready:
       - Performs pre-cleanup (deletes old Excel outputs).
-      - Executes all report scripts sequentially.
-4. Logs all activities to a daily log file.
-5. Sends Windows toast notifications for status updates.
+      - Executes all report scripts (independent ones in parallel).
+4. Starts the background mail sender, which delivers the queued report
+   mail (retrying until the SMTP server accepts it).
+5. Logs all activities to a daily log file.
+6. Sends Windows toast notifications for status updates.
 
 Key Features:
 -------------
 - Workspace-relative paths (GitHub friendly)
 - Automatic Excel cleanup before execution
-- Daily logging system
+- Daily JSON-lines logging (buffered writer, old days gzipped)
+- Job output captured per job
 - Windows toast notifications
 - Supports both .py and .ipynb scripts
+- Declared job dependencies with bounded parallel execution
+- Durable mail spool with a background sender
+- Change events between consecutive MIS exports
+- Event-driven MIS readiness check (no half-copied workbooks)
+- Per-stage report metrics aggregated per run
 - Continuous background scheduler
 
 Designed For:
@@ -41,6 +50,16 @@ import subprocess
 import schedule
 from win10toast import ToastNotifier
 
+from report_utils.job_dag import run_dag, summarize, validate_dag
+from report_utils.metrics import (
+    RUN_ID_ENV, format_summary, new_run_id, summarise_run, write_run_prometheus
+)
+from report_utils.mis_cdc import capture_changes
+from report_utils.mis_snapshot import ensure_snapshot
+from report_utils.mis_watch import wait_until_ready
+from report_utils.pipeline import run_pipeline
+from report_utils.run_log import RunLogger, job_name, run_job
+
 
 # =====================================================
 #                     CONFIGURATION
@@ -58,11 +77,43 @@ SCRIPT_PATHS = [
     r"python file path"
 ]
 
+# Jobs that must finish before another job starts: {script: [scripts it needs]}.
+# Ops_Data_Sanitization writes the sanitised workbook; list it here for any
+# job that reads that output. Jobs without an entry are independent.
+SCRIPT_DEPENDENCIES = {}
+
+# Independent jobs run concurrently, each in its own process
+# (1 = one after another)
+MAX_PARALLEL_JOBS = 4
+
+# True = run .py reports and .toml specs in this process, one job after
+# another in dependency order, each reading its columns from the shared
+# MIS snapshot (lowest CPU/memory). Notebooks still get their own process.
+# False = one process per job, independent jobs in parallel (shortest
+# wall-clock time).
+# Either way the MIS snapshot is built once before the jobs start, and a
+# job whose dependency failed is skipped.
+RUN_IN_PROCESS = False
+
+# File types the in-process pipeline can run (scripts and report specs)
+IN_PROCESS_TYPES = (".py", ".toml")
+
+# Record what changed since the previous MIS export (inserts, deletes,
+# status and other column changes) before the reports run
+CAPTURE_MIS_CHANGES = True
+
+# How long the background mail sender keeps retrying queued mail (seconds)
+MAIL_DRAIN_MAX_SECONDS = 6 * 60 * 60
+
 # Daily execution time (24-hour format)
 CHECK_TIME = "19:44"
 
-# If MIS not updated, recheck interval (in minutes)
-RECHECK_INTERVAL = 30
+# The MIS is watched for changes and used as soon as it is complete.
+# Seconds it must stay unchanged before it counts as fully written:
+MIS_STABLE_SECONDS = 20
+
+# Fallback re-check interval (seconds) when file events are unavailable
+MIS_POLL_SECONDS = 60
 
 # Log directory (workspace-relative)
 LOG_DIR = "logs"
@@ -95,27 +146,16 @@ def notify(title, msg):
 #                     LOGGING SYSTEM
 # =====================================================
 
-def get_log_file():
-    """
-    Creates daily log file inside logs folder.
-    """
-    if not os.path.exists(LOG_DIR):
-        os.makedirs(LOG_DIR)
-
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    return os.path.join(LOG_DIR, f"scheduler_log_{today}.txt")
+# JSON lines in logs/scheduler_log_<date>.jsonl, one extra file per job
+# for its output; written by a background thread, old days gzipped
+LOGGER = RunLogger(LOG_DIR, "scheduler_log")
 
 
 def log_message(message):
     """
     Writes timestamped log messages to console and log file.
     """
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {message}\n"
-    print(log_entry.strip())
-
-    with open(get_log_file(), "a", encoding="utf-8") as f:
-        f.write(log_entry)
+    LOGGER.log(message)
 
 
 # =====================================================
@@ -189,76 +229,224 @@ def is_mis_updated_today():
 
 def wait_for_update():
     """
-    Keeps checking until MIS is updated today.
-    Once updated:
+    Waits until today's MIS is fully written (file watcher, polling as a
+    fallback), then:
         - Performs cleanup
         - Runs all scripts
     """
 
-    while True:
+    if not is_mis_updated_today():
+        msg = "MIS report not updated yet. Starting as soon as it lands."
+        log_message(f"⚠️ {msg}")
+        notify("Waiting for MIS", msg)
 
-        if is_mis_updated_today():
+    # Returns once the file was modified today and has stopped changing
+    wait_until_ready(
+        MIS_FILE_PATH, window=MIS_STABLE_SECONDS,
+        poll_seconds=MIS_POLL_SECONDS, log=log_message
+    )
 
-            log_message("✅ MIS report is updated today. Proceeding...")
-            notify("MIS Ready", "MIS Report is updated. Starting automation.")
+    log_message("✅ MIS report is updated today. Proceeding...")
+    notify("MIS Ready", "MIS Report is updated. Starting automation.")
 
-            # Perform cleanup before execution
-            preclean_folders()
+    # Perform cleanup before execution
+    preclean_folders()
 
-            # Execute all report scripts
-            run_all_scripts()
-            break
+    # Record changes since the previous export
+    if CAPTURE_MIS_CHANGES:
+        capture_mis_changes()
 
-        else:
-            msg = f"MIS report not updated. Rechecking in {RECHECK_INTERVAL} mins."
-            log_message(f"⚠️ {msg}")
-            notify("Waiting for MIS", msg)
+    # Execute all report scripts
+    run_all_scripts()
+
+    # Deliver the mail the reports queued
+    start_mail_sender()
+
+
+# =====================================================
+#              MIS CHANGE DATA CAPTURE
+# =====================================================
 
-            time.sleep(RECHECK_INTERVAL * 60)
+def capture_mis_changes():
+    """
+    Writes the change events between the previous and the current MIS
+    export. A failure is logged and does not stop the reports.
+    """
+    try:
+        capture_changes(MIS_FILE_PATH, log=log_message)
+    except Exception as e:
+        log_message(f"⚠ MIS change capture failed: {e}")
 
 
 # =====================================================
 #                SCRIPT EXECUTION ENGINE
 # =====================================================
 
-def run_all_scripts():
+def run_script(script):
     """
-    Sequentially executes all scripts defined in SCRIPT_PATHS.
+    Runs a single script in its own process and returns True on success.
+    Its stdout/stderr go to the job's own log stream.
     Supports:
         - Python scripts (.py)
+        - Report specs (.toml)
         - Jupyter notebooks (.ipynb)
     """
 
-    for script in SCRIPT_PATHS:
+    script_name = os.path.basename(script)
+    job = job_name(script)
+    log_message(f"🚀 Starting {script_name}...")
+    notify("Script Started", f"Running: {script_name}")
+
+    try:
+
+        # If Python script
+        if script.endswith(".py"):
+            run_job(["python", script], job, LOGGER)
+
+        # If declarative report spec
+        elif script.endswith(".toml"):
+            run_job([
+                "python", "-m", "report_utils.pipeline", MIS_FILE_PATH, script
+            ], job, LOGGER)
+
+        # If Jupyter notebook
+        elif script.endswith(".ipynb"):
+            run_job([
+                "jupyter", "nbconvert", "--to", "notebook",
+                "--execute", script, "--inplace"
+            ], job, LOGGER)
+
+        else:
+            log_message(f"⚠️ Unsupported file: {script}")
+            notify("Unsupported File", f"Cannot run file: {script_name}")
+            return False
+
+        log_message(f"✅ {script_name} completed successfully.")
+        notify("Script Completed", f"{script_name} finished successfully.")
+        return True
+
+    except subprocess.CalledProcessError as e:
+        log_message(f"❌ Error running {script}: {e}")
+        notify("Script Failed", f"Error running: {script_name}")
+        return False
+
+
+def run_in_process(script):
+    """
+    Runs one job for RUN_IN_PROCESS and returns True on success: reports
+    and specs as a pipeline stage in this process, anything else (notebooks)
+    through run_script.
+    """
+
+    if not script.endswith(IN_PROCESS_TYPES):
+        return run_script(script)
+
+    results = run_pipeline(MIS_FILE_PATH, [script], log=log_message)
+
+    for result in results:
+        if result["status"] == "ok":
+            notify("Script Completed", f"{result['stage']} finished successfully.")
+        else:
+            notify("Script Failed", f"Error running: {result['stage']}")
+
+    return all(r["status"] == "ok" for r in results)
+
+
+def run_all_scripts():
+    """
+    Executes all scripts defined in SCRIPT_PATHS and logs one summary.
+
+    - RUN_IN_PROCESS: jobs run one after another in dependency order,
+      .py reports and .toml specs inside this process.
+    - Otherwise every job runs in its own process, independent jobs in
+      parallel (at most MAX_PARALLEL_JOBS).
+    - In both modes a job whose dependency failed is skipped.
+    """
+
+    # Every report records its stage metrics under this run id
+    run_id = new_run_id()
+    os.environ[RUN_ID_ENV] = run_id
+
+    try:
+        validate_dag(SCRIPT_PATHS, SCRIPT_DEPENDENCIES)
+    except ValueError as e:
+        log_message(f"❌ Invalid job configuration: {e}")
+        notify("Scheduler Error", "Invalid job configuration. Check logs.")
+        return
+
+    # Parse the MIS once so every report only memory-maps it
+    try:
+        ensure_snapshot(MIS_FILE_PATH)
+    except Exception as e:
+        log_message(f"⚠ MIS snapshot not prepared ({e}); reports will parse the workbook.")
+
+    if RUN_IN_PROCESS:
+        # Stages share this process (and the pipeline's stage registry),
+        # so they run one at a time
+        log_message(f"🚀 Running {len(SCRIPT_PATHS)} job(s) in-process, in dependency order...")
+        results = run_dag(
+            SCRIPT_PATHS, run_in_process, SCRIPT_DEPENDENCIES,
+            max_workers=1, log=log_message
+        )
+    else:
+        log_message(f"🚀 Running {len(SCRIPT_PATHS)} job(s), up to {MAX_PARALLEL_JOBS} in parallel...")
+        results = run_dag(
+            SCRIPT_PATHS, run_script, SCRIPT_DEPENDENCIES,
+            max_workers=MAX_PARALLEL_JOBS, log=log_message
+        )
+
+    for line in summarize(results).splitlines():
+        log_message(line)
+
+    log_run_metrics(run_id)
 
-        script_name = os.path.basename(script)
-        log_message(f"🚀 Starting {script_name}...")
-        notify("Script Started", f"Running: {script_name}")
+    failed = [r for r in results if r["status"] != "ok"]
+    notify(
+        "Run Finished",
+        f"{len(results) - len(failed)} ok, {len(failed)} failed/skipped"
+    )
+
+
+# =====================================================
+#                     RUN METRICS
+# =====================================================
 
-        try:
+def log_run_metrics(run_id):
+    """
+    Aggregates the stage metrics every report recorded in this run, logs
+    them and writes the batch Prometheus file.
+    """
+    try:
+        summary = summarise_run(run_id)
+        for line in format_summary(summary).splitlines():
+            log_message(line)
+        write_run_prometheus(run_id, summary)
+    except Exception as e:
+        log_message(f"⚠ Run metrics not aggregated: {e}")
 
-            # If Python script
-            if script.endswith(".py"):
-                subprocess.run(["python", script], check=True)
 
-            # If Jupyter notebook
-            elif script.endswith(".ipynb"):
-                subprocess.run([
-                    "jupyter", "nbconvert", "--to", "notebook",
-                    "--execute", script, "--inplace"
-                ], check=True)
+# =====================================================
+#                  BACKGROUND MAIL SENDER
+# =====================================================
 
-            else:
-                log_message(f"⚠️ Unsupported file: {script}")
-                notify("Unsupported File", f"Cannot run file: {script_name}")
-                continue
+def start_mail_sender():
+    """
+    Starts the mail spool sender in its own process and returns at once.
+    It delivers every queued report mail, retrying with backoff for up to
+    MAIL_DRAIN_MAX_SECONDS; progress goes to its own console output.
+    """
 
-            log_message(f"✅ {script_name} completed successfully.")
-            notify("Script Completed", f"{script_name} finished successfully.")
+    repo_root = os.path.dirname(os.path.abspath(__file__))
 
-        except subprocess.CalledProcessError as e:
-            log_message(f"❌ Error running {script}: {e}")
-            notify("Script Failed", f"Error running: {script_name}")
+    try:
+        subprocess.Popen([
+            "python", "-m", "report_utils.mail_spool", "drain",
+            "--until-empty", "--max-seconds", str(MAIL_DRAIN_MAX_SECONDS)
+        ], cwd=repo_root)
+        log_message("📮 Mail sender started for queued report mail.")
+    except OSError as e:
+        log_message(f"❌ Could not start mail sender: {e}")
+        notify("Mail Sender Error", "Queued mail not sent. Check logs.")
 
 
 # =====================================================
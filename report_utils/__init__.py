@@ -0,0 +1,16 @@
+"""
+Report Utilities
+----------------
+
+Shared helpers used by every report script in this repository.
+
+Report folders add the repository root to ``sys.path`` and import from
+here, so the MIS loading logic lives in one place instead of being
+copy-pasted into each ``main.py``.
+
+Author: SKANDA N RAJ
+"""
+
+from report_utils.mis_snapshot import load_mis
+
+__all__ = ["load_mis"]
@@ -0,0 +1,174 @@
+"""
+Date-Range Backfill
+-------------------
+
+Runs a report for past dates, for a whole range of them from one MIS
+load.
+
+Every report took its date from the clock at import time
+(``today = datetime.today().date()``, "yesterday" = today - 1 day), so
+recovering from an outage or a bad MIS meant faking the system clock and
+rerunning each script once per missed day, parsing the workbook every
+time. The reports now read their run date(s) from the command line:
+
+    python main.py                                      today, as before
+    python main.py --as-of 2026-10-12                   the run of 12 Oct
+    python main.py --from 2026-10-10 --to 2026-10-14    one run per day
+    python main.py --from 2026-10-10 --to 2026-10-14 --mail
+
+A date is a *run date*: ``--as-of 2026-10-12`` builds what the 12 Oct
+run would have built, i.e. the rows of 11 Oct for the "yesterday"
+reports. Report windows stay relative to it (see report_spec.py).
+
+A range loads the MIS once, pre-filtered to the union of every day's
+windows (``QueryPlan.prefilter(first, last)``). Each day's rows then
+come from the frame's day index (date_index.py): the frame is grouped by
+appointment day once and every day only reads its own days.
+
+Outputs and mail:
+-----------------
+- Outputs of a date other than today carry it in their name
+  (``cancelled_patients_2026-10-12.xlsx``), so days do not overwrite
+  each other or today's report.
+- A normal run mails as before. A backfill only writes the files unless
+  ``--mail`` is given; each day's message is then queued separately,
+  with the run date in its subject.
+- Each day has its own output-cache key (output_cache.py), so days
+  already built for this MIS are restored instead of rebuilt.
+
+Usage:
+------
+    RUN = parse_run_dates()
+    df = load_mis(input_file, columns=MIS_COLUMNS,
+                  filters=PLAN.prefilter(RUN.first, RUN.last))
+    for as_of in RUN.dates:
+        run_report(df, as_of, send=RUN.mail)
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import argparse
+from datetime import date, datetime, timedelta
+
+
+# ================= CONFIG =================
+
+AS_OF_FLAG = "--as-of"
+FROM_FLAG = "--from"
+TO_FLAG = "--to"
+MAIL_FLAG = "--mail"
+
+# Longest range accepted in one run (a typo in a year is not a backfill)
+MAX_DAYS = 92
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+# ================= RUN DATES =================
+
+class RunDates:
+    """
+    Run date(s) of one invocation.
+
+    ``dates``     run dates, oldest first
+    ``mail``      queue each day's email
+    ``backfill``  True when the dates came from the command line
+    ``args``      the remaining command-line arguments
+    """
+
+    def __init__(self, dates, mail=True, backfill=False, args=()):
+        self.dates = list(dates)
+        self.mail = mail
+        self.backfill = backfill
+        self.args = list(args)
+
+    @property
+    def first(self):
+        return self.dates[0]
+
+    @property
+    def last(self):
+        return self.dates[-1]
+
+    def __repr__(self):
+        return f"RunDates({self.first} .. {self.last}, {len(self.dates)} day(s), mail={self.mail})"
+
+
+def _date(text):
+    try:
+        return datetime.strptime(text, DATE_FORMAT).date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {text!r}")
+
+
+def date_range(first, last):
+    """
+    Every date from ``first`` to ``last``, both included.
+    """
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def parse_run_dates(argv=None, today=None):
+    """
+    RunDates from ``--as-of`` or ``--from`` / ``--to`` (and ``--mail``).
+    Other arguments (``--force``, ...) are left in ``args`` for the
+    caller. Without a date, the run is today's and mails as usual.
+    """
+    today = today or date.today()
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(AS_OF_FLAG, dest="as_of", type=_date)
+    parser.add_argument(FROM_FLAG, dest="first", type=_date)
+    parser.add_argument(TO_FLAG, dest="last", type=_date)
+    parser.add_argument(MAIL_FLAG, action="store_true")
+    args, rest = parser.parse_known_args(argv)
+
+    if args.as_of and (args.first or args.last):
+        parser.error(f"{AS_OF_FLAG} cannot be combined with {FROM_FLAG} / {TO_FLAG}")
+
+    if args.as_of:
+        first = last = args.as_of
+    elif args.first or args.last:
+        # An open end defaults to today; an open start to the end date
+        last = args.last or today
+        first = args.first or last
+    else:
+        return RunDates([today], args=rest)
+
+    if first > last:
+        parser.error(f"{FROM_FLAG} {first} is after {TO_FLAG} {last}")
+    if last > today:
+        parser.error(f"run date {last} is in the future")
+    dates = date_range(first, last)
+    if len(dates) > MAX_DAYS:
+        parser.error(f"{len(dates)} days requested; at most {MAX_DAYS} per run")
+
+    return RunDates(dates, mail=args.mail, backfill=True, args=rest)
+
+
+# ================= OUTPUTS =================
+
+def dated_path(path, as_of, today=None):
+    """
+    Output path of a run on ``as_of``: unchanged for today's run,
+    ``<name>_<YYYY-MM-DD><ext>`` for any other date.
+    """
+    if as_of == (today or date.today()):
+        return path
+    stem, ext = os.path.splitext(path)
+    # Multi-part extensions (report.csv.gz) keep theirs whole
+    if ext.lower() == ".gz":
+        stem, inner = os.path.splitext(stem)
+        ext = inner + ext
+    return f"{stem}_{as_of:{DATE_FORMAT}}{ext}"
+
+
+def dated_subject(subject, as_of, today=None):
+    """
+    Mail subject of a run on ``as_of``: backfilled days say which run
+    they stand for.
+    """
+    if as_of == (today or date.today()):
+        return subject
+    return f"{subject} (backfill for {as_of:%d/%m/%Y})"
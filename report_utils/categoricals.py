@@ -0,0 +1,85 @@
+"""
+Categorical Normalisation
+-------------------------
+
+Converts the low-cardinality MIS columns (status, payment status,
+hospital, ...) to pandas categoricals once per load, and compares them
+through their integer codes.
+
+Every report used to run ``.astype(str).str.strip().str.lower()`` over the
+full column for each filter. With a categorical column the string
+clean-up runs once per *distinct value* (a few dozen) instead of once per
+row, and the per-row work is an integer code lookup.
+
+Usage:
+------
+    category_mask(df["Appt. Status"], "cancelled")
+    category_mask(df["Hospital Name"], allowed_hospitals)
+
+Comparisons ignore case and surrounding spaces, exactly like the old
+``.str.strip().str.lower()`` chains. Displayed values are left unchanged,
+so report outputs look the same as before.
+
+Author: SKANDA N RAJ
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# ================= CONFIG =================
+
+# Low-cardinality columns filtered by the reports
+CATEGORICAL_COLUMNS = [
+    "Appt. Status",
+    "Appt. Payment Status",
+    "Hospital Name",
+    "Consider Patient",
+    "Procedure Type",
+    "Is Prescription Generated",
+]
+
+
+# ================= HELPERS =================
+
+def normalise_value(value):
+    """
+    Canonical form used for comparisons: stripped, lower-case text.
+    """
+    return str(value).strip().lower()
+
+
+def normalise_categoricals(df, columns=None):
+    """
+    Converts the categorical MIS columns present in ``df`` to the pandas
+    category dtype. Columns that already are categorical are left alone.
+    Runs in place on a freshly loaded frame and returns it.
+    """
+    for col in columns or CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def category_mask(series, values):
+    """
+    Boolean mask of rows whose value matches ``values`` (a single value or
+    a list) after stripping and lower-casing.
+
+    The normalisation runs over the categories only; rows are matched by
+    their integer codes. Missing values never match.
+    """
+    if isinstance(values, str) or not np.iterable(values):
+        values = [values]
+    wanted = {normalise_value(v) for v in values}
+
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype("category")
+
+    categories = pd.Index(series.cat.categories.astype(str))
+    hit_codes = np.flatnonzero(categories.str.strip().str.lower().isin(wanted))
+
+    return pd.Series(
+        np.isin(series.cat.codes.to_numpy(), hit_codes),
+        index=series.index
+    )
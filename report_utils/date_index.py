@@ -0,0 +1,74 @@
+"""
+Appointment Day Index
+---------------------
+
+A sorted day index over a date column, so "yesterday" or "the last 15
+days" is a binary-search slice instead of a full scan.
+
+Reports used to select dates with ``df[DATE_COL].dt.date == yesterday``,
+which builds a Python ``date`` object for every row on every filter.
+The index is built once per loaded frame (vectorised datetime64[D]
+conversion plus one stable argsort) and shared by every report that runs
+against that frame.
+
+Usage:
+------
+    select_days(df, "Appointment Date", yesterday)              # one day
+    select_days(df, "Appointment Date", start_date, end_date)   # inclusive
+
+Rows come back in their original order. Unparseable dates (NaT) never
+match, as before.
+
+Author: SKANDA N RAJ
+"""
+
+import numpy as np
+import pandas as pd
+
+from report_utils.frame_cache import frame_cached
+
+
+# ================= INDEX =================
+
+class DayIndex:
+    """
+    Row positions of a frame sorted by calendar day.
+    """
+
+    def __init__(self, dates):
+        days = np.asarray(
+            pd.to_datetime(dates, errors="coerce").values
+        ).astype("datetime64[D]")
+
+        valid = np.flatnonzero(~np.isnat(days))
+        order = np.argsort(days[valid], kind="stable")
+
+        self.order = valid[order]
+        self.sorted_days = days[self.order]
+
+    def positions(self, start, end=None):
+        """
+        Sorted row positions whose day is in [start, end] (end defaults to
+        start).
+        """
+        end = start if end is None else end
+        lo = np.searchsorted(self.sorted_days, np.datetime64(start, "D"), side="left")
+        hi = np.searchsorted(self.sorted_days, np.datetime64(end, "D"), side="right")
+        return np.sort(self.order[lo:hi])
+
+
+# ================= PER-FRAME CACHE =================
+
+def day_index(df, column):
+    """
+    Returns the DayIndex of ``df[column]``, building it on first use.
+    The index lives as long as the frame does.
+    """
+    return frame_cached(df, ("day_index", column), lambda: DayIndex(df[column]))
+
+
+def select_days(df, column, start, end=None):
+    """
+    Rows of ``df`` whose ``column`` falls on a day in [start, end].
+    """
+    return df.iloc[day_index(df, column).positions(start, end)]
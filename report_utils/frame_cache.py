@@ -0,0 +1,35 @@
+"""
+Per-Frame Cache
+---------------
+
+Caches values derived from a loaded MIS frame (day index, filter masks,
+...) for as long as that frame is alive.
+
+In a pipeline run every report receives the same frame object, so
+anything cached here is computed once and reused by all reports.
+
+Author: SKANDA N RAJ
+"""
+
+import weakref
+
+
+# (id(frame), key) -> (weakref to frame, value)
+_CACHE = {}
+
+
+def frame_cached(df, key, build):
+    """
+    Returns the value cached for ``(df, key)``, calling ``build()`` to
+    create it on first use. Entries are dropped when the frame is
+    garbage-collected.
+    """
+    entry_key = (id(df), key)
+    cached = _CACHE.get(entry_key)
+    if cached is not None and cached[0]() is df:
+        return cached[1]
+
+    value = build()
+    _CACHE[entry_key] = (weakref.ref(df), value)
+    weakref.finalize(df, _CACHE.pop, entry_key, None)
+    return value
@@ -0,0 +1,235 @@
+"""
+Hospital Registry
+-----------------
+
+Hospital -> region and recipients, kept once for every report.
+
+The hospital lists were hard-coded per report (the Kerala units in the
+Cancelled spec, the Karnataka units in the Dropout spec), so covering
+another region meant cloning a script, and the MIS was parsed once more
+for it. Specs now name regions, and a spec with a ``[fanout]`` section
+sends one workbook per region or hospital from a single evaluation (see
+report_spec.run_spec and ``split_groups`` below).
+
+Registry file (``hospitals.toml`` next to this module, or HOSPITAL_REGISTRY):
+----------------------------------------------------------------------------
+    [regions.Kerala]
+    to = ["recipient@domain.com"]
+    cc = []
+    hospitals = ["Aster Medcity", "Aster MIMS Kottakkal"]
+
+    [hospitals."Aster Medcity"]     # optional: recipients of one hospital
+    to = ["recipient@domain.com"]   # (default: its region's)
+
+- A hospital belongs to exactly one region.
+- Names match ignoring case and surrounding spaces, like the spec
+  filters; outputs show the registry's spelling.
+
+In a spec:
+----------
+    [sets]
+    allowed_hospitals = { regions = ["Kerala", "Karnataka"] }   # or "all"
+
+    [fanout]
+    by = "region"                  # or "hospital"
+    column = "Hospital Name"       # default
+
+Usage:
+------
+    registry = load_registry()
+    registry.hospitals(["Kerala"])
+    groups, unmatched = split_groups(frames, "Hospital Name", registry, "region")
+
+    python -m report_utils.hospital_registry      # regions, hospitals, recipients
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    import tomli as tomllib
+
+from report_utils.categoricals import normalise_value
+
+
+# ================= CONFIG =================
+
+REGISTRY_ENV = "HOSPITAL_REGISTRY"
+REGISTRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hospitals.toml")
+
+GROUP_BY = ("region", "hospital")
+ALL_REGIONS = "all"
+
+# Default hospital column of a fan-out
+HOSPITAL_COLUMN = "Hospital Name"
+
+_LOADED = {}
+
+
+# ================= REGISTRY =================
+
+class HospitalRegistry:
+    """
+    Regions, their hospitals and the recipients of each.
+    """
+
+    def __init__(self, doc, path=None):
+        self.path = path
+        self.regions = {}
+        self._hospitals = {}   # normalised name -> (name, region)
+
+        for region, entry in (doc.get("regions") or {}).items():
+            self.regions[region] = {
+                "to": list(entry.get("to", [])),
+                "cc": list(entry.get("cc", [])),
+                "hospitals": list(entry.get("hospitals", [])),
+            }
+            for name in entry.get("hospitals", []):
+                key = normalise_value(name)
+                if key in self._hospitals:
+                    raise ValueError(
+                        f"{path}: '{name}' is listed in regions "
+                        f"'{self._hospitals[key][1]}' and '{region}'"
+                    )
+                self._hospitals[key] = (name, region)
+
+        self.hospital_recipients = {}
+        for name, entry in (doc.get("hospitals") or {}).items():
+            key = normalise_value(name)
+            if key not in self._hospitals:
+                raise ValueError(f"{path}: recipients given for unknown hospital '{name}'")
+            self.hospital_recipients[self._hospitals[key][0]] = {
+                "to": list(entry.get("to", [])),
+                "cc": list(entry.get("cc", [])),
+            }
+
+    def hospitals(self, regions=ALL_REGIONS):
+        """
+        Hospitals of the given region(s), or of every region for "all".
+        """
+        if regions == ALL_REGIONS:
+            regions = list(self.regions)
+        elif isinstance(regions, str):
+            regions = [regions]
+
+        unknown = [r for r in regions if r not in self.regions]
+        if unknown:
+            raise KeyError(f"Unknown region(s) {unknown}; registry has {list(self.regions)}")
+        return [h for r in regions for h in self.regions[r]["hospitals"]]
+
+    def group_of(self, hospital, by="region"):
+        """
+        Region (or registry spelling of the hospital) of ``hospital``;
+        None when it is not registered.
+        """
+        found = self._hospitals.get(normalise_value(hospital))
+        if found is None:
+            return None
+        return found[1] if by == "region" else found[0]
+
+    def recipients(self, group, by="region"):
+        """
+        (to, cc) of a region or hospital group.
+        """
+        if by == "hospital":
+            entry = self.hospital_recipients.get(group)
+            if entry is None:
+                entry = self.regions[self.group_of(group, "region")]
+        else:
+            entry = self.regions[group]
+        return entry["to"], entry["cc"]
+
+    def group_labels(self, values, by="region"):
+        """
+        Group label of every value of a hospital column (None for
+        hospitals not in the registry). The lookup runs once per
+        distinct hospital; rows only index into it.
+        """
+        if by not in GROUP_BY:
+            raise ValueError(f"Fan-out by {by!r}; expected one of {GROUP_BY}")
+
+        codes, uniques = pd.factorize(values)
+        # The extra last entry is the label of missing values (code -1)
+        lookup = np.array([self.group_of(h, by) for h in uniques] + [None], dtype=object)
+        return lookup[codes]
+
+
+def load_registry(path=None):
+    """
+    HospitalRegistry of ``path`` (default: HOSPITAL_REGISTRY, then
+    hospitals.toml next to this module). Loaded once per process.
+    """
+    path = os.path.abspath(path or os.getenv(REGISTRY_ENV) or REGISTRY_FILE)
+    if path not in _LOADED:
+        with open(path, "rb") as f:
+            _LOADED[path] = HospitalRegistry(tomllib.load(f), path)
+    return _LOADED[path]
+
+
+def resolve_sets(sets, spec_path=None):
+    """
+    Expands ``{ regions = [...] }`` entries of a spec's [sets] into the
+    registry's hospital lists (in place). Returns ``sets``.
+    """
+    for name, value in sets.items():
+        if not isinstance(value, dict):
+            continue
+        if "regions" not in value:
+            raise ValueError(f"{spec_path}: set '{name}' must be a list or {{ regions = [...] }}")
+        sets[name] = load_registry(value.get("registry")).hospitals(value["regions"])
+    return sets
+
+
+# ================= FAN-OUT =================
+
+def split_groups(frames, column, registry, by="region"):
+    """
+    Splits {report name: frame} by region or hospital in one groupby
+    pass per frame. Returns ({group: {report name: rows}}, rows left
+    out because their hospital is not registered).
+
+    Every group present in any frame gets every report (empty frames
+    where it has no rows), so each group's workbook has the same sheets.
+    """
+    split = {}
+    unmatched = 0
+    for name, frame in frames.items():
+        labels = registry.group_labels(frame[column], by)
+        unmatched += int(pd.isna(labels).sum())
+        for group, rows in frame.groupby(labels, sort=False, dropna=True):
+            split.setdefault(group, {})[name] = rows
+
+    # Groups in registry order
+    order = list(registry.regions) if by == "region" else registry.hospitals()
+    groups = {
+        group: {name: split[group].get(name, frame.iloc[:0]) for name, frame in frames.items()}
+        for group in order if group in split
+    }
+    return groups, unmatched
+
+
+# ================= CLI =================
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    registry = load_registry(argv[0] if argv else None)
+
+    print(f"{registry.path}: {len(registry.regions)} region(s)")
+    for region, entry in registry.regions.items():
+        print(f"  {region}: to {', '.join(entry['to']) or '-'}; cc {', '.join(entry['cc']) or '-'}")
+        for hospital in entry["hospitals"]:
+            own = registry.hospital_recipients.get(hospital)
+            note = f"  (to {', '.join(own['to'])})" if own else ""
+            print(f"    {hospital}{note}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Report Job DAG
+--------------
+
+Runs report jobs concurrently while respecting declared dependencies.
+
+The schedulers used to run ``SCRIPT_PATHS`` one after another, so the
+nightly wall-clock time was the sum of every report's runtime. Most
+reports only read the MIS and are independent of each other; a job that
+consumes another job's output (e.g. the sanitised workbook written by
+Ops_Data_Sanitization) declares it as a dependency.
+
+Rules:
+------
+- ``dependencies`` maps a job to the jobs that must finish first.
+- At most ``max_workers`` jobs run at the same time.
+- A job whose dependency failed is not started; it is reported as
+  "skipped".
+- Unknown dependencies, jobs listed twice and cycles are rejected before
+  anything runs.
+
+``run_job(job)`` does the actual work (typically starting a subprocess)
+and returns True on success. Each job usually runs as its own process,
+so threads here only wait on them.
+
+Usage:
+------
+    results = run_dag(SCRIPT_PATHS, run_script, SCRIPT_DEPENDENCIES, max_workers=4)
+    log(summarize(results))
+
+Author: SKANDA N RAJ
+"""
+
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+# ================= VALIDATION =================
+
+def validate_dag(jobs, dependencies=None):
+    """
+    Returns {job: set of jobs it waits for}. Raises ValueError on
+    duplicate jobs, unknown dependencies and cycles.
+    """
+    jobs = list(jobs)
+    if len(set(jobs)) != len(jobs):
+        dupes = sorted({j for j in jobs if jobs.count(j) > 1})
+        raise ValueError(f"Jobs listed more than once: {dupes}")
+
+    graph = {job: set() for job in jobs}
+    for job, needs in (dependencies or {}).items():
+        if job not in graph:
+            raise ValueError(f"Dependencies declared for unknown job: {job}")
+        for need in needs:
+            if need not in graph:
+                raise ValueError(f"{job} depends on unknown job: {need}")
+        graph[job] = set(needs)
+
+    topological_order(jobs, graph)
+    return graph
+
+
+def topological_order(jobs, graph):
+    """
+    Jobs in an order that runs every dependency first, keeping the
+    declared order where there is a choice. Raises ValueError on cycles.
+    """
+    done, order = set(), []
+    pending = list(jobs)
+
+    while pending:
+        ready = [j for j in pending if graph[j] <= done]
+        if not ready:
+            raise ValueError(f"Dependency cycle between: {pending}")
+        for job in ready:
+            done.add(job)
+            order.append(job)
+        pending = [j for j in pending if j not in done]
+
+    return order
+
+
+# ================= EXECUTION =================
+
+def _timed(run_job, job, log):
+    started = time.perf_counter()
+    status, error = "ok", None
+
+    try:
+        if run_job(job) is False:
+            status, error = "failed", "job reported failure"
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+        log(traceback.format_exc().rstrip())
+
+    seconds = round(time.perf_counter() - started, 2)
+    return {"stage": job, "status": status, "seconds": seconds, "error": error}
+
+
+def run_dag(jobs, run_job, dependencies=None, max_workers=4, log=print):
+    """
+    Runs ``run_job`` for every job with at most ``max_workers`` at once,
+    starting a job only after all its dependencies succeeded.
+
+    Returns one result dict per job, in the order of ``jobs``, shaped like
+    the pipeline's results: {"stage", "status", "seconds", "error"}.
+    """
+    graph = validate_dag(jobs, dependencies)
+    pending = list(jobs)
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        running = {}
+
+        while pending or running:
+            # Dependents of a failed/skipped job are never started
+            for job in list(pending):
+                blocked = [
+                    d for d in graph[job]
+                    if results.get(d, {}).get("status") in ("failed", "skipped")
+                ]
+                if blocked:
+                    log(f"Skipping {job}: dependency not completed ({', '.join(blocked)})")
+                    results[job] = {
+                        "stage": job, "status": "skipped", "seconds": 0.0,
+                        "error": f"dependency failed: {', '.join(blocked)}",
+                    }
+                    pending.remove(job)
+
+            for job in list(pending):
+                if len(running) >= max(1, max_workers):
+                    break
+                if all(results.get(d, {}).get("status") == "ok" for d in graph[job]):
+                    running[pool.submit(_timed, run_job, job, log)] = job
+                    pending.remove(job)
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                job = running.pop(future)
+                results[job] = future.result()
+
+    return [results[job] for job in jobs]
+
+
+def summarize(results):
+    """
+    One-block summary of a run: counts, then one line per job.
+    """
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+
+    lines = [
+        "Run summary: " + ", ".join(
+            f"{counts.get(s, 0)} {s}" for s in ("ok", "failed", "skipped")
+        )
+    ]
+    for r in results:
+        line = f"  {r['status'].upper():7} {r['seconds']:>8.2f}s  {r['stage']}"
+        if r["error"]:
+            line += f"  ({r['error']})"
+        lines.append(line)
+    return "\n".join(lines)
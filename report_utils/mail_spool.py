@@ -0,0 +1,420 @@
+"""
+Outbound Mail Spool
+-------------------
+
+Reports write finished messages to an on-disk spool and return at once;
+a separate sender drains the spool.
+
+Sending used to happen inline: a slow or flapping SMTP server blocked the
+report until it failed, the failure was printed, and the report was never
+delivered. With the spool, report latency no longer depends on the mail
+server, and a failed delivery is retried without regenerating the report.
+
+Layout (``MAIL_SPOOL_DIR``, default ``.mail_spool`` at the repo root):
+----------------------------------------------------------------------
+    pending/<id>.eml   + <id>.json   waiting to be (re)sent
+    inflight/<id>.json               claimed by a running sender
+    sent/<id>.eml      + <id>.json   delivered (kept for deduplication)
+    failed/<id>.eml    + <id>.json   gave up after MAX_ATTEMPTS
+
+- ``<id>`` is a SHA-256 of the message's stable content: subject, body,
+  sorted recipients, each attachment's filename and SHA-256, and the run
+  date (default today). MIME boundaries and headers such as Date are
+  left out, so a rebuilt message (a cache-hit rerun, a second scheduler
+  firing, a backfill rerun with ``--mail``) gets the same id, and
+  spooling it again, or after it was delivered, is a no-op.
+- Files are written through a temp file and renamed; the ``.json`` is
+  written last, so a half-written message is never picked up.
+- A sender claims a message by moving its ``.json`` to ``inflight/``,
+  so two senders never deliver the same message. The claim is stamped
+  with the claim time; only claims older than STALE_CLAIM_SECONDS (a
+  sender that died) are put back.
+- Failures back off exponentially (RETRY_BASE_SECONDS, doubling, capped
+  at RETRY_MAX_SECONDS).
+- Recipients the server accepted are recorded and not mailed again;
+  temporarily refused (4xx) recipients are retried, permanently refused
+  (5xx) ones are dropped and logged.
+
+Usage:
+------
+    spool_message(msg, TO_EMAILS + CC_EMAILS, SMTP_SERVER, SMTP_PORT, FROM_EMAIL,
+                  run_date=as_of)
+
+    python -m report_utils.mail_spool drain            # one pass
+    python -m report_utils.mail_spool drain --until-empty --max-seconds 3600
+    python -m report_utils.mail_spool status
+
+Credentials are not stored in the spool; the sender reads EMAIL_USER /
+EMAIL_PASSWORD from its own environment.
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import smtplib
+import argparse
+import tempfile
+from datetime import date
+from email import message_from_bytes, policy
+
+from report_utils.mailer import SMTP_PORT, SMTP_SERVER, get_transport
+
+
+# ================= CONFIG =================
+
+SPOOL_DIR_ENV = "MAIL_SPOOL_DIR"
+SPOOL_FOLDER = ".mail_spool"
+
+MAX_ATTEMPTS = 8
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 3600
+
+# Claims older than this belong to a sender that died; they are retried
+STALE_CLAIM_SECONDS = 30 * 60
+
+# Delivered messages are kept this long to deduplicate re-spooled mail
+KEEP_SENT_DAYS = 7
+
+PENDING, INFLIGHT, SENT, FAILED = "pending", "inflight", "sent", "failed"
+
+
+# ================= PATHS =================
+
+def spool_dir():
+    """
+    Root folder of the spool.
+    """
+    override = os.getenv(SPOOL_DIR_ENV)
+    if override:
+        return override
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(root, SPOOL_FOLDER)
+
+
+def _path(state, msg_id, ext, root=None):
+    return os.path.join(root or spool_dir(), state, f"{msg_id}.{ext}")
+
+
+def _write_atomic(path, data):
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _write_meta(path, meta):
+    _write_atomic(path, json.dumps(meta, indent=2).encode("utf-8"))
+
+
+def _read_meta(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _move(msg_id, src, dst, root):
+    """
+    Moves a message (.eml + .json) between states; .json goes last.
+    """
+    os.makedirs(os.path.join(root, dst), exist_ok=True)
+    eml = _path(src if src != INFLIGHT else PENDING, msg_id, "eml", root)
+    if os.path.exists(eml):
+        os.replace(eml, _path(dst, msg_id, "eml", root))
+    os.replace(_path(src, msg_id, "json", root), _path(dst, msg_id, "json", root))
+
+
+# ================= SPOOLING =================
+
+def message_id(msg, recipients, run_date=None):
+    """
+    Spool id of ``msg``: the same for every build of the same mail
+    (see the module docstring), different for another run date.
+    """
+    digest = hashlib.sha256()
+
+    def add(label, value):
+        digest.update(f"{label}:".encode("utf-8"))
+        digest.update(value if isinstance(value, bytes) else str(value).encode("utf-8"))
+        digest.update(b"\n")
+
+    add("run_date", run_date or date.today())
+    add("subject", msg["Subject"] or "")
+    add("recipients", "\n".join(sorted(recipients)))
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        payload = part.get_payload(decode=True) or b""
+        filename = part.get_filename()
+        if filename is None:
+            add("body", payload)
+        else:
+            add("attachment", f"{filename} {hashlib.sha256(payload).hexdigest()}")
+    return digest.hexdigest()[:32]
+
+
+def spool_message(msg, recipients, server=SMTP_SERVER, port=SMTP_PORT,
+                  user=None, debug=False, root=None, run_date=None):
+    """
+    Writes ``msg`` to the spool for delivery to ``recipients`` and
+    returns its id. Returns immediately; nothing is sent here.
+    A message already pending or delivered for the same run date
+    (default today) is not spooled again.
+    """
+    root = root or spool_dir()
+    raw = msg.as_bytes()
+    msg_id = message_id(msg, recipients, run_date)
+
+    for state in (PENDING, INFLIGHT, SENT):
+        if os.path.exists(_path(state, msg_id, "json", root)):
+            return msg_id
+
+    meta = {
+        "id": msg_id,
+        "subject": str(msg["Subject"] or ""),
+        "from": str(msg["From"] or user or ""),
+        "user": user or os.getenv("EMAIL_USER"),
+        "server": server,
+        "port": port,
+        "debug": debug,
+        "recipients": list(recipients),
+        "delivered": [],
+        "rejected": {},
+        "attempts": 0,
+        "next_attempt": 0,
+        "created": time.time(),
+        "last_error": None,
+    }
+    _write_atomic(_path(PENDING, msg_id, "eml", root), raw)
+    _write_meta(_path(PENDING, msg_id, "json", root), meta)
+    return msg_id
+
+
+# ================= DRAINING =================
+
+def _backoff(attempts):
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+def _release_stale_claims(root, now):
+    folder = os.path.join(root, INFLIGHT)
+    if not os.path.isdir(folder):
+        return
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name.endswith(".json") and now - os.path.getmtime(path) > STALE_CLAIM_SECONDS:
+            try:
+                os.replace(path, os.path.join(root, PENDING, name))
+            except OSError:
+                pass
+
+
+def _prune_sent(root, now):
+    folder = os.path.join(root, SENT)
+    if not os.path.isdir(folder):
+        return
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if now - os.path.getmtime(path) > KEEP_SENT_DAYS * 86400:
+            os.remove(path)
+
+
+def _deliver(meta, raw):
+    """
+    Sends to every recipient not delivered yet. Updates ``meta`` in place
+    and returns the recipients still to retry.
+    """
+    todo = [
+        r for r in meta["recipients"]
+        if r not in meta["delivered"] and r not in meta["rejected"]
+    ]
+    if not todo:
+        return []
+
+    transport = get_transport(meta["server"], meta["port"], meta["user"])
+    transport.debug = transport.debug or meta.get("debug", False)
+    msg = message_from_bytes(raw, policy=policy.compat32)
+
+    try:
+        refused = transport.send(msg, todo)
+    except smtplib.SMTPRecipientsRefused as e:
+        refused = e.recipients
+
+    retry = []
+    for rcpt in todo:
+        if rcpt not in refused:
+            meta["delivered"].append(rcpt)
+            continue
+        code, reason = refused[rcpt]
+        if isinstance(reason, bytes):
+            reason = reason.decode("utf-8", errors="replace")
+        if 500 <= code < 600:
+            meta["rejected"][rcpt] = f"{code} {reason}"
+        else:
+            retry.append(rcpt)
+    return retry
+
+
+def drain(root=None, log=print, now=None):
+    """
+    One pass over the spool: sends every pending message that is due.
+    Returns counts {"sent", "retry", "failed", "waiting"}.
+    """
+    root = root or spool_dir()
+    now = now or time.time()
+    counts = {"sent": 0, "retry": 0, "failed": 0, "waiting": 0}
+
+    _release_stale_claims(root, now)
+    _prune_sent(root, now)
+
+    pending = os.path.join(root, PENDING)
+    if not os.path.isdir(pending):
+        return counts
+
+    for name in sorted(os.listdir(pending)):
+        if not name.endswith(".json"):
+            continue
+        msg_id = name[:-len(".json")]
+
+        try:
+            meta = _read_meta(os.path.join(pending, name))
+        except (OSError, ValueError):
+            continue
+        if meta["next_attempt"] > now:
+            counts["waiting"] += 1
+            continue
+
+        # Claim it; another sender may have been faster
+        claimed = _path(INFLIGHT, msg_id, "json", root)
+        os.makedirs(os.path.dirname(claimed), exist_ok=True)
+        try:
+            os.replace(os.path.join(pending, name), claimed)
+        except OSError:
+            continue
+        # A rename keeps the old mtime; stale claims are aged from now
+        os.utime(claimed, (now, now))
+
+        try:
+            with open(_path(PENDING, msg_id, "eml", root), "rb") as f:
+                raw = f.read()
+        except OSError as e:
+            # Put the claim back (unless another sender already took it)
+            log(f"Mail {msg_id} not sent: {e}")
+            try:
+                os.replace(claimed, os.path.join(pending, name))
+            except OSError:
+                pass
+            continue
+
+        meta["attempts"] += 1
+        rejected_before = set(meta["rejected"])
+        try:
+            retry = _deliver(meta, raw)
+            meta["last_error"] = f"refused: {', '.join(retry)}" if retry else None
+        except (smtplib.SMTPException, OSError) as e:
+            retry = None
+            meta["last_error"] = f"{type(e).__name__}: {e}"
+
+        for rcpt in set(meta["rejected"]) - rejected_before:
+            log(f"Mail '{meta['subject']}': {rcpt} permanently refused ({meta['rejected'][rcpt]})")
+
+        if retry == [] and meta["delivered"]:
+            state, counts["sent"] = SENT, counts["sent"] + 1
+            log(f"Mail '{meta['subject']}' delivered to {len(meta['delivered'])} recipient(s)")
+        elif retry == [] or meta["attempts"] >= MAX_ATTEMPTS:
+            state, counts["failed"] = FAILED, counts["failed"] + 1
+            log(
+                f"Mail '{meta['subject']}' FAILED after {meta['attempts']} attempt(s): "
+                f"{meta['last_error'] or 'every recipient refused'}"
+            )
+        else:
+            state, counts["retry"] = PENDING, counts["retry"] + 1
+            meta["next_attempt"] = now + _backoff(meta["attempts"])
+            log(
+                f"Mail '{meta['subject']}' attempt {meta['attempts']} failed "
+                f"({meta['last_error']}); retrying in {_backoff(meta['attempts'])}s"
+            )
+
+        _write_meta(claimed, meta)
+        _move(msg_id, INFLIGHT, state, root)
+
+    return counts
+
+
+def drain_until_empty(root=None, log=print, max_seconds=None, poll_seconds=15):
+    """
+    Drains repeatedly until nothing is pending (or ``max_seconds`` pass).
+    Returns the number of messages still pending.
+    """
+    root = root or spool_dir()
+    started = time.time()
+
+    while True:
+        drain(root, log)
+        left = status(root)[PENDING]
+        if not left:
+            return 0
+        if max_seconds is not None and time.time() - started >= max_seconds:
+            return left
+        time.sleep(poll_seconds)
+
+
+def status(root=None):
+    """
+    Number of messages in each spool state.
+    """
+    root = root or spool_dir()
+    counts = {}
+    for state in (PENDING, INFLIGHT, SENT, FAILED):
+        folder = os.path.join(root, state)
+        counts[state] = len([
+            n for n in (os.listdir(folder) if os.path.isdir(folder) else [])
+            if n.endswith(".json")
+        ])
+    return counts
+
+
+# ================= CLI =================
+
+def main(argv=None):
+    # Same .env the reports use for EMAIL_USER / EMAIL_PASSWORD
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+    parser = argparse.ArgumentParser(prog="python -m report_utils.mail_spool")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_drain = sub.add_parser("drain", help="send pending messages")
+    p_drain.add_argument("--until-empty", action="store_true",
+                         help="keep draining until nothing is pending")
+    p_drain.add_argument("--max-seconds", type=float, default=None)
+    sub.add_parser("status", help="show spool counts")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        for state, n in status().items():
+            print(f"{state:9} {n}")
+        return 0
+
+    if args.until_empty:
+        return 1 if drain_until_empty(max_seconds=args.max_seconds) else 0
+
+    counts = drain()
+    print(", ".join(f"{n} {k}" for k, n in counts.items()))
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
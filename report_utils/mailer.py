@@ -0,0 +1,177 @@
+"""
+Shared Mail Transport
+---------------------
+
+One authenticated SMTP connection per run, reused by every report.
+
+Each report used to open ``smtplib.SMTP``, run ``starttls()`` and
+``login()``, send one message and quit: a TCP + TLS + AUTH handshake per
+report. Here the first message opens the connection and later messages
+reuse it. In a pipeline run (all reports in one process) the whole night
+costs one handshake.
+
+Behaviour:
+----------
+- Before reusing the connection a NOOP is sent; a dead connection is
+  replaced transparently.
+- A message that fails because the server dropped the connection is
+  retried once on a fresh connection.
+- The connection is closed when the process exits.
+
+Usage:
+------
+    msg = build_message(FROM_EMAIL, TO_EMAILS, CC_EMAILS, SUBJECT, BODY,
+                        attachments=[output_file])
+    send_message(msg, TO_EMAILS + CC_EMAILS)
+
+Credentials come from EMAIL_USER / EMAIL_PASSWORD unless passed in.
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import atexit
+import smtplib
+import threading
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+
+# ================= CONFIG =================
+
+SMTP_SERVER = "smtp.gmail.com"
+SMTP_PORT = 587
+
+
+# ================= MESSAGE =================
+
+def build_message(from_email, to_emails, cc_emails, subject, body, attachments=()):
+    """
+    Plain-text message with the given files attached.
+    """
+    msg = MIMEMultipart()
+    msg["From"] = from_email
+    msg["To"] = ", ".join(to_emails)
+    msg["Cc"] = ", ".join(cc_emails or [])
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body, "plain"))
+
+    for path in attachments:
+        with open(path, "rb") as f:
+            part = MIMEBase("application", "octet-stream")
+            part.set_payload(f.read())
+        encoders.encode_base64(part)
+        part.add_header(
+            "Content-Disposition",
+            f'attachment; filename="{os.path.basename(path)}"'
+        )
+        msg.attach(part)
+
+    return msg
+
+
+# ================= TRANSPORT =================
+
+class MailTransport:
+    """
+    A reusable, authenticated SMTP connection.
+    """
+
+    def __init__(self, server=SMTP_SERVER, port=SMTP_PORT, user=None, password=None):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.debug = False
+        self._smtp = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.server, self.port)
+        smtp.set_debuglevel(1 if self.debug else 0)
+        smtp.ehlo()
+        smtp.starttls()
+        smtp.ehlo()
+        if self.user:
+            smtp.login(self.user, self.password)
+        self._smtp = smtp
+
+    def _healthy(self):
+        if self._smtp is None:
+            return False
+        try:
+            return self._smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _drop(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self._smtp = None
+
+    def send(self, msg, recipients):
+        """
+        Sends ``msg`` to ``recipients`` over the shared connection.
+        Returns the refused-recipients dict from ``sendmail``.
+        """
+        from_addr = msg["From"] or self.user
+        with self._lock:
+            if not self._healthy():
+                self._drop()
+                self._connect()
+            self._smtp.set_debuglevel(1 if self.debug else 0)
+            try:
+                return self._smtp.sendmail(from_addr, recipients, msg.as_string())
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Dropped between the NOOP and the send: one retry
+                self._drop()
+                self._connect()
+                return self._smtp.sendmail(from_addr, recipients, msg.as_string())
+
+    def close(self):
+        with self._lock:
+            self._drop()
+
+
+# ================= SHARED INSTANCE =================
+
+# (server, port, user) -> MailTransport, one per process
+_TRANSPORTS = {}
+
+
+def get_transport(server=SMTP_SERVER, port=SMTP_PORT, user=None, password=None):
+    """
+    Shared transport for a server/account; created on first use.
+    """
+    user = user or os.getenv("EMAIL_USER")
+    password = password or os.getenv("EMAIL_PASSWORD")
+
+    key = (server, port, user)
+    if key not in _TRANSPORTS:
+        _TRANSPORTS[key] = MailTransport(server, port, user, password)
+    return _TRANSPORTS[key]
+
+
+def send_message(msg, recipients, server=SMTP_SERVER, port=SMTP_PORT,
+                 user=None, password=None, debug=False):
+    """
+    Sends a built message through the shared transport. ``debug`` prints
+    the SMTP conversation (used by the Jenkins versions).
+    """
+    transport = get_transport(server, port, user, password)
+    transport.debug = transport.debug or debug
+    return transport.send(msg, recipients)
+
+
+@atexit.register
+def close_all():
+    """
+    Closes every shared connection (runs automatically at exit).
+    """
+    for transport in _TRANSPORTS.values():
+        transport.close()
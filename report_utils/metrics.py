@@ -0,0 +1,350 @@
+"""
+Report Metrics
+--------------
+
+Per-stage timing and resource metrics for every report run.
+
+Reports used to leave nothing but their printed status lines, so a slow
+night could not be traced to the Excel parse, the filters, the write or
+the mail. Each report now wraps its stages in a timer:
+
+    METRICS = report_metrics(__file__)
+
+    with METRICS.stage("filter") as st:
+        df_c = PLAN.select(df, "dropout_consultations", as_of=today)
+        st.rows = len(df_c)
+
+    METRICS.count("rows_sent", len(df_c))
+
+Per stage it records wall time, CPU time (this process), the process's
+peak RSS so far and a row count. A stage that raises, or sets
+``st.failed``, is recorded as "failed" (``SystemExit(0)`` counts as ok).
+
+Files (``metrics/`` at the repository root, or ``REPORT_METRICS_DIR``):
+-----------------------------------------------------------------------
+    metrics_<YYYY-MM-DD>.jsonl     one JSON line per stage / counter
+    mis_report_<report>.prom       latest run of a report, in Prometheus
+                                   text format (for node_exporter's
+                                   textfile collector)
+    mis_report_batch.prom          totals of the latest scheduler run
+
+Every record carries a run id. The schedulers set ``REPORT_RUN_ID`` for
+the reports they start, then aggregate the run with ``summarise_run``.
+A report started by hand gets a run id of its own.
+
+Peak RSS comes from ``resource`` (Linux/macOS) or psutil (Windows); it is
+left empty when neither is available.
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import re
+import json
+import sys
+import glob
+import time
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # peak RSS on Windows is optional
+    psutil = None
+
+
+# ================= CONFIG =================
+
+METRICS_DIR_ENV = "REPORT_METRICS_DIR"
+RUN_ID_ENV = "REPORT_RUN_ID"
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRICS_FOLDER = "metrics"
+
+PROM_PREFIX = "mis_report"
+BATCH_REPORT = "batch"
+
+# Run id of a report started outside the schedulers
+_PROCESS_RUN_ID = datetime.now().strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+
+# ================= HELPERS =================
+
+def metrics_dir():
+    return os.getenv(METRICS_DIR_ENV) or os.path.join(REPO_ROOT, METRICS_FOLDER)
+
+
+def new_run_id():
+    """
+    Run id for a scheduler run (also used to name it in the summary).
+    """
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+def current_run_id():
+    return os.getenv(RUN_ID_ENV) or _PROCESS_RUN_ID
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process so far, or None.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    return None
+
+
+def _jsonl_path(directory, day=None):
+    return os.path.join(directory, f"metrics_{(day or datetime.now()):%Y-%m-%d}.jsonl")
+
+
+def _append(record, directory=None):
+    directory = directory or metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    # One write per line, so parallel reports do not interleave lines
+    with open(_jsonl_path(directory), "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _write_prom(path, metrics):
+    """
+    Writes {(name, help): [(labels, value), ...]} in Prometheus text format,
+    atomically (the collector may read at any moment).
+    """
+    lines = []
+    for (name, help_text), samples in metrics.items():
+        lines.append(f"# HELP {PROM_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PROM_PREFIX}_{name} gauge")
+        for labels, value in samples:
+            if value is None:
+                continue
+            text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            lines.append(f"{PROM_PREFIX}_{name}{{{text}}} {value}")
+
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+def _prom_name(report):
+    return re.sub(r"[^A-Za-z0-9_]+", "_", report).strip("_").lower()
+
+
+# ================= REPORT METRICS =================
+
+class Stage:
+    """
+    A running stage; set ``rows`` to record a row count, ``failed`` when
+    the report handles an error itself.
+    """
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.failed = False
+
+
+class ReportMetrics:
+    """
+    Stage timers and counters of one report.
+    """
+
+    def __init__(self, report, directory=None):
+        self.report = report
+        self.directory = directory
+        self.stages = []
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        st = Stage(name, rows)
+        started_at = datetime.now()
+        wall, cpu = time.perf_counter(), time.process_time()
+        status = "ok"
+        try:
+            yield st
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                status = "failed"
+            raise
+        except BaseException:
+            status = "failed"
+            raise
+        finally:
+            self._record({
+                "run_id": current_run_id(),
+                "report": self.report,
+                "stage": name,
+                "status": "failed" if st.failed else status,
+                "started": started_at.isoformat(timespec="seconds"),
+                "wall_seconds": round(time.perf_counter() - wall, 4),
+                "cpu_seconds": round(time.process_time() - cpu, 4),
+                "peak_rss_bytes": peak_rss_bytes(),
+                "rows": st.rows,
+                "pid": os.getpid(),
+            })
+
+    def count(self, name, value):
+        """
+        Records a counter (e.g. rows sent, keys evicted).
+        """
+        self._record({
+            "run_id": current_run_id(), "report": self.report,
+            "counter": name, "value": value, "pid": os.getpid(),
+        })
+
+    def _record(self, record):
+        # A long-lived process may run the report again under a new run id
+        if self.stages and self.stages[-1]["run_id"] != record["run_id"]:
+            self.stages, self.counters = [], {}
+        if "stage" in record:
+            self.stages.append(record)
+        else:
+            self.counters[record["counter"]] = record["value"]
+        # Metrics must never break a report
+        try:
+            _append(record, self.directory)
+            self.write_prometheus()
+        except OSError as e:
+            print(f"Metrics not written: {e}")
+
+    def write_prometheus(self):
+        """
+        Writes this report's latest stages and counters as a .prom file.
+        """
+        labels = lambda st: {"report": self.report, "stage": st["stage"]}
+        # Latest record per stage name (one sample per label set)
+        stages = list({s["stage"]: s for s in self.stages}.values())
+        _write_prom(
+            os.path.join(self.directory or metrics_dir(), f"{PROM_PREFIX}_{_prom_name(self.report)}.prom"),
+            {
+                ("stage_wall_seconds", "Wall-clock time of a report stage"):
+                    [(labels(s), s["wall_seconds"]) for s in stages],
+                ("stage_cpu_seconds", "CPU time of a report stage"):
+                    [(labels(s), s["cpu_seconds"]) for s in stages],
+                ("stage_peak_rss_bytes", "Peak RSS of the report process at the end of a stage"):
+                    [(labels(s), s["peak_rss_bytes"]) for s in stages],
+                ("stage_rows", "Rows produced by a report stage"):
+                    [(labels(s), s["rows"]) for s in stages],
+                ("stage_success", "1 if the stage succeeded, 0 if it failed"):
+                    [(labels(s), int(s["status"] == "ok")) for s in stages],
+                ("counter", "Report counters"):
+                    [({"report": self.report, "name": k}, v) for k, v in self.counters.items()],
+                ("last_run_timestamp_seconds", "Time of the report's latest metrics"):
+                    [({"report": self.report}, round(time.time()))],
+            }
+        )
+
+
+def report_metrics(script_path):
+    """
+    ReportMetrics named after the report's folder. Any other file than
+    ``main.py`` (the Jenkins variant, a report spec) adds its own name,
+    e.g. "Dropout_Consultation_Report/main(Jenkins_version)", so the
+    variants of a report never share a metrics series.
+    """
+    folder = os.path.basename(os.path.dirname(os.path.abspath(script_path)))
+    stem = os.path.splitext(os.path.basename(script_path))[0]
+    return ReportMetrics(folder if stem == "main" else f"{folder}/{stem}")
+
+
+# ================= RUN SUMMARY =================
+
+def read_records(run_id, directory=None):
+    """
+    Every record of a run (metrics files from the run's start day on).
+    """
+    directory = directory or metrics_dir()
+    first_day = f"metrics_{run_id[:4]}-{run_id[4:6]}-{run_id[6:8]}.jsonl"
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, "metrics_*.jsonl"))):
+        if os.path.basename(path) < first_day:
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line cut off by a crash
+                if record.get("run_id") == run_id:
+                    records.append(record)
+    return records
+
+
+def summarise_run(run_id, directory=None):
+    """
+    {report: {"wall_seconds", "cpu_seconds", "peak_rss_bytes", "failed",
+    "stages": {stage: record}, "counters": {...}}} for one run.
+    """
+    summary = {}
+    for record in read_records(run_id, directory):
+        report = summary.setdefault(record["report"], {
+            "wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_bytes": None,
+            "failed": False, "stages": {}, "counters": {},
+        })
+        if "counter" in record:
+            report["counters"][record["counter"]] = record["value"]
+            continue
+
+        report["stages"][record["stage"]] = record
+        report["wall_seconds"] += record["wall_seconds"]
+        report["cpu_seconds"] += record["cpu_seconds"]
+        report["failed"] |= record["status"] != "ok"
+        if record.get("peak_rss_bytes") is not None:
+            report["peak_rss_bytes"] = max(report["peak_rss_bytes"] or 0, record["peak_rss_bytes"])
+    return summary
+
+
+def format_summary(summary):
+    """
+    Readable per-report lines for the scheduler log.
+    """
+    lines = [f"Metrics: {len(summary)} report(s)"]
+    for report, s in summary.items():
+        rss = "" if s["peak_rss_bytes"] is None else f", peak {s['peak_rss_bytes'] / 2**20:.0f} MB"
+        stages = ", ".join(f"{name} {r['wall_seconds']:.2f}s" for name, r in s["stages"].items())
+        lines.append(
+            f"  {report}: {s['wall_seconds']:.2f}s wall, {s['cpu_seconds']:.2f}s CPU{rss}"
+            f"{' (FAILED)' if s['failed'] else ''} [{stages}]"
+        )
+    return "\n".join(lines)
+
+
+def write_run_prometheus(run_id, summary, directory=None):
+    """
+    Writes the run's per-report totals as ``mis_report_batch.prom``.
+    """
+    reports = list(summary.items())
+    _write_prom(
+        os.path.join(directory or metrics_dir(), f"{PROM_PREFIX}_{BATCH_REPORT}.prom"),
+        {
+            ("run_wall_seconds", "Summed stage wall time of a report in the latest run"):
+                [({"report": r}, round(s["wall_seconds"], 4)) for r, s in reports],
+            ("run_cpu_seconds", "Summed stage CPU time of a report in the latest run"):
+                [({"report": r}, round(s["cpu_seconds"], 4)) for r, s in reports],
+            ("run_peak_rss_bytes", "Peak RSS of a report in the latest run"):
+                [({"report": r}, s["peak_rss_bytes"]) for r, s in reports],
+            ("run_success", "1 if every stage of the report succeeded"):
+                [({"report": r}, int(not s["failed"])) for r, s in reports],
+            ("batch_last_run_timestamp_seconds", "Time the latest scheduler run was summarised"):
+                [({"run_id": run_id}, round(time.time()))],
+        }
+    )
@@ -0,0 +1,256 @@
+"""
+Scaling Benchmark
+-----------------
+
+Times every stage of every report on synthetic MIS exports of growing
+size (see mis_synth.py) and writes the results as JSON.
+
+Reports are the declarative specs (``*/report_spec.toml``), run stage by
+stage the way report_spec.run_spec and the report scripts run them:
+
+    parse        workbook -> snapshot, always rebuilt (once per size,
+                 shared by all reports)
+    load         the report's columns from the snapshot
+    normalise    categorical conversion of the filter columns
+    filter       date window + predicates of every report in the spec
+    dedup        duplicate removal (``drop_duplicates``) and, for the
+                 Completed report, the sent-log row keys
+    write        the report workbook(s)
+    mail-build   the MIME message with the workbooks attached
+
+Without pyarrow there is no snapshot: "parse" is skipped and "load"
+parses the workbook itself.
+
+Generated exports are kept in the work directory (named by size, seed
+and end date) and reused by later runs.
+
+Usage:
+------
+    python -m report_utils.mis_bench --sizes 10k,100k,1m --out mis_bench.json
+    python -m report_utils.mis_bench --sizes 5m --work-dir D:/mis_bench
+
+Result file:
+------------
+    {"started": ..., "python": ..., "pandas": ..., "as_of": ..., "seed": ...,
+     "results": [{"rows": 100000, "report": "Dropout_Consultation_Report",
+                  "stage": "filter", "seconds": 0.012, "rows_out": 1234}, ...]}
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+from datetime import date, datetime
+
+import pandas as pd
+
+from report_utils.categoricals import CATEGORICAL_COLUMNS, normalise_categoricals
+from report_utils.mailer import build_message
+from report_utils.mis_snapshot import build_snapshot, load_mis, pa
+from report_utils.mis_synth import parse_rows, shard_paths, write_mis
+from report_utils.report_spec import compile_plan, load_spec, mail_text, resolve_column
+from report_utils.report_writer import write_excel
+from report_utils.row_keys import drop_duplicate_rows, row_keys
+
+
+# ================= CONFIG =================
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = "10k,100k,1m"
+WORK_DIR = ".mis_bench"
+
+# Reports that key their rows for the sent-log: report name -> key columns
+SENT_LOG_KEYS = {
+    "completed_15days": ["Patient Name", "UHID", "Doctor Name", "Hospital Name", "Appointment Date"],
+}
+
+
+# ================= INPUTS =================
+
+def spec_files(root=REPO_ROOT):
+    """
+    Every report spec of the repository.
+    """
+    return sorted(glob.glob(os.path.join(root, "*", "report_spec.toml")))
+
+
+def mis_files(rows, work_dir=WORK_DIR, seed=0, end_date=None, log=print):
+    """
+    Workbook(s) of a synthetic export of ``rows`` rows, generated on
+    first use.
+    """
+    end_date = end_date or date.today()
+    path = os.path.join(work_dir, f"MIS_{rows}_{end_date:%Y%m%d}_s{seed}.xlsx")
+    paths = shard_paths(path, rows)
+    if all(os.path.exists(p) for p in paths):
+        return paths
+
+    log(f"Generating {rows} MIS rows -> {path}")
+    return write_mis(path, rows, seed, end_date, log=log)
+
+
+# ================= STAGES =================
+
+class _Timer:
+    """
+    Appends one result per timed block.
+    """
+
+    def __init__(self, results, log=print, **fields):
+        self.results = results
+        self.log = log
+        self.fields = fields
+
+    def __call__(self, stage, fn):
+        started = time.perf_counter()
+        value = fn()
+        seconds = time.perf_counter() - started
+
+        # Rows left after a frame stage; None for parse / write / mail
+        rows_out = None
+        if isinstance(value, pd.DataFrame):
+            rows_out = len(value)
+        elif isinstance(value, dict):
+            rows_out = sum(len(v) for v in value.values())
+        self.results.append({
+            **self.fields, "stage": stage,
+            "seconds": round(seconds, 4), "rows_out": rows_out,
+        })
+        rows_note = "" if rows_out is None else f"  rows {rows_out}"
+        self.log(f"  {self.fields.get('report', ''):42} {stage:11} {seconds:9.3f}s{rows_note}")
+        return value
+
+
+def _load(paths, columns):
+    frames = [load_mis(p, columns=columns) for p in paths]
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def _dedup(frames, dedup_flags):
+    out = {}
+    for name, frame in frames.items():
+        if dedup_flags[name]:
+            frame = drop_duplicate_rows(frame)
+        key_columns = SENT_LOG_KEYS.get(name)
+        if key_columns:
+            cols = [resolve_column(frame, c) for c in key_columns]
+            frame = frame.assign(__key=row_keys(frame, [c for c in cols if c]))
+        out[name] = frame
+    return out
+
+
+def _write(plan, frames, out_dir):
+    paths = []
+    for name, frame in frames.items():
+        report = plan.reports[name]
+        path = os.path.join(out_dir, report.output)
+        write_excel(frame.drop(columns="__key", errors="ignore"), path, report.sheet, [])
+        paths.append(path)
+    return paths
+
+
+def bench_spec(spec_path, paths, as_of, out_dir, timer):
+    """
+    Runs one spec stage by stage against the export.
+    """
+    spec = load_spec(spec_path)
+    plan = compile_plan([spec])
+
+    # Duplicates are removed in their own stage
+    dedup_flags = {name: r.drop_duplicates for name, r in plan.reports.items()}
+    for report in plan.reports.values():
+        report.drop_duplicates = False
+
+    df = timer("load", lambda: _load(paths, plan.columns()))
+
+    raw = df.astype({c: object for c in CATEGORICAL_COLUMNS if c in df.columns})
+    df = timer("normalise", lambda: normalise_categoricals(raw))
+
+    frames = timer("filter", lambda: plan.evaluate(df, as_of))
+    frames = timer("dedup", lambda: _dedup(frames, dedup_flags))
+
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = timer("write", lambda: _write(plan, frames, out_dir))
+
+    mail = spec.get("mail") or {}
+    timer("mail-build", lambda: build_message(
+        "bench@example.com", mail.get("to", []), mail.get("cc", []),
+        *mail_text(spec, as_of), attachments=outputs
+    ).as_bytes())
+
+
+def bench_size(rows, specs, work_dir=WORK_DIR, seed=0, as_of=None, log=print):
+    """
+    Results of every spec on an export of ``rows`` rows.
+    """
+    as_of = as_of or date.today()
+    paths = mis_files(rows, work_dir, seed, as_of, log)
+    results = []
+
+    log(f"{rows} rows ({len(paths)} workbook(s))")
+    if pa is not None:
+        _Timer(results, log, rows=rows, report="MIS")(
+            "parse", lambda: [build_snapshot(p) for p in paths]
+        )
+
+    for spec_path in specs:
+        name = os.path.basename(os.path.dirname(spec_path))
+        out_dir = os.path.join(work_dir, "out", str(rows), name)
+        bench_spec(spec_path, paths, as_of, out_dir, _Timer(results, log, rows=rows, report=name))
+
+    return results
+
+
+def run_benchmark(sizes, out_path, specs=None, work_dir=WORK_DIR, seed=0, log=print):
+    """
+    Benchmarks every size and writes the JSON result file. Returns the
+    result document.
+    """
+    specs = specs or spec_files()
+    as_of = date.today()
+    doc = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "as_of": as_of.isoformat(),
+        "seed": seed,
+        "specs": [os.path.relpath(s, REPO_ROOT) for s in specs],
+        "results": [],
+    }
+
+    for rows in sizes:
+        doc["results"] += bench_size(rows, specs, work_dir, seed, as_of, log)
+
+        # Written after every size, so a long run keeps what it measured
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+
+    log(f"Results written: {out_path}")
+    return doc
+
+
+# ================= CLI =================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m report_utils.mis_bench")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated, e.g. 10k,100k,1m,5m")
+    parser.add_argument("--out", default="mis_bench.json")
+    parser.add_argument("--work-dir", default=WORK_DIR)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spec", action="append", help="spec file(s) to run (default: all)")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_rows(s) for s in args.sizes.split(",") if s.strip()]
+    run_benchmark(sizes, args.out, args.spec, args.work_dir, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,395 @@
+"""
+MIS Change Data Capture
+-----------------------
+
+Compares each day's MIS export with the previous one and writes what
+changed as a compact event file.
+
+The MIS is a full export every day, so reports cannot tell a new
+appointment from one that only changed status (booked -> cancelled,
+booked -> done). This stage keeps a baseline of the last export and
+emits, per row key:
+
+    insert   key is new
+    delete   key disappeared
+    update   one event per changed column, with old and new value
+
+Row keys:
+---------
+- ``Appointment ID`` when the export has it.
+- Otherwise a composite of UHID, Patient Name, Doctor Name, Hospital
+  Name and Appointment Date (whichever exist).
+- Repeated keys get an occurrence suffix (``#1``, ``#2`` ...), so every
+  row has a unique key.
+
+How rows are compared:
+----------------------
+Values are compared as text (integral floats written as integers,
+missing values as null), so a column that flips between number and text
+storage from one export to the next does not show up as a change. Every
+column is hashed to a 64-bit fingerprint per row; rows are matched by
+key within hash partitions of the key (PARTITIONS), and only rows whose
+fingerprints differ are compared column by column.
+
+Files (``.mis_cdc`` next to the workbook, or ``MIS_CDC_DIR``):
+--------------------------------------------------------------
+    <name>.baseline.arrow        text copy of the last export + its key
+    <name>.baseline.json         sha256, key columns, header
+    events/<name>.<run>.parquet  op, key, column, old, new
+    events/<name>.<run>.json     counts, added/removed columns
+
+``<name>`` is the workbook stem and sheet, named like its snapshot
+(mis_snapshot.cache_name): in a shared ``MIS_CDC_DIR`` it also carries a
+short hash of the workbook's absolute path, so same-named exports of
+different folders keep their own baseline. A baseline of the old
+``<stem>.baseline`` layout recorded for the same workbook and first
+sheet is adopted once.
+
+A workbook identical to the baseline (same SHA-256) produces no new
+event file. The first run only records the baseline.
+
+Usage:
+------
+    summary = capture_changes(MIS_FILE_PATH)
+    events = latest_events(MIS_FILE_PATH)
+    new_or_changed = delta_rows(df, events, ops=("insert", "update"))
+
+    python -m report_utils.mis_cdc <MIS workbook>
+
+Needs pyarrow (baseline and event files).
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import sys
+import json
+import glob
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from report_utils.mis_snapshot import (
+    _read_meta, _write_atomic, _write_meta, cache_name, column_key, file_sha256,
+    load_mis, pa, resolve_sheet
+)
+
+if pa is not None:
+    import pyarrow.feather as feather
+
+
+# ================= CONFIG =================
+
+CDC_DIR_ENV = "MIS_CDC_DIR"
+CDC_FOLDER = ".mis_cdc"
+
+KEY_COLUMN = "Appointment ID"
+COMPOSITE_KEY = ["UHID", "Patient Name", "Doctor Name", "Hospital Name", "Appointment Date"]
+
+# Rows are matched partition by partition (hash of the key modulo this)
+PARTITIONS = 16
+
+# Fixed SipHash key so fingerprints are stable across runs
+HASH_KEY = "0123456789123456"
+
+KEY_FIELD = "__cdc_key"
+EVENT_COLUMNS = ["op", "key", "column", "old", "new"]
+
+
+# ================= PATHS =================
+
+def cdc_dir(path):
+    """
+    Folder holding the baseline and events for a workbook.
+    """
+    override = os.getenv(CDC_DIR_ENV)
+    if override:
+        return override
+    return os.path.join(os.path.dirname(os.path.abspath(path)), CDC_FOLDER)
+
+
+def _name(path, sheet_name=0):
+    shared = bool(os.getenv(CDC_DIR_ENV))
+    return cache_name(path, resolve_sheet(path, sheet_name), shared)
+
+
+def baseline_paths(path, sheet_name=0):
+    base = os.path.join(cdc_dir(path), f"{_name(path, sheet_name)}.baseline")
+    return base + ".arrow", base + ".json"
+
+
+def _adopt_legacy_baseline(path, sheet_name, data_path, meta_path):
+    """
+    Renames a baseline of the old ``<stem>.baseline`` layout to the new
+    name, when it was recorded for this workbook's first sheet.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    old = os.path.join(cdc_dir(path), f"{stem}.baseline")
+    meta = _read_meta(old + ".json")
+    if (
+        not meta or not os.path.exists(old + ".arrow")
+        or (meta.get("summary") or {}).get("source") != os.path.abspath(path)
+        or resolve_sheet(path, sheet_name) != resolve_sheet(path, 0)
+    ):
+        return
+    os.replace(old + ".arrow", data_path)
+    os.replace(old + ".json", meta_path)
+
+
+def events_dir(path):
+    return os.path.join(cdc_dir(path), "events")
+
+
+# ================= TEXT FORM =================
+
+def _text(series):
+    """
+    Column as text (object array, None for missing). Each distinct value
+    is converted once.
+    """
+    codes, uniques = pd.factorize(series)
+    values = uniques.astype(object) if len(uniques) else np.array([], dtype=object)
+
+    text = np.empty(len(values), dtype=object)
+    for i, v in enumerate(values):
+        if isinstance(v, float) and v.is_integer():
+            v = int(v)
+        text[i] = str(v)
+
+    out = np.full(len(codes), None, dtype=object)
+    present = codes >= 0
+    out[present] = text[codes[present]]
+    return out
+
+
+def as_text(df):
+    """
+    Text copy of a frame (see ``_text``), columns named as in ``df``.
+    """
+    return pd.DataFrame({c: _text(df[c]) for c in df.columns}, index=pd.RangeIndex(len(df)))
+
+
+def _hash(values):
+    return pd.util.hash_array(
+        np.asarray(values, dtype=object), hash_key=HASH_KEY, categorize=True
+    )
+
+
+# ================= KEYS =================
+
+def key_columns(columns):
+    """
+    Key columns present in ``columns``: Appointment ID, else the
+    composite key.
+    """
+    by_key = {column_key(c): c for c in columns}
+    if column_key(KEY_COLUMN) in by_key:
+        return [by_key[column_key(KEY_COLUMN)]]
+    return [by_key[column_key(c)] for c in COMPOSITE_KEY if column_key(c) in by_key]
+
+
+def row_keys(text, columns):
+    """
+    Unique text key per row of a text frame.
+    """
+    if not columns:
+        raise ValueError(
+            f"No key columns: need '{KEY_COLUMN}' or one of {COMPOSITE_KEY}"
+        )
+
+    keys = pd.Series(text[columns[0]]).fillna("")
+    for col in columns[1:]:
+        keys = keys + "|" + pd.Series(text[col]).fillna("")
+
+    # Repeated keys get an occurrence number
+    seen = keys.groupby(keys).cumcount()
+    keys = keys.where(seen == 0, keys + "#" + seen.astype(str))
+    return keys.to_numpy(dtype=object)
+
+
+def delta_rows(df, events, ops=("insert", "update")):
+    """
+    Rows of ``df`` (the current MIS) whose key has an event in ``ops``.
+    Lets a report work on what changed instead of the full export.
+    """
+    wanted = set(events.loc[events["op"].isin(ops), "key"])
+    keys = row_keys(as_text(df[key_columns(df.columns)]), key_columns(df.columns))
+    return df[np.isin(keys, list(wanted))]
+
+
+# ================= COMPARISON =================
+
+def _fingerprints(text, columns):
+    """
+    rows x columns matrix of 64-bit value hashes.
+    """
+    if not columns:
+        return np.zeros((len(text), 0), dtype=np.uint64)
+    return np.column_stack([_hash(text[c]) for c in columns])
+
+
+def diff(old, new, old_keys, new_keys):
+    """
+    Events between two text frames keyed by ``old_keys`` / ``new_keys``.
+    Returns (events DataFrame, added columns, removed columns).
+    """
+    old_cols = {column_key(c): c for c in old.columns}
+    new_cols = {column_key(c): c for c in new.columns}
+    common = [k for k in new_cols if k in old_cols]
+    added = [new_cols[k] for k in new_cols if k not in old_cols]
+    removed = [old_cols[k] for k in old_cols if k not in new_cols]
+
+    old_fp = _fingerprints(old, [old_cols[k] for k in common])
+    new_fp = _fingerprints(new, [new_cols[k] for k in common])
+
+    old_part = _hash(old_keys) % PARTITIONS
+    new_part = _hash(new_keys) % PARTITIONS
+
+    inserts, deletes, pairs_old, pairs_new = [], [], [], []
+    for p in range(PARTITIONS):
+        oi = np.flatnonzero(old_part == p)
+        ni = np.flatnonzero(new_part == p)
+
+        pos = pd.Index(old_keys[oi]).get_indexer(new_keys[ni])
+        hit = pos >= 0
+
+        inserts.append(ni[~hit])
+        matched = np.zeros(len(oi), dtype=bool)
+        matched[pos[hit]] = True
+        deletes.append(oi[~matched])
+
+        # Only rows whose fingerprint differs are compared further
+        mo, mn = oi[pos[hit]], ni[hit]
+        changed = (old_fp[mo] != new_fp[mn]).any(axis=1)
+        pairs_old.append(mo[changed])
+        pairs_new.append(mn[changed])
+
+    inserts = np.sort(np.concatenate(inserts))
+    deletes = np.sort(np.concatenate(deletes))
+    pairs_old = np.concatenate(pairs_old)
+    pairs_new = np.concatenate(pairs_new)
+
+    frames = [
+        pd.DataFrame({"op": "insert", "key": new_keys[inserts]}),
+        pd.DataFrame({"op": "delete", "key": old_keys[deletes]}),
+    ]
+
+    rows, cols = np.nonzero(old_fp[pairs_old] != new_fp[pairs_new])
+    if len(rows):
+        o, n = pairs_old[rows], pairs_new[rows]
+        names = np.array([new_cols[k] for k in common], dtype=object)[cols]
+        frames.append(pd.DataFrame({
+            "op": "update",
+            "key": new_keys[n],
+            "column": names,
+            "old": [old[old_cols[column_key(c)]].iat[i] for c, i in zip(names, o)],
+            "new": [new[c].iat[i] for c, i in zip(names, n)],
+        }))
+
+    events = pd.concat(frames, ignore_index=True).reindex(columns=EVENT_COLUMNS)
+    return events.astype(object), added, removed
+
+
+# ================= STAGE =================
+
+def capture_changes(path, sheet_name=0, log=print, now=None):
+    """
+    Diffs the workbook against the stored baseline, writes the event file
+    and makes the workbook the new baseline. Returns the run summary
+    (the stored one when the workbook is unchanged).
+    """
+    if pa is None:
+        raise RuntimeError("MIS change capture needs pyarrow")
+
+    now = now or datetime.now()
+    data_path, meta_path = baseline_paths(path, sheet_name)
+    if not os.path.exists(meta_path):
+        _adopt_legacy_baseline(path, sheet_name, data_path, meta_path)
+    meta = _read_meta(meta_path)
+    sha256 = file_sha256(path)
+
+    if meta and meta.get("sha256") == sha256 and os.path.exists(data_path):
+        log("MIS unchanged since the last capture; no new events")
+        return meta.get("summary") or {}
+
+    df = load_mis(path, sheet_name)
+    text = as_text(df)
+    keys_by = key_columns(text.columns)
+    keys = row_keys(text, keys_by)
+
+    summary = {
+        "source": os.path.abspath(path),
+        "sheet": resolve_sheet(path, sheet_name),
+        "sha256": sha256,
+        "captured": now.isoformat(timespec="seconds"),
+        "key_columns": keys_by,
+        "rows": len(text),
+    }
+
+    if meta and os.path.exists(data_path):
+        base = feather.read_table(data_path).to_pandas()
+        base_keys = base.pop(KEY_FIELD).to_numpy(dtype=object)
+
+        events, added, removed = diff(base, text, base_keys, keys)
+        counts = events["op"].value_counts().to_dict()
+        summary.update({
+            "previous_sha256": meta.get("sha256"),
+            "inserts": int(counts.get("insert", 0)),
+            "deletes": int(counts.get("delete", 0)),
+            "updates": int(counts.get("update", 0)),
+            "updated_rows": int(events.loc[events["op"] == "update", "key"].nunique()),
+            "added_columns": added,
+            "removed_columns": removed,
+        })
+        if meta.get("key_columns") != keys_by:
+            log(f"Key columns changed ({meta.get('key_columns')} -> {keys_by}); expect many inserts/deletes")
+
+        stem = os.path.join(events_dir(path), f"{_name(path, sheet_name)}.{now:%Y%m%d-%H%M%S}")
+        _write_atomic(stem + ".parquet", lambda tmp: events.to_parquet(tmp, index=False))
+        _write_meta(stem + ".json", summary)
+        summary["events_file"] = stem + ".parquet"
+
+        log(
+            f"MIS changes: {summary['inserts']} new, {summary['deletes']} removed, "
+            f"{summary['updated_rows']} changed row(s) -> {summary['events_file']}"
+        )
+    else:
+        log("First capture: baseline recorded, no events")
+
+    table = pa.Table.from_pandas(text.assign(**{KEY_FIELD: keys}), preserve_index=False)
+    _write_atomic(data_path, lambda tmp: feather.write_feather(table, tmp, compression="zstd"))
+    _write_meta(meta_path, {
+        "sha256": sha256, "key_columns": keys_by,
+        "header": list(text.columns), "summary": summary,
+    })
+    return summary
+
+
+def latest_events(path, sheet_name=0):
+    """
+    Events of the most recent capture for a workbook sheet (empty frame
+    if none).
+    """
+    pattern = f"{glob.escape(_name(path, sheet_name))}.*.parquet"
+    files = sorted(glob.glob(os.path.join(events_dir(path), pattern)))
+    if not files:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+    return pd.read_parquet(files[-1])
+
+
+# ================= CLI =================
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("Usage: python -m report_utils.mis_cdc <MIS workbook>")
+        return 2
+
+    summary = capture_changes(argv[0])
+    print(json.dumps(summary, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
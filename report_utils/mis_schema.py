@@ -0,0 +1,304 @@
+"""
+MIS Column Schema
+-----------------
+
+One registry of the type of every MIS column, applied whenever the MIS
+is loaded.
+
+Column types used to be whatever openpyxl and pandas inferred from the
+cells: ``UHID`` and ``Mobile`` came in as floats as soon as one cell was
+empty (``235974892.0``), event times as text in one export and as dates
+in the next, and low-cardinality text as one Python string per row. The
+same MIS could therefore give different frames, snapshots and row keys
+depending on the path it was loaded through.
+
+Types:
+------
+    category    low-cardinality text (status, hospital, speciality, ...)
+    datetime    datetime64[ns]; text dates are parsed
+    Int64       nullable integer
+    Float64     nullable float (amounts, fees, taxes)
+    string      pyarrow-backed text; plain object text when pandas or
+                pyarrow is too old for it. IDs and phone numbers are
+                text: ``00123`` and ``+91 98450...`` keep their leading
+                zero and sign, whole floats read back as integers
+
+Rules:
+------
+- Columns match ignoring case and surrounding spaces; columns not in the
+  registry keep their inferred type.
+- A column is converted only when no value is lost: text that does not
+  parse as a date or number, or fractional "integers", keep the column's
+  inferred type, and the column is listed by ``schema_report``. Text
+  with a leading zero or a ``+`` is never made numeric.
+- The snapshot is written with the schema applied (mis_snapshot.py), so
+  snapshot, streamed and sharded loads give the same dtypes.
+
+Usage:
+------
+    df = apply_schema(df)
+    for row in schema_report(raw, df): ...
+
+    python -m report_utils.mis_schema "Dummy Dataset.xlsx"   # per-column memory
+
+Author: SKANDA N RAJ
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from report_utils.categoricals import normalise_categoricals, normalise_value
+
+try:
+    STRING_DTYPE = pd.StringDtype("pyarrow", na_value=np.nan)
+except (ImportError, TypeError):  # pyarrow strings are optional
+    STRING_DTYPE = None
+
+
+# ================= CONFIG =================
+
+# Type of every column of the MIS export, in header order
+MIS_SCHEMA = {
+    "Patient ID": "string",
+    "UHID": "string",
+    "Patient Name": "string",
+    "Mobile": "string",
+    "DOB": "datetime",
+    "Gender": "category",
+    "City": "category",
+    "State": "category",
+    "Country": "category",
+    "Patient Type": "category",
+    "Is Primary Profile": "category",
+    "Relationship Type": "category",
+    "Appointment ID": "string",
+    "Appointment Type": "category",
+    "Procedure Type": "category",
+    "Appointment Date": "datetime",
+    "Appointment Time": "datetime",
+    "Appointment End Time": "datetime",
+    "Hospital Name": "category",
+    "Doctor Name": "string",
+    "Doctor HIS ID": "string",
+    "Appt. Payment Status": "category",
+    "Appt. Status": "category",
+    "Booking Source": "category",
+    "Booked DateTime": "datetime",
+    "booked_time": "string",
+    "Checked In Datetime": "datetime",
+    "Is Checkedin": "category",
+    "Doctor ID": "string",
+    "Speciality": "category",
+    "Consultation DateTime": "datetime",
+    "Completed DateTime": "datetime",
+    "Cancelled Datetime": "datetime",
+    "Is Re Scheduled": "category",
+    "HIS Invoice No.": "string",
+    "Invoice No": "string",
+    "Amount (₹)": "Float64",
+    "Discount (₹)": "Float64",
+    "Registration Fee (₹)": "Float64",
+    "Convenience Fee (₹)": "Float64",
+    "Consult Fee (₹)": "Float64",
+    "CGST": "Float64",
+    "SGST": "Float64",
+    "IGST": "Float64",
+    "Payment Type": "category",
+    "Payment Reference No.": "string",
+    "Refund Amount (₹)": "Float64",
+    "Room ID": "string",
+    "Is Prescription Generated": "category",
+    "Prescription Generated DateTime": "datetime",
+    "Event Join Time Patient": "datetime",
+    "Event Left Time Patient": "datetime",
+    "Event Join Time Doctor": "datetime",
+    "Event Left Time Doctor": "datetime",
+    "Final Remarks": "category",
+    "Consider Patient": "category",
+    "Clean Specialty": "category",
+}
+
+KINDS = ("category", "datetime", "Int64", "Float64", "string")
+
+# One resolution for every date column, whatever the reader inferred
+DATETIME_DTYPE = "datetime64[ns]"
+
+# Text a number would lose: a leading zero ("00123", "09876543210") or sign
+_CODE_TEXT = r"^\s*(?:\+|0\d)"
+
+
+# ================= CONVERSION =================
+
+def _has(series):
+    """
+    Cells holding a value (blank text counts as missing).
+    """
+    present = series.notna()
+    if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+        present &= series.astype(str).str.strip() != ""
+    return present
+
+
+def _numeric(series):
+    """
+    The column as numbers, or None when a present value is not a number
+    or is a code written like one (leading zero, ``+``).
+    """
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return None
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series
+    text = series.astype(object).where(series.map(lambda v: isinstance(v, str)))
+    if text.str.contains(_CODE_TEXT, na=False).any():
+        return None
+    out = pd.to_numeric(series.astype(object).where(_has(series)), errors="coerce")
+    if (out.isna() & _has(series)).any():
+        return None
+    return out
+
+
+def convert_column(series, kind):
+    """
+    ``series`` converted to ``kind``, or None when that would lose a value
+    (the column then keeps its inferred type).
+    """
+    if kind == "category":
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series
+        return series.astype("category")
+
+    if kind == "datetime":
+        if series.dtype == DATETIME_DTYPE:
+            return series
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            return series.astype(DATETIME_DTYPE)
+        # Numbers here are not dates in any format the MIS uses
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            return None
+        out = pd.to_datetime(series.where(_has(series)), errors="coerce", format="mixed")
+        if (out.isna() & _has(series)).any():
+            return None
+        return out.astype(DATETIME_DTYPE)
+
+    if kind in ("Int64", "Float64"):
+        if series.dtype == kind:
+            return series
+        out = _numeric(series)
+        if out is None:
+            return None
+        if kind == "Int64":
+            values = out.dropna()
+            if not (values == np.floor(values)).all():
+                return None
+        return out.astype(kind)
+
+    if kind == "string":
+        if STRING_DTYPE is None or series.dtype == STRING_DTYPE:
+            return series
+        # Whole numbers typed as floats (a blank cell in the column) read
+        # back as the integers they were entered as
+        if pd.api.types.is_float_dtype(series.dtype):
+            values = series.dropna()
+            if (values == np.floor(values)).all():
+                series = series.astype("Int64")
+        return series.astype(STRING_DTYPE)
+
+    raise ValueError(f"Unknown column type {kind!r}; expected one of {KINDS}")
+
+
+def apply_schema(df, schema=None):
+    """
+    Converts the columns of ``df`` to their registry types (in place) and
+    returns it. Categorical columns of categoricals.py are normalised
+    too, whatever the schema says.
+    """
+    schema = MIS_SCHEMA if schema is None else schema
+    kinds = {normalise_value(name): kind for name, kind in schema.items()}
+
+    for col in df.columns:
+        kind = kinds.get(normalise_value(col))
+        if kind is None:
+            continue
+        series = df[col]
+        out = convert_column(series, kind)
+        if out is not None and out is not series:
+            df[col] = out
+    return normalise_categoricals(df)
+
+
+# ================= REPORT =================
+
+def schema_report(raw, typed, schema=None):
+    """
+    Per-column memory and dtype of a frame before (``raw``) and after
+    (``typed``) apply_schema: a list of dicts with column, kind, dtypes,
+    MB before and after, and whether the column kept its inferred type
+    because its values do not fit the registry type.
+    """
+    schema = MIS_SCHEMA if schema is None else schema
+    kinds = {normalise_value(name): kind for name, kind in schema.items()}
+    before = raw.memory_usage(deep=True, index=False)
+    after = typed.memory_usage(deep=True, index=False)
+
+    rows = []
+    for col in raw.columns:
+        kind = kinds.get(normalise_value(col))
+        rows.append({
+            "column": col,
+            "kind": kind,
+            "inferred": str(raw[col].dtype),
+            "dtype": str(typed[col].dtype),
+            "mb_before": before[col] / 2**20,
+            "mb_after": after[col] / 2**20,
+            # A registry column whose values do not fit its type
+            "kept": kind is not None and convert_column(raw[col], kind) is None,
+        })
+    return rows
+
+
+# ================= CLI =================
+
+def main(argv=None):
+    # Imported here: the loaders themselves build on this module
+    from report_utils.mis_shards import load_shards, is_sharded
+    from report_utils.mis_snapshot import read_workbook
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("Usage: python -m report_utils.mis_schema <workbook>")
+        return 2
+
+    if is_sharded(argv[0]):
+        raw = load_shards(argv[0])
+        print("Sharded source: dtypes before the schema are those of the loaded shards")
+    else:
+        raw = read_workbook(argv[0])
+    typed = apply_schema(raw.copy())
+    rows = schema_report(raw, typed)
+
+    print(f"{'column':34} {'inferred':16} {'typed':16} {'MB':>8} {'MB':>8}")
+    for row in rows:
+        flag = "  (kept: values do not fit)" if row["kept"] else ""
+        flag = flag or ("  (not in schema)" if row["kind"] is None else "")
+        print(
+            f"{row['column'][:34]:34} {row['inferred'][:16]:16} {row['dtype'][:16]:16} "
+            f"{row['mb_before']:8.2f} {row['mb_after']:8.2f}{flag}"
+        )
+
+    total_before = sum(r["mb_before"] for r in rows)
+    total_after = sum(r["mb_after"] for r in rows)
+    print(
+        f"{len(rows)} column(s), {len(raw)} row(s): {total_before:.1f} MB -> {total_after:.1f} MB"
+        + (f" ({total_before / total_after:.1f}x smaller)" if total_after else "")
+    )
+
+    missing = [c for c in MIS_SCHEMA if normalise_value(c) not in {normalise_value(r["column"]) for r in rows}]
+    if missing:
+        print(f"Schema columns not in the workbook: {missing}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
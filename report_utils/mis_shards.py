@@ -0,0 +1,279 @@
+"""
+Sharded MIS Exports
+-------------------
+
+Loads an MIS export that arrives as several workbooks (per region, per
+day, ...) as one frame.
+
+Every loader took a single workbook path. The source of a report can now
+also be a glob or a manifest of MIS files:
+
+    input_file = r"exports\\MIS_*.xlsx"           # every matching file
+    input_file = r"exports\\mis_manifest.txt"     # the files it lists
+
+A manifest is a ``.txt`` file with one path per line (``#`` starts a
+comment) or a ``.json`` list of paths; relative paths are taken from the
+manifest's folder. Shards are read in manifest order, or sorted by name
+for a glob. A ``[`` only makes a glob when no file of that name exists,
+so a workbook called ``MIS [Oct].xlsx`` is still a single workbook.
+
+``load_mis`` and ``ensure_snapshot`` (mis_snapshot.py) hand such sources
+to this module, so reports and the pipeline need no change:
+
+1. Each shard has its own snapshot, validated like a single workbook's,
+   so only shards that changed are parsed again.
+2. Shards without a fresh snapshot are parsed in parallel worker
+   processes (``load_parts``).
+3. The frames are concatenated on one schema: the union of the shard
+   headers in first-seen order, matched ignoring case and spaces and
+   spelled like the first shard that has the column. Columns a shard
+   lacks are empty for its rows; the schema registry (mis_schema.py)
+   types the result, so it matches a single workbook's load.
+
+Header drift (columns missing from or added in a shard, other spellings,
+other dtypes) is logged on every load and listed by the CLI.
+
+The output cache keys a sharded source on the hash of every shard
+(``source_sha256``). The schedulers' readiness check and change capture
+still watch a single workbook.
+
+Usage:
+------
+    df = load_mis(r"exports\\MIS_*.xlsx", columns=MIS_COLUMNS)
+
+    python -m report_utils.mis_shards "exports/MIS_*.xlsx"   # shards and drift
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import sys
+import glob
+import json
+import hashlib
+
+import pandas as pd
+
+from report_utils.mis_schema import apply_schema
+from report_utils.mis_snapshot import (
+    column_key,
+    file_sha256,
+    fresh_snapshot,
+    load_parts,
+    pa,
+    project_columns,
+    resolve_sheet,
+)
+
+
+# ================= CONFIG =================
+
+MANIFEST_EXTENSIONS = (".txt", ".json")
+
+_GLOB_CHARS = "*?"
+
+# "[" is also a glob character, but workbook names use it too
+# ("MIS [Oct].xlsx"): it only makes a glob when no such file exists
+_GLOB_RANGE = "["
+
+
+# ================= SOURCES =================
+
+def is_sharded(source):
+    """
+    True when ``source`` is a glob or a manifest rather than a workbook.
+    """
+    source = str(source)
+    return (
+        any(c in source for c in _GLOB_CHARS)
+        or (_GLOB_RANGE in source and not os.path.exists(source))
+        or os.path.splitext(source)[1].lower() in MANIFEST_EXTENSIONS
+    )
+
+
+def _read_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(".json"):
+            entries = json.load(f)
+        else:
+            entries = [line.split("#", 1)[0].strip() for line in f]
+
+    folder = os.path.dirname(os.path.abspath(path))
+    return [os.path.join(folder, e) for e in entries if e]
+
+
+def shard_files(source):
+    """
+    Workbook paths of a source: the files of a glob (sorted) or a
+    manifest (in order), or the workbook itself.
+    """
+    source = str(source)
+    if not is_sharded(source):
+        return [source]
+
+    if os.path.splitext(source)[1].lower() in MANIFEST_EXTENSIONS and os.path.isfile(source):
+        files = _read_manifest(source)
+        missing = [f for f in files if not os.path.isfile(f)]
+        if missing:
+            raise FileNotFoundError(f"{source}: listed shard(s) not found: {missing}")
+    else:
+        # Office lock files (~$MIS.xlsx) of a shard open in Excel are not shards
+        files = sorted(
+            f for f in glob.glob(source)
+            if os.path.isfile(f) and not os.path.basename(f).startswith("~$")
+        )
+
+    if not files:
+        raise FileNotFoundError(f"No MIS files match {source}")
+    return files
+
+
+def source_sha256(source):
+    """
+    Content hash of a source: the workbook's SHA-256, or for shards a hash
+    of every shard's name and SHA-256.
+    """
+    if not is_sharded(source):
+        return file_sha256(source)
+
+    digest = hashlib.sha256()
+    for path in shard_files(source):
+        digest.update(f"{os.path.basename(path)}:{file_sha256(path)}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+# ================= SCHEMA =================
+
+def shard_headers(files, sheet_name=0):
+    """
+    Full header of every shard: from its snapshot sidecar when fresh,
+    otherwise from the header row alone.
+    """
+    # Imported here: xlsx_stream itself builds on mis_snapshot
+    from report_utils.xlsx_stream import read_header
+
+    headers = []
+    for path in files:
+        meta = fresh_snapshot(path, sheet_name) if pa is not None else None
+        headers.append(meta["header"] if meta else read_header(path, sheet_name))
+    return headers
+
+
+def union_header(headers):
+    """
+    Columns of all shards in first-seen order, spelled like the first
+    shard that has them.
+    """
+    union = {}
+    for header in headers:
+        for name in header:
+            union.setdefault(column_key(name), name)
+    return list(union.values())
+
+
+def header_drift(files, headers, frames=None):
+    """
+    Human-readable differences between each shard and the first one:
+    missing / extra columns, other spellings and (given the loaded
+    frames) other dtypes.
+    """
+    first = {column_key(h): h for h in headers[0]}
+    first_types = {}
+    if frames:
+        first_types = {column_key(c): (c, str(t)) for c, t in frames[0].dtypes.items()}
+
+    notes = []
+    for i, (path, header) in enumerate(zip(files, headers)):
+        if i == 0:
+            continue
+        name = os.path.basename(path)
+        own = {column_key(h): h for h in header}
+
+        missing = [first[k] for k in first if k not in own]
+        extra = [own[k] for k in own if k not in first]
+        renamed = [f"{first[k]!r} -> {own[k]!r}" for k in own if k in first and own[k] != first[k]]
+        if missing:
+            notes.append(f"{name}: missing {missing}")
+        if extra:
+            notes.append(f"{name}: extra {extra}")
+        if renamed:
+            notes.append(f"{name}: spelled {', '.join(renamed)}")
+
+        if frames:
+            types = {column_key(c): str(t) for c, t in frames[i].dtypes.items()}
+            changed = [
+                f"{first_types[k][0]} {first_types[k][1]} -> {t}" for k, t in types.items()
+                if k in first_types and t != first_types[k][1]
+            ]
+            if changed:
+                notes.append(f"{name}: dtype {', '.join(changed)}")
+    return notes
+
+
+def concat_shards(frames, columns):
+    """
+    One frame of all shards on ``columns``: shard columns are renamed to
+    that spelling and missing ones left empty.
+    """
+    keys = {column_key(c): c for c in columns}
+    aligned = [
+        frame.rename(columns=lambda c: keys.get(column_key(c), c)).reindex(columns=columns)
+        for frame in frames
+    ]
+    df = pd.concat(aligned, ignore_index=True)
+    # Differing shard categories (or a type a shard's values did not fit)
+    # concatenate to object; the schema types the whole frame once
+    return apply_schema(df)
+
+
+# ================= LOAD =================
+
+def load_shards(source, sheet_name=0, columns=None, filters=None, workers=None, log=print):
+    """
+    Loads every shard of ``source`` (see load_mis for the arguments) and
+    returns one frame. Header drift between shards is logged.
+    """
+    files = shard_files(source)
+    frames = load_parts([(f, sheet_name) for f in files], columns, filters, workers)
+
+    headers = shard_headers(files, sheet_name)
+    for note in header_drift(files, headers, frames):
+        log(f"MIS header drift: {note}")
+
+    return concat_shards(frames, project_columns(union_header(headers), columns))
+
+
+def ensure_shards(source, sheet_name=0, workers=None):
+    """
+    Builds the snapshot of every shard without a fresh one (in parallel).
+    Returns the shards' snapshot metadata.
+    """
+    files = shard_files(source)
+    # Only the parse matters here; no columns are converted
+    load_parts([(f, sheet_name) for f in files], columns=[], workers=workers)
+    return [fresh_snapshot(f, sheet_name) for f in files]
+
+
+# ================= CLI =================
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("Usage: python -m report_utils.mis_shards <glob or manifest>")
+        return 2
+
+    files = shard_files(argv[0])
+    headers = shard_headers(files)
+    print(f"{argv[0]}: {len(files)} shard(s), {len(union_header(headers))} column(s)")
+    for path, header in zip(files, headers):
+        print(f"  {os.path.basename(path)}  sheet {resolve_sheet(path)!r}  {len(header)} column(s)")
+
+    notes = header_drift(files, headers)
+    print("Header drift:" if notes else "No header drift")
+    for note in notes:
+        print(f"  {note}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
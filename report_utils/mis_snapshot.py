@@ -0,0 +1,513 @@
+"""
+MIS Snapshot Cache
+------------------
+
+Parses the MIS workbook once and stores it as a typed Arrow IPC
+(Feather v2) file that later reads can memory-map.
+
+Every report used to run its own ``pd.read_excel(..., engine="openpyxl")``
+on the same workbook. With this module the first report of the night pays
+for the openpyxl parse and every other report loads the snapshot instead.
+
+How a snapshot is validated:
+----------------------------
+1. Size and mtime of the workbook match the sidecar -> reuse.
+2. Size matches but mtime changed -> hash the file; same SHA-256 -> reuse.
+3. Anything else (new content, new header, new snapshot format) -> re-parse.
+
+Snapshots live in a ``.mis_snapshot`` folder next to the workbook.
+Set the ``MIS_SNAPSHOT_DIR`` environment variable to put them elsewhere;
+in that shared folder a snapshot name also carries a short hash of the
+workbook's absolute path, so same-named workbooks of different folders
+never share a snapshot.
+
+Reports pass the columns they use (``columns=``); only those columns are
+read from the snapshot, so memory scales with what a report needs rather
+than with the width of the workbook.
+
+If pyarrow is not installed the loader falls back to a plain read_excel
+(still limited to the requested columns through ``usecols``).
+
+Every column comes back with its type from the schema registry
+(mis_schema.py) on every path: low-cardinality columns as pandas
+categoricals (so reports can filter them by integer code), dates as
+datetime64, amounts as nullable numbers, IDs and text as pyarrow strings.
+
+Row filters (``filters=``, see xlsx_stream.py) are applied to a fresh
+snapshot directly. Without a fresh snapshot, workbooks of at least
+MIS_STREAM_MIN_MB megabytes (or any workbook when pyarrow is missing) are
+streamed with the filters applied during parsing, so large exports are
+never fully materialised.
+
+Sheet resolution:
+-----------------
+``sheet_name`` is an index, a name, or a list of preferred names: the
+first one present wins (case/space-insensitive), else the first sheet.
+The names come from the workbook's metadata (``xl/workbook.xml``), so
+picking a sheet never parses one and a missing preferred sheet no longer
+costs a failed read plus a second parse. Snapshots are keyed by the
+resolved sheet name.
+
+``load_sheets`` loads several sheets of one workbook, parsing the ones
+without a fresh snapshot in parallel worker processes (``load_parts``,
+shared with the sharded exports of mis_shards.py). ``load_mis`` and
+``ensure_snapshot`` also take a glob or manifest of MIS files.
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import re
+import json
+import hashlib
+import zipfile
+import tempfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # snapshot cache is optional
+    pa = None
+    feather = None
+
+
+# ================= CONFIG =================
+
+SNAPSHOT_DIR_ENV = "MIS_SNAPSHOT_DIR"
+SNAPSHOT_FOLDER = ".mis_snapshot"
+
+# Bump when the on-disk layout changes so old snapshots are rebuilt
+SNAPSHOT_VERSION = 5
+
+# Filtered loads of workbooks at least this large are streamed instead of
+# being parsed into a full snapshot
+STREAM_MIN_MB = float(os.getenv("MIS_STREAM_MIN_MB", "50"))
+
+# Most worker processes a parallel parse (load_parts) starts
+PARSE_WORKERS = int(os.getenv("MIS_PARSE_WORKERS", "4"))
+
+# Spreadsheet namespace of xl/workbook.xml
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+# (path, size, mtime) -> sheet names
+_SHEET_NAMES = {}
+
+
+# ================= FILE HELPERS =================
+
+def file_sha256(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file, read in 1 MB chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_dir(path):
+    """
+    Folder holding snapshots for the given workbook.
+    """
+    override = os.getenv(SNAPSHOT_DIR_ENV)
+    if override:
+        return override
+    return os.path.join(os.path.dirname(os.path.abspath(path)), SNAPSHOT_FOLDER)
+
+
+def cache_name(path, sheet_name, shared=False):
+    """
+    Base name of the files cached for a workbook sheet: ``<stem>.<sheet>``,
+    or ``<stem>.<path hash>.<sheet>`` in a folder ``shared`` by several
+    workbooks, so MIS.xlsx of two folders never share a file.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    sheet = re.sub(r"[^A-Za-z0-9_-]+", "_", str(sheet_name))
+    if shared:
+        source = os.path.normcase(os.path.abspath(path)).encode("utf-8")
+        stem = f"{stem}.{hashlib.sha256(source).hexdigest()[:8]}"
+    return f"{stem}.{sheet}"
+
+
+def snapshot_paths(path, sheet_name=0):
+    """
+    Returns (data_path, meta_path) of the snapshot for a workbook sheet.
+    """
+    name = cache_name(path, sheet_name, shared=bool(os.getenv(SNAPSHOT_DIR_ENV)))
+    base = os.path.join(snapshot_dir(path), name)
+    return base + ".arrow", base + ".json"
+
+
+def _write_atomic(path, write):
+    """
+    Writes through a temp file in the target folder and renames it into
+    place, so a concurrent reader never sees a half-written file.
+    """
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _write_meta(meta_path, meta):
+    def write(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+    _write_atomic(meta_path, write)
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ================= WORKBOOK PARSE =================
+
+def column_key(name):
+    """
+    Case- and space-insensitive form of a header name, used for matching.
+    """
+    return str(name).strip().lower()
+
+
+def project_columns(header, columns=None):
+    """
+    Header names to load for the requested columns, in workbook order.
+
+    Matching ignores case and surrounding spaces. Requested names that are
+    not in the header are skipped, since reports already handle optional
+    columns (and alias lists) being absent.
+    """
+    if columns is None:
+        return list(header)
+    wanted = {column_key(c) for c in columns}
+    return [h for h in header if column_key(h) in wanted]
+
+
+def sheet_names(path):
+    """
+    Sheet names of a workbook in workbook order, read from its metadata
+    (``xl/workbook.xml``) without parsing any sheet. Cached per file
+    version.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if key not in _SHEET_NAMES:
+        try:
+            with zipfile.ZipFile(path) as zf:
+                root = ET.fromstring(zf.read("xl/workbook.xml"))
+            names = [s.get("name") for s in root.iter(f"{_SHEET_NS}sheet")]
+        except (zipfile.BadZipFile, KeyError, ET.ParseError):
+            # Not an xlsx package (e.g. a legacy .xls): let pandas list them
+            with pd.ExcelFile(path) as xl:
+                names = list(xl.sheet_names)
+        _SHEET_NAMES[key] = names
+    return _SHEET_NAMES[key]
+
+
+def pick_sheet(names, sheet_name=0):
+    """
+    The sheet of ``names`` that ``sheet_name`` refers to: an index, a
+    name, or a list of preferred names (the first present wins; none
+    present -> the first sheet). Names match ignoring case and spaces.
+    """
+    if not names:
+        raise ValueError("Workbook has no sheets")
+    if isinstance(sheet_name, int):
+        if not -len(names) <= sheet_name < len(names):
+            raise IndexError(f"Sheet index {sheet_name} out of range ({len(names)} sheet(s))")
+        return names[sheet_name]
+
+    by_key = {}
+    for name in names:
+        by_key.setdefault(column_key(name), name)
+
+    if isinstance(sheet_name, str):
+        if column_key(sheet_name) not in by_key:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found; workbook has {names}")
+        return by_key[column_key(sheet_name)]
+
+    for preferred in sheet_name:
+        if column_key(preferred) in by_key:
+            return by_key[column_key(preferred)]
+    return names[0]
+
+
+def resolve_sheet(path, sheet_name=0):
+    """
+    Name of the workbook sheet ``sheet_name`` refers to (see pick_sheet).
+    """
+    return pick_sheet(sheet_names(path), sheet_name)
+
+
+def read_workbook(path, sheet_name=0, columns=None):
+    """
+    Parses the workbook through openpyxl (the slow path).
+    Header names are stripped here once so reports never have to modify
+    the frame they are given.
+    """
+    usecols = None
+    if columns is not None:
+        wanted = {column_key(c) for c in columns}
+        usecols = lambda name: column_key(name) in wanted
+
+    df = pd.read_excel(
+        path, sheet_name=resolve_sheet(path, sheet_name), engine="openpyxl", usecols=usecols
+    )
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+
+def _arrow_safe(df):
+    """
+    Arrow needs one type per column. Object columns that mix types
+    (e.g. UHID stored partly as numbers, partly as text) are turned into
+    strings; missing values stay missing.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+
+# ================= SNAPSHOT =================
+
+def fresh_snapshot(path, sheet_name=0):
+    """
+    Returns the snapshot metadata if the snapshot still matches the
+    workbook, otherwise None.
+    """
+    sheet_name = resolve_sheet(path, sheet_name)
+    data_path, meta_path = snapshot_paths(path, sheet_name)
+    meta = _read_meta(meta_path)
+
+    if not meta or meta.get("version") != SNAPSHOT_VERSION:
+        return None
+    if not os.path.exists(data_path):
+        return None
+
+    st = os.stat(path)
+    if meta["size"] != st.st_size:
+        return None
+    if meta["mtime_ns"] == st.st_mtime_ns:
+        return meta
+
+    # Touched but possibly unchanged (copied again, re-saved, ...)
+    if file_sha256(path) != meta["sha256"]:
+        return None
+
+    meta["mtime_ns"] = st.st_mtime_ns
+    _write_meta(meta_path, meta)
+    return meta
+
+
+def build_snapshot(path, sheet_name=0):
+    """
+    Parses the workbook and writes a fresh snapshot plus its sidecar.
+    Returns the metadata that was written.
+    """
+    sheet_name = resolve_sheet(path, sheet_name)
+    data_path, meta_path = snapshot_paths(path, sheet_name)
+
+    st = os.stat(path)
+    sha256 = file_sha256(path)
+    df = read_workbook(path, sheet_name)
+
+    # Imported here so ``python -m report_utils.mis_schema`` runs cleanly
+    from report_utils.mis_schema import apply_schema
+
+    # Stored with the schema applied (categoricals dictionary-encoded), so
+    # every read gets the columns back already typed
+    df = _arrow_safe(apply_schema(df))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    _write_atomic(
+        data_path,
+        lambda tmp: feather.write_feather(table, tmp, compression="uncompressed")
+    )
+
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "source": os.path.abspath(path),
+        "sheet_name": sheet_name,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": sha256,
+        "header": list(df.columns),
+        "dtypes": {c: str(t) for c, t in df.dtypes.items()},
+        "rows": len(df),
+    }
+    _write_meta(meta_path, meta)
+    return meta
+
+
+def ensure_snapshot(path, sheet_name=0):
+    """
+    Builds the snapshot unless a fresh one exists. Schedulers call this
+    before starting reports in parallel, so the workbook is parsed once
+    instead of by every report process at the same time.
+    Returns the snapshot metadata, or None without pyarrow. For a glob or
+    manifest of MIS files, every shard's snapshot is ensured (in parallel)
+    and the list of their metadata is returned.
+    """
+    if pa is None:
+        return None
+    from report_utils.mis_shards import ensure_shards, is_sharded
+    if is_sharded(path):
+        return ensure_shards(path, sheet_name)
+    sheet_name = resolve_sheet(path, sheet_name)
+    return fresh_snapshot(path, sheet_name) or build_snapshot(path, sheet_name)
+
+
+def read_snapshot(path, sheet_name=0, columns=None):
+    """
+    Memory-maps the snapshot and converts the requested columns to a
+    DataFrame. Columns that are not requested are never paged in.
+    """
+    data_path, _ = snapshot_paths(path, resolve_sheet(path, sheet_name))
+    table = feather.read_table(data_path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def load_mis(path, sheet_name=0, columns=None, filters=None):
+    """
+    Loads the MIS workbook, going through the snapshot cache when possible.
+
+    ``columns`` limits the load to the columns a report uses (None = all).
+    ``filters`` is an optional list of row filters from xlsx_stream.
+    ``sheet_name`` may list preferred sheets (see pick_sheet).
+    ``path`` may be a glob or manifest of MIS files (see mis_shards.py).
+    The snapshot is rebuilt automatically when the workbook content
+    (including its header row) changes.
+    """
+    # Imported here: these modules build on this one
+    from report_utils.mis_schema import apply_schema
+    from report_utils.mis_shards import is_sharded, load_shards
+    from report_utils.xlsx_stream import stream_mis
+
+    if is_sharded(path):
+        return load_shards(path, sheet_name, columns, filters)
+
+    sheet_name = resolve_sheet(path, sheet_name)
+    meta = fresh_snapshot(path, sheet_name) if pa is not None else None
+
+    if meta is None and filters:
+        size_mb = os.path.getsize(path) / (1 << 20)
+        if pa is None or size_mb >= STREAM_MIN_MB:
+            return apply_schema(stream_mis(path, sheet_name, columns, filters))
+
+    read_columns = _read_columns(columns, filters)
+
+    if pa is None:
+        df = read_workbook(path, sheet_name, read_columns)
+    else:
+        if meta is None:
+            meta = build_snapshot(path, sheet_name)
+
+        names = project_columns(meta["header"], read_columns)
+        try:
+            df = read_snapshot(path, sheet_name, names)
+        except (OSError, KeyError, pa.ArrowInvalid):
+            df = None
+
+        # A snapshot whose columns disagree with its sidecar is not trusted
+        if df is None or list(df.columns) != names:
+            meta = build_snapshot(path, sheet_name)
+            names = project_columns(meta["header"], read_columns)
+            df = read_snapshot(path, sheet_name, names)
+
+    return _finish(df, columns, filters)
+
+
+def _read_columns(columns, filters):
+    # Filter columns are read too, then dropped after filtering
+    if columns is not None and filters:
+        return list(columns) + [f.column for f in filters]
+    return columns
+
+
+def _finish(df, columns, filters):
+    """
+    Types, filters and projects a freshly read frame.
+    """
+    from report_utils.mis_schema import apply_schema
+    from report_utils.xlsx_stream import apply_filters
+
+    df = apply_filters(apply_schema(df), filters)
+    if _read_columns(columns, filters) is not columns:
+        df = df[project_columns(df.columns, columns)]
+    return df
+
+
+# ================= SEVERAL SHEETS / FILES =================
+
+def _parse_part(path, sheet_name, columns):
+    """
+    Worker of load_parts: builds the sheet's snapshot (returns None), or
+    without pyarrow returns the parsed sheet itself.
+    """
+    if pa is not None:
+        build_snapshot(path, sheet_name)
+        return None
+    return read_workbook(path, sheet_name, columns)
+
+
+def load_parts(parts, columns=None, filters=None, workers=None):
+    """
+    Loads (path, sheet) parts (several sheets, several files, or both)
+    and returns their frames in order.
+
+    Parts without a fresh snapshot are parsed in parallel worker
+    processes (openpyxl parsing is CPU-bound), at most ``workers``
+    (default PARSE_WORKERS) at a time; the rest load in-process.
+    """
+    parts = [(path, resolve_sheet(path, sheet)) for path, sheet in parts]
+    pending = list(dict.fromkeys(
+        part for part in parts if pa is None or fresh_snapshot(*part) is None
+    ))
+
+    parsed = {}
+    if len(pending) > 1:
+        workers = min(len(pending), workers or PARSE_WORKERS, os.cpu_count() or 1)
+        read_columns = _read_columns(columns, filters)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                part: pool.submit(_parse_part, *part, read_columns) for part in pending
+            }
+            parsed = {part: f.result() for part, f in futures.items()}
+
+    frames = []
+    for part in parts:
+        if parsed.get(part) is not None:
+            frames.append(_finish(parsed[part], columns, filters))
+        else:
+            frames.append(load_mis(*part, columns, filters))
+    return frames
+
+
+def load_sheets(path, sheets, columns=None, filters=None, workers=None):
+    """
+    Loads several sheets of one workbook: {sheet name: frame}. Each entry
+    of ``sheets`` is resolved like load_mis's ``sheet_name``.
+    """
+    names = list(dict.fromkeys(resolve_sheet(path, s) for s in sheets))
+    frames = load_parts([(path, n) for n in names], columns, filters, workers)
+    return dict(zip(names, frames))
@@ -0,0 +1,517 @@
+"""
+Synthetic MIS Generator
+-----------------------
+
+Generates MIS exports of any size with the 57 columns and the
+appointment lifecycle of ``Data/Dummy Dataset.xlsx`` (see
+``Data/readme.md``), so the reports can be run at the row counts of a
+large hospital network.
+
+Lifecycle rules:
+----------------
+    done         booked -> checked in -> consultation -> completed
+                 -> prescription (most rows), event join/leave times,
+                 paid or cash
+    cancelled    booked -> cancelled before the appointment; no
+                 consultation times; paid ones carry a refund
+    no-show      booked only, never checked in, unpaid
+    booked       booked only, paid
+    checked-in   booked -> checked in; no consultation yet
+    consulting   booked -> checked in -> consultation started
+
+Hospitals, statuses, payment types and specialities follow the
+proportions of the dummy dataset. Aster Digital Health appointments are
+"instant" (online) consultations; patients mostly live in their
+hospital's state.
+
+Output:
+-------
+- ``.xlsx``: rows are generated and written CHUNK_ROWS at a time
+  (constant memory). Above the Excel row limit the export is split into
+  ``<name>.part01.xlsx``, ``<name>.part02.xlsx`` ... of SHARD_ROWS rows.
+- ``.parquet``: one file, written chunk by chunk (needs pyarrow).
+
+Output is deterministic for a given seed, row count and end date.
+Appointment dates cover the ``days`` days up to ``end_date`` (default:
+today), so the "yesterday" and "last 15 days" reports select rows.
+
+Usage:
+------
+    python -m report_utils.mis_synth Data/synthetic/MIS_1m.xlsx --rows 1m
+    df = generate_mis(50_000, seed=1)
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import sys
+import math
+import argparse
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from report_utils.report_writer import MAX_ROWS, write_chunks
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet output is optional
+    pa = None
+    pq = None
+
+
+# ================= CONFIG =================
+
+# Rows generated (and written) at a time
+CHUNK_ROWS = 50_000
+
+# Rows per workbook when an export exceeds the Excel row limit
+SHARD_ROWS = MAX_ROWS - 1
+
+# Appointment dates cover this many days, like the dummy dataset
+DAYS = 62
+
+MIS_COLUMNS = [
+    "Patient ID", "UHID", "Patient Name", "Mobile", "DOB", "Gender", "City",
+    "State", "Country", "Patient Type", "Is Primary Profile",
+    "Relationship Type", "Appointment ID", "Appointment Type",
+    "Procedure Type", "Appointment Date", "Appointment Time",
+    "Appointment End Time", "Hospital Name", "Doctor Name", "Doctor HIS ID",
+    "Appt. Payment Status", "Appt. Status", "Booking Source",
+    "Booked DateTime", "booked_time", "Checked In Datetime", "Is Checkedin",
+    "Doctor ID", "Speciality", "Consultation DateTime", "Completed DateTime",
+    "Cancelled Datetime", "Is Re Scheduled", "HIS Invoice No.", "Invoice No",
+    "Amount (₹)", "Discount (₹)", "Registration Fee (₹)",
+    "Convenience Fee (₹)", "Consult Fee (₹)", "CGST", "SGST", "IGST",
+    "Payment Type", "Payment Reference No.", "Refund Amount (₹)", "Room ID",
+    "Is Prescription Generated", "Prescription Generated DateTime",
+    "Event Join Time Patient", "Event Left Time Patient",
+    "Event Join Time Doctor", "Event Left Time Doctor", "Final Remarks",
+    "Consider Patient", "Clean Specialty",
+]
+
+DIGITAL_HOSPITAL = "Aster Digital Health"
+
+# Hospital -> (share of appointments, home state)
+HOSPITALS = {
+    "Aster Whitefield Hospital": (0.366, "Karnataka"),
+    "Aster CMI Hospital": (0.313, "Karnataka"),
+    "Aster RV Hospital": (0.075, "Karnataka"),
+    "Aster Medcity": (0.067, "Kerala"),
+    DIGITAL_HOSPITAL: (0.060, "Karnataka"),
+    "Aster MIMS Kottakkal": (0.031, "Kerala"),
+    "Aster MIMS Hospital, Kannur": (0.030, "Kerala"),
+    "Aster MIMS Hospital, Calicut": (0.030, "Kerala"),
+    "Aster Prime Hospital": (0.016, "Telangana"),
+    "Aster Aadhar Hospital": (0.008, "Maharashtra"),
+    "Aster Mother Hospital, Areekode": (0.004, "Kerala"),
+}
+
+STATES = {
+    "Karnataka": ["Bengaluru", "Bengaluru Urban", "Bengaluru Rural", "Mysuru", "Tumakuru", "Mangaluru"],
+    "Kerala": ["Ernakulam", "Kochi", "Kannur", "Malappuram", "Kozhikode", "Thrissur"],
+    "Andhra Pradesh": ["Anantapur", "Tirupati", "Vijayawada", "Visakhapatnam"],
+    "Telangana": ["Hyderabad", "Warangal", "Secunderabad"],
+    "Maharashtra": ["Kolhapur", "Pune", "Mumbai"],
+    "Tamil Nadu": ["Chennai", "Coimbatore", "Hosur"],
+    "West Bengal": ["Kolkata", "Howrah"],
+}
+
+# Share of patients living outside their hospital's state
+AWAY_SHARE = 0.1
+
+STATUSES = {
+    "done": 0.575, "cancelled": 0.323, "no-show": 0.073,
+    "booked": 0.021, "checked-in": 0.007, "consulting": 0.001,
+}
+
+# (Speciality, Clean Specialty, share)
+SPECIALITIES = [
+    ("Obstetrics & Gynaecology", "Ob-Gyn", 0.166),
+    ("General Medicine,Internal Medicine", "GP/ IM", 0.109),
+    ("General Physician", "GP/ IM", 0.060),
+    ("Paediatrics", "Paed", 0.102),
+    ("Gastroenterology", "Gastro", 0.085),
+    ("Dermatology", "Derma", 0.065),
+    ("Cardiology", "Cardio", 0.055),
+    ("ENT", "ENT", 0.049),
+    ("Endocrinology", "Endo", 0.048),
+    ("Neurology", "Neuro", 0.038),
+    ("Medical Oncology", "Onco", 0.037),
+    ("General Surgery", "General Surgery", 0.030),
+    ("Psychiatry", "Psychiatry", 0.030),
+    ("Nephrology", "Nephro", 0.027),
+    ("Orthopaedics", "Ortho", 0.027),
+    ("Urology", "Uro", 0.018),
+    ("Ophthalmology", "Ophthal", 0.013),
+    ("Rheumatology", "Rheumo", 0.011),
+    ("Clinical Nutrition", "Nutrition", 0.008),
+    ("Pain Management", "Pain Mgmt", 0.006),
+    ("Hepatology", "Liver", 0.006),
+    ("Dental", "Dental", 0.002),
+    ("Reproductive Medicine", "Reproductive", 0.002),
+    ("Physiotherapy", "Others", 0.006),
+]
+
+FIRST_NAMES = [
+    "Aarav", "Aditi", "Anil", "Anjali", "Arjun", "Deepa", "Divya", "Farhan",
+    "Gautam", "Geetha", "Harish", "Ishaan", "Kavya", "Kiran", "Lakshmi",
+    "Manoj", "Meera", "Mohammed", "Nandini", "Naveen", "Neha", "Pooja",
+    "Pradeep", "Priya", "Rahul", "Rajesh", "Ramya", "Ravi", "Rekha", "Rohan",
+    "Sachin", "Sanjay", "Shreya", "Sneha", "Suresh", "Swathi", "Tanvi",
+    "Varun", "Vidya", "Vikram", "Fathima", "Joseph", "Mary", "Thomas",
+    "Abdul", "Ayesha", "George", "Sarah", "Vijay", "Usha",
+]
+LAST_NAMES = [
+    "Nair", "Menon", "Pillai", "Kumar", "Reddy", "Rao", "Shetty", "Gowda",
+    "Iyer", "Sharma", "Verma", "Gupta", "Das", "Joseph", "Thomas", "Khan",
+    "Hegde", "Patil", "Naidu", "Krishnan", "Varghese", "Mathew", "Bhat",
+    "Kamath", "Prabhu", "Hussain", "Babu", "Jain", "Mehta", "Singh",
+]
+
+DOCTORS = 600
+
+GENDERS = {"female": 0.555, "male": 0.4447, "others": 0.0003}
+RELATIONSHIPS = {
+    "self": 0.673, "others": 0.223, "mother": 0.024, "wife": 0.020,
+    "father": 0.014, "husband": 0.012, "son": 0.012, "daughter": 0.012,
+    "spouse": 0.010,
+}
+PAYMENT_TYPES = {"upi": 0.74, "card": 0.17, "wallet": 0.07, "netbanking": 0.02}
+CONSULT_FEES = {800.0: 0.25, 1100.0: 0.18, 1200.0: 0.16, 900.0: 0.11, 1000.0: 0.09,
+                970.0: 0.07, 500.0: 0.07, 700.0: 0.07}
+REGISTRATION_FEES = {350.0: 0.37, 170.0: 0.33, 250.0: 0.12, 50.0: 0.08,
+                     100.0: 0.05, 110.0: 0.04, 200.0: 0.01}
+FINAL_REMARKS = {
+    "Consultation completed.": 0.66, "Left with consent": 0.15,
+    "patient is in Waiting room": 0.06, "paitent left due to doctor left the call": 0.04,
+    "another patient joined from different platform": 0.04,
+    "User joined successfully from 100ms sdk": 0.04,
+    "another doctor joined from different platform": 0.01,
+}
+CONSIDER_PATIENT = {"Yes": 0.963, "No": 0.034, "Maybe": 0.003}
+
+
+# ================= RANDOM HELPERS =================
+
+def _choice(rng, weights, n):
+    """
+    ``n`` draws from {value: weight} (weights need not sum to 1).
+    """
+    values = np.array(list(weights), dtype=object)
+    p = np.array(list(weights.values()), dtype=float)
+    return values[rng.choice(len(values), size=n, p=p / p.sum())]
+
+
+def _hex(rng, n, digits):
+    """
+    ``n`` random hex strings of ``digits`` characters.
+    """
+    raw = rng.bytes(n * ((digits + 1) // 2)).hex()
+    step = len(raw) // n if n else 0
+    return np.array([raw[i:i + digits] for i in range(0, n * step, step)], dtype=object)
+
+
+def _uuids(rng, n):
+    raw = _hex(rng, n, 32)
+    return np.array(
+        [f"{h[:8]}-{h[8:12]}-4{h[13:16]}-a{h[17:20]}-{h[20:]}" for h in raw],
+        dtype=object
+    )
+
+
+def _alnum(rng, n, length):
+    """
+    ``n`` random strings of ``length`` letters/digits.
+    """
+    alphabet = np.frombuffer(
+        b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789", dtype=np.uint8
+    )
+    codes = alphabet[rng.integers(0, len(alphabet), size=(n, length))]
+    return codes.view(f"S{length}").ravel().astype(f"U{length}").astype(object)
+
+
+def _minutes(rng, low, high, n):
+    return pd.to_timedelta(rng.integers(low, high + 1, n), unit="min")
+
+
+def _where(mask, values):
+    """
+    ``values`` where ``mask`` is set, missing elsewhere (datetimes -> NaT).
+    """
+    if isinstance(values, (pd.DatetimeIndex, pd.Series)) and pd.api.types.is_datetime64_any_dtype(values):
+        return pd.Series(values).where(mask).to_numpy()
+    out = np.full(len(mask), np.nan, dtype=object)
+    out[mask] = np.asarray(values, dtype=object)[mask]
+    return out
+
+
+def _doctors(seed):
+    """
+    Fixed doctor roster: name, HIS ID, ID, speciality, clean specialty.
+    """
+    rng = np.random.default_rng([seed, 1_000_000])
+    spec = rng.choice(
+        len(SPECIALITIES), size=DOCTORS,
+        p=np.array([s[2] for s in SPECIALITIES]) / sum(s[2] for s in SPECIALITIES)
+    )
+    first = np.array(FIRST_NAMES, dtype=object)[rng.integers(0, len(FIRST_NAMES), DOCTORS)]
+    last = np.array(LAST_NAMES, dtype=object)[rng.integers(0, len(LAST_NAMES), DOCTORS)]
+    return {
+        "name": np.array([f"Dr. {f} {l}" for f, l in zip(first, last)], dtype=object),
+        "his_id": rng.choice(np.arange(100_000, 1_000_000), size=DOCTORS, replace=False),
+        "id": _uuids(rng, DOCTORS),
+        "speciality": np.array([SPECIALITIES[i][0] for i in spec], dtype=object),
+        "clean": np.array([SPECIALITIES[i][1] for i in spec], dtype=object),
+    }
+
+
+# ================= GENERATOR =================
+
+def generate_chunk(rows, seed=0, chunk=0, end_date=None, days=DAYS, first_row=0):
+    """
+    One chunk of synthetic MIS rows. ``chunk`` makes every chunk of an
+    export draw different (but reproducible) values; ``first_row``
+    numbers the invoices.
+    """
+    rng = np.random.default_rng([seed, chunk])
+    end_date = end_date or date.today()
+    n = rows
+
+    # ---------- patient ----------
+    hospital = _choice(rng, {h: w for h, (w, _) in HOSPITALS.items()}, n)
+    home = np.array([HOSPITALS[h][1] for h in hospital], dtype=object)
+    away = rng.random(n) < AWAY_SHARE
+    state = np.where(away, np.array(list(STATES), dtype=object)[rng.integers(0, len(STATES), n)], home)
+    city = np.array(
+        [STATES[s][i % len(STATES[s])] for s, i in zip(state, rng.integers(0, 60, n))],
+        dtype=object
+    )
+
+    first = np.array(FIRST_NAMES, dtype=object)[rng.integers(0, len(FIRST_NAMES), n)]
+    last = np.array(LAST_NAMES, dtype=object)[rng.integers(0, len(LAST_NAMES), n)]
+    dob = (
+        np.datetime64("1940-01-01") + rng.integers(0, 80 * 365, n).astype("timedelta64[D]")
+    ).astype(str).astype(object)
+
+    # ---------- appointment ----------
+    status = _choice(rng, STATUSES, n)
+    done = status == "done"
+    cancelled = status == "cancelled"
+    checked_in = np.isin(status, ["done", "checked-in", "consulting"])
+    consulted = np.isin(status, ["done", "consulting"])
+
+    digital = hospital == DIGITAL_HOSPITAL
+    procedure = np.where(
+        digital, "instant",
+        np.where(rng.random(n) < 0.85, "consultation", "video consultation")
+    ).astype(object)
+    online = procedure != "consultation"
+
+    first_day = pd.Timestamp(end_date) - pd.Timedelta(days=days - 1)
+    appt_date = first_day + pd.to_timedelta(rng.integers(0, days, n), unit="D")
+    # 15-minute slots between 08:00 and 20:45
+    appt_time = appt_date + pd.to_timedelta(8 * 60 + 15 * rng.integers(0, 52, n), unit="min")
+    booked = (
+        appt_time - pd.to_timedelta(rng.integers(1, 11, n), unit="D")
+        + _minutes(rng, -240, 240, n)
+    )
+
+    doctors = _doctors(seed)
+    doc = rng.integers(0, DOCTORS, n)
+
+    # ---------- lifecycle timestamps ----------
+    checkin = appt_time + _minutes(rng, 0, 10, n)
+    consultation = checkin + _minutes(rng, 0, 5, n)
+    completed = consultation + _minutes(rng, 5, 20, n)
+    with_rx = done & (rng.random(n) < 0.9)
+    prescription = completed + _minutes(rng, 0, 5, n)
+    cancelled_at = booked + (appt_time - booked) * rng.random(n)
+
+    # ---------- payment ----------
+    payment = np.full(n, np.nan, dtype=object)
+    payment[done] = np.where(rng.random(done.sum()) < 0.925, "paid", "cash")
+    payment[np.isin(status, ["booked", "consulting"])] = "paid"
+    payment[status == "checked-in"] = np.where(rng.random((status == "checked-in").sum()) < 0.9, "paid", "cash")
+    paid_cancel = cancelled & (rng.random(n) < 0.18)
+    payment[paid_cancel] = "paid"
+    paid = payment == "paid"
+    cash = payment == "cash"
+    charged = paid | cash
+
+    new_patient = rng.random(n) < 0.22
+    consult_fee = _choice(rng, CONSULT_FEES, n).astype(float)
+    consult_fee[cash] = 1.0
+    registration = np.where(
+        new_patient & charged & (rng.random(n) < 0.9),
+        _choice(rng, REGISTRATION_FEES, n).astype(float), np.nan
+    )
+    discount = np.where(charged & (rng.random(n) < 0.002), _choice(rng, {120.0: 7, 135.0: 4, 100.0: 3}, n).astype(float), np.nan)
+    amount = consult_fee + np.nan_to_num(registration) - np.nan_to_num(discount)
+    amount = np.where(charged, amount, np.nan)
+
+    row_no = first_row + np.arange(n)
+
+    df = pd.DataFrame({
+        "Patient ID": _uuids(rng, n),
+        "UHID": rng.integers(200_000_000, 800_000_000, n),
+        "Patient Name": np.char.add(np.char.add(first.astype(str), " "), last.astype(str)).astype(object),
+        "Mobile": rng.integers(6_000_000_000, 10_000_000_000, n),
+        "DOB": dob,
+        "Gender": _choice(rng, GENDERS, n),
+        "City": city,
+        "State": state,
+        "Country": "India",
+        "Patient Type": np.where(new_patient, "New", "Existing").astype(object),
+        "Is Primary Profile": np.where(rng.random(n) < 0.29, "Yes", "No").astype(object),
+        "Relationship Type": _choice(rng, RELATIONSHIPS, n),
+        "Appointment ID": _uuids(rng, n),
+        "Appointment Type": "opd",
+        "Procedure Type": procedure,
+        "Appointment Date": appt_date,
+        "Appointment Time": appt_time,
+        "Appointment End Time": appt_time + pd.Timedelta(minutes=30),
+        "Hospital Name": hospital,
+        "Doctor Name": doctors["name"][doc],
+        "Doctor HIS ID": doctors["his_id"][doc],
+        "Appt. Payment Status": payment,
+        "Appt. Status": status,
+        "Booking Source": "patient_app",
+        "Booked DateTime": booked,
+        "booked_time": pd.DatetimeIndex(booked).strftime("%I:%M:%S %p").to_numpy(dtype=object),
+        "Checked In Datetime": _where(checked_in, checkin),
+        "Is Checkedin": np.where(checked_in, "Yes", "No").astype(object),
+        "Doctor ID": doctors["id"][doc],
+        "Speciality": doctors["speciality"][doc],
+        "Consultation DateTime": _where(consulted, consultation),
+        "Completed DateTime": _where(done, completed),
+        "Cancelled Datetime": _where(cancelled, cancelled_at),
+        "Is Re Scheduled": np.where(rng.random(n) < 0.043, "Yes", "No").astype(object),
+        "HIS Invoice No.": _where(charged, np.array(
+            [f"OP{a}/CR{b}/{c}" for a, b, c in zip(
+                rng.integers(1, 10, n), rng.integers(10, 100, n), rng.integers(10, 100, n))],
+            dtype=object)),
+        "Invoice No": _where(charged, np.array([f"ADH/24-25/RM/{i:07d}" for i in row_no], dtype=object)),
+        "Amount (₹)": amount,
+        "Discount (₹)": discount,
+        "Registration Fee (₹)": registration,
+        "Convenience Fee (₹)": np.where(charged, 1.0, np.nan),
+        "Consult Fee (₹)": np.where(charged, consult_fee, np.nan),
+        "CGST": np.nan,
+        "SGST": np.nan,
+        "IGST": np.nan,
+        "Payment Type": _where(paid, _choice(rng, PAYMENT_TYPES, n)),
+        "Payment Reference No.": _where(paid, "pay_" + _alnum(rng, n, 14)),
+        "Refund Amount (₹)": np.where(paid_cancel, amount, np.nan),
+        "Room ID": _where(online, _hex(rng, n, 13)),
+        "Is Prescription Generated": np.where(with_rx, "Yes", "No").astype(object),
+        "Prescription Generated DateTime": _where(with_rx, prescription),
+        "Event Join Time Patient": _where(consulted, consultation),
+        "Event Left Time Patient": _where(done, completed + _minutes(rng, 0, 2, n)),
+        "Event Join Time Doctor": _where(consulted, consultation - _minutes(rng, 0, 1, n)),
+        "Event Left Time Doctor": _where(done, completed + _minutes(rng, 0, 1, n)),
+        "Final Remarks": _where(done & online, _choice(rng, FINAL_REMARKS, n)),
+        "Consider Patient": _choice(rng, CONSIDER_PATIENT, n),
+        "Clean Specialty": doctors["clean"][doc],
+    })
+    return df[MIS_COLUMNS]
+
+
+def iter_chunks(rows, seed=0, end_date=None, days=DAYS, chunk_rows=CHUNK_ROWS, first_row=0):
+    """
+    Yields rows ``first_row`` .. ``first_row + rows`` of an export as
+    frames of at most ``chunk_rows`` rows. Chunk ``k`` always holds
+    export rows ``k * chunk_rows`` onwards, so a row has the same values
+    however the export is split into shards.
+    """
+    end = first_row + rows
+    for k in range(first_row // chunk_rows, math.ceil(end / chunk_rows)):
+        base = k * chunk_rows
+        df = generate_chunk(chunk_rows, seed, chunk=k, end_date=end_date, days=days, first_row=base)
+        lo, hi = max(first_row, base) - base, min(end, base + chunk_rows) - base
+        yield df.iloc[lo:hi].reset_index(drop=True)
+
+
+def generate_mis(rows, seed=0, end_date=None, days=DAYS):
+    """
+    A synthetic MIS export as one DataFrame (in memory).
+    """
+    return pd.concat(list(iter_chunks(rows, seed, end_date, days)), ignore_index=True)
+
+
+# ================= OUTPUT =================
+
+def shard_paths(path, rows):
+    """
+    Workbook path(s) for an export of ``rows`` rows: the path itself, or
+    ``<name>.partNN.xlsx`` shards of SHARD_ROWS rows.
+    """
+    shards = max(1, math.ceil(rows / SHARD_ROWS))
+    if shards == 1:
+        return [path]
+    root, ext = os.path.splitext(path)
+    return [f"{root}.part{i + 1:02d}{ext}" for i in range(shards)]
+
+
+def write_mis(path, rows, seed=0, end_date=None, days=DAYS, log=print):
+    """
+    Writes a synthetic export to ``path`` (.xlsx, sharded above the
+    Excel row limit, or .parquet). Returns the paths written.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    if path.lower().endswith(".parquet"):
+        if pa is None:
+            raise RuntimeError("Parquet output needs pyarrow")
+        writer = None
+        try:
+            for df in iter_chunks(rows, seed, end_date, days):
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        log(f"Synthetic MIS written: {path} ({rows} rows)")
+        return [path]
+
+    paths = shard_paths(path, rows)
+    for i, shard in enumerate(paths):
+        first = i * SHARD_ROWS
+        count = min(SHARD_ROWS, rows - first)
+        write_chunks(shard, iter_chunks(count, seed, end_date, days, first_row=first))
+        log(f"Synthetic MIS written: {shard} ({count} rows)")
+    return paths
+
+
+def parse_rows(text):
+    """
+    Row count from text such as "10000", "250k" or "5m".
+    """
+    text = str(text).strip().lower().replace("_", "").replace(",", "")
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    number = text[:-1] if scale != 1 else text
+    return int(float(number) * scale)
+
+
+# ================= CLI =================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m report_utils.mis_synth")
+    parser.add_argument("path", help="output .xlsx or .parquet")
+    parser.add_argument("--rows", type=parse_rows, default=10_000, help="e.g. 10k, 1m, 5m")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--days", type=int, default=DAYS)
+    parser.add_argument("--end-date", type=lambda s: datetime.strptime(s, "%Y-%m-%d").date(),
+                        default=None, help="last appointment date (default: today)")
+    args = parser.parse_args(argv)
+
+    write_mis(args.path, args.rows, args.seed, args.end_date, args.days)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
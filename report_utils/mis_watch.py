@@ -0,0 +1,179 @@
+"""
+MIS Readiness Watcher
+---------------------
+
+Detects when today's MIS workbook has landed and finished writing.
+
+The schedulers used to check ``os.path.getmtime`` every 30 minutes, so a
+batch started up to 30 minutes after the MIS arrived. They also only
+compared the date: a workbook still being copied, but touched today, was
+processed half-written.
+
+Here a file-system watcher (watchdog: inotify on Linux,
+ReadDirectoryChangesW on Windows) wakes up as soon as the workbook is
+written or closed, with polling every POLL_SECONDS as a fallback when
+watchdog is not installed (or misses an event on a network share).
+
+A workbook counts as ready when:
+--------------------------------
+1. It was modified today.
+2. Size, mtime and SHA-256 are unchanged over STABLE_SECONDS.
+3. It opens as a zip whose central directory lists the workbook parts
+   (``[Content_Types].xml``, ``xl/workbook.xml``); a truncated copy fails
+   here.
+
+Usage:
+------
+    wait_until_ready(MIS_FILE_PATH, log=log_message)      # blocks (local)
+    check_ready(MIS_FILE_PATH)                            # one short check (Jenkins)
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import time
+import zipfile
+import threading
+from datetime import datetime
+
+from report_utils.mis_snapshot import file_sha256
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # event-driven watching is optional
+    FileSystemEventHandler = object
+    Observer = None
+
+
+# ================= CONFIG =================
+
+# The workbook must be unchanged for this long before it is used
+STABLE_SECONDS = 20
+
+# Fallback polling interval (and safety net next to the watcher)
+POLL_SECONDS = 60
+
+# Parts every .xlsx contains
+REQUIRED_PARTS = ("[Content_Types].xml", "xl/workbook.xml")
+
+
+# ================= CHECKS =================
+
+def modified_today(path):
+    """
+    True if the file exists and was modified today.
+    """
+    try:
+        modified = datetime.fromtimestamp(os.path.getmtime(path))
+    except OSError:
+        return False
+    return modified.date() == datetime.now().date()
+
+
+def _state(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def valid_workbook(path):
+    """
+    True if the zip central directory is readable and lists the workbook
+    parts. Does not decompress anything.
+    """
+    try:
+        with zipfile.ZipFile(path) as zf:
+            names = set(zf.namelist())
+    except (OSError, zipfile.BadZipFile):
+        return False
+    return all(part in names for part in REQUIRED_PARTS)
+
+
+def is_stable(path, window=STABLE_SECONDS):
+    """
+    True if size, mtime and content hash do not change over ``window``
+    seconds and the workbook structure is valid.
+    """
+    try:
+        before = _state(path)
+        digest = file_sha256(path)
+        time.sleep(window)
+        if _state(path) != before:
+            return False
+        if file_sha256(path) != digest:
+            return False
+    except OSError:
+        return False
+    return valid_workbook(path)
+
+
+def check_ready(path, window=STABLE_SECONDS, log=print):
+    """
+    One readiness check: modified today and stable. Takes about
+    ``window`` seconds when the file was modified today, no time otherwise.
+    """
+    if not modified_today(path):
+        return False
+    if not is_stable(path, window):
+        log(f"MIS file is still being written (or is not a valid workbook): {path}")
+        return False
+    return True
+
+
+# ================= WATCHER =================
+
+class _Changed(FileSystemEventHandler):
+    """
+    Sets ``event`` when the watched file is created, written, closed or
+    moved into place.
+    """
+
+    def __init__(self, path, event):
+        self.path = os.path.normcase(os.path.abspath(path))
+        self.event = event
+
+    def _matches(self, src):
+        return os.path.normcase(os.path.abspath(src)) == self.path
+
+    def on_any_event(self, event):
+        if event.event_type not in ("created", "modified", "closed", "moved"):
+            return
+        if self._matches(event.src_path) or self._matches(getattr(event, "dest_path", "") or ""):
+            self.event.set()
+
+
+def wait_until_ready(path, timeout=None, window=STABLE_SECONDS,
+                     poll_seconds=POLL_SECONDS, log=print):
+    """
+    Blocks until the workbook is ready (see module docstring). Returns
+    True when ready, False if ``timeout`` seconds pass first.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    changed = threading.Event()
+    observer = None
+
+    folder = os.path.dirname(os.path.abspath(path))
+    if Observer is not None and os.path.isdir(folder):
+        observer = Observer()
+        observer.schedule(_Changed(path, changed), folder, recursive=False)
+        observer.start()
+        log(f"Watching {path} for changes")
+    else:
+        log(f"Polling {path} every {poll_seconds}s (watchdog not available)")
+
+    try:
+        while True:
+            if check_ready(path, window, log):
+                return True
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+
+            # Woken by a file event, or by the polling interval
+            changed.wait(poll_seconds if remaining is None else min(poll_seconds, remaining))
+            changed.clear()
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
@@ -0,0 +1,312 @@
+"""
+Report Output Cache
+-------------------
+
+Content-addressed store of report workbooks, so a rerun on the same MIS
+reuses the previous output instead of parsing and filtering again.
+
+Jenkins reruns, manual reruns and both schedulers firing on the same day
+used to rebuild every report from scratch, even when the MIS was byte
+for byte the same. A report's outputs are now stored under a key made
+of:
+
+    mis         SHA-256 of the MIS workbook (of every shard for a
+                sharded export, see mis_shards.py)
+    definition  hash of the report definition (its spec, or the column
+                list of the sanitised export)
+    as_of       the report date
+    code        hash of the report script and report_utils/*.py
+
+A run whose key is already stored copies the cached workbook(s) to the
+output paths and goes straight to the mail step: the MIS is not parsed.
+
+The Completed report is not cached: its output is "rows not sent
+before", which depends on the sent-key store as much as on the MIS.
+Fan-out specs (one workbook per region / hospital with rows) are not
+cached either: their outputs are only known after the run.
+
+Rebuilding on purpose:
+----------------------
+    python main.py --force
+    REPORT_CACHE_FORCE=1          (e.g. a Jenkins build parameter; the
+                                   report jobs inherit it)
+
+Layout (``.report_cache/`` at the repository root, or REPORT_CACHE_DIR):
+-----------------------------------------------------------------------
+    <key>/entry.json              key parts, files, size, last use
+    <key>/0_<output name>         the stored workbook(s)
+
+The directory is kept under REPORT_CACHE_MAX_MB (default MAX_MB): after
+every store the least recently used entries are removed.
+
+Usage:
+------
+    CACHE_KEY = output_key(input_file, SPEC, today, [__file__])
+    if not reuse_outputs(CACHE_KEY, OUTPUT_FILES):
+        run_report(load_mis(...))
+        keep_outputs(CACHE_KEY, OUTPUT_FILES)
+
+    python -m report_utils.output_cache            # entries and size
+    python -m report_utils.output_cache --clear
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import sys
+import glob
+import json
+import shutil
+import hashlib
+from datetime import datetime
+
+from report_utils.mis_shards import source_sha256
+
+
+# ================= CONFIG =================
+
+CACHE_DIR_ENV = "REPORT_CACHE_DIR"
+MAX_MB_ENV = "REPORT_CACHE_MAX_MB"
+FORCE_ENV = "REPORT_CACHE_FORCE"
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_FOLDER = ".report_cache"
+
+FORCE_FLAG = "--force"
+
+# Default size bound of the cache directory (MB)
+MAX_MB = 1024
+
+ENTRY_FILE = "entry.json"
+
+_UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ================= KEYS =================
+
+def _hash_files(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def code_version(paths=()):
+    """
+    Hash of the given scripts and every report_utils module: any code
+    change gives new keys.
+    """
+    utils = sorted(glob.glob(os.path.join(_UTILS_DIR, "*.py")))
+    return _hash_files(list(paths) + utils)
+
+
+def definition_hash(definition):
+    """
+    Hash of a report definition (spec dict, column list, ...). Keys
+    starting with "__" (e.g. the spec's own path) are ignored.
+    """
+    if isinstance(definition, dict):
+        definition = {k: v for k, v in definition.items() if not str(k).startswith("__")}
+    text = json.dumps(definition, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def output_key(mis_path, definition, as_of=None, code_paths=()):
+    """
+    Cache key of a report run: (key, parts).
+    """
+    parts = {
+        "mis": source_sha256(mis_path),
+        "definition": definition_hash(definition),
+        "as_of": None if as_of is None else str(as_of),
+        "code": code_version(code_paths),
+    }
+    key = hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+    return key, parts
+
+
+def force_requested(argv=None):
+    """
+    True when the run was started with --force or REPORT_CACHE_FORCE=1.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    return FORCE_FLAG in argv or os.getenv(FORCE_ENV, "").strip().lower() in ("1", "true", "yes")
+
+
+# ================= CACHE =================
+
+class OutputCache:
+    """
+    Directory of cached outputs, bounded in size (least recently used
+    entries go first).
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = (
+            directory or os.getenv(CACHE_DIR_ENV) or os.path.join(REPO_ROOT, CACHE_FOLDER)
+        )
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv(MAX_MB_ENV) or MAX_MB) * 2**20)
+        self.max_bytes = max_bytes
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def _read_entry(self, key):
+        try:
+            with open(os.path.join(self._entry_dir(key), ENTRY_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def restore(self, key, paths):
+        """
+        Copies the cached outputs of ``key`` to ``paths`` (same order as
+        stored). Returns False when the key is not cached.
+        """
+        entry = self._read_entry(key)
+        if entry is None or len(entry["files"]) != len(paths):
+            return False
+
+        folder = self._entry_dir(key)
+        for name, path in zip(entry["files"], paths):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            shutil.copyfile(os.path.join(folder, name), path)
+
+        # The entry file's mtime is the last use (LRU order)
+        os.utime(os.path.join(folder, ENTRY_FILE))
+        return True
+
+    def store(self, key, paths, parts=None):
+        """
+        Copies ``paths`` into the cache under ``key``, then evicts down
+        to the size bound. Returns False when an output is missing.
+        """
+        if not all(os.path.isfile(p) for p in paths):
+            return False
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = os.path.join(self.directory, f".{key}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        files = []
+        for i, path in enumerate(paths):
+            name = f"{i}_{os.path.basename(path)}"
+            shutil.copyfile(path, os.path.join(tmp, name))
+            files.append(name)
+
+        with open(os.path.join(tmp, ENTRY_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "key": key,
+                "parts": parts,
+                "files": files,
+                "bytes": sum(os.path.getsize(p) for p in paths),
+                "created": datetime.now().isoformat(timespec="seconds"),
+            }, f, indent=2)
+
+        # Readers never see a half-written entry
+        target = self._entry_dir(key)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+
+        self.evict()
+        return True
+
+    def entries(self):
+        """
+        [(last use, bytes, key)] of every complete entry, oldest first.
+        """
+        out = []
+        for entry_path in glob.glob(os.path.join(self.directory, "*", ENTRY_FILE)):
+            folder = os.path.dirname(entry_path)
+            try:
+                size = sum(
+                    os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder)
+                )
+                out.append((os.path.getmtime(entry_path), size, os.path.basename(folder)))
+            except OSError:
+                continue  # removed by a concurrent eviction
+        return sorted(out)
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits
+        ``max_bytes``. Returns the number removed.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# ================= REPORT HELPERS =================
+
+def reuse_outputs(key, paths, force=None, cache=None, log=print):
+    """
+    Restores a report's outputs from the cache. Returns True when they
+    were reused (the report only has to send them).
+    """
+    key, _ = key
+    if force_requested() if force is None else force:
+        log("Cache bypassed (--force): rebuilding the report")
+        return False
+
+    try:
+        hit = (cache or OutputCache()).restore(key, paths)
+    except OSError as e:
+        log(f"Cached outputs not restored: {e}")
+        return False
+
+    if hit:
+        log(f"Reusing cached outputs (same MIS, definition, date and code): {', '.join(paths)}")
+    return hit
+
+
+def keep_outputs(key, paths, cache=None, log=print):
+    """
+    Stores a report's outputs after a full run. A failure is logged and
+    does not affect the report.
+    """
+    key, parts = key
+    try:
+        (cache or OutputCache()).store(key, paths, parts)
+    except OSError as e:
+        log(f"Outputs not cached: {e}")
+
+
+# ================= CLI =================
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    cache = OutputCache()
+
+    if "--clear" in argv:
+        cache.clear()
+        print(f"Cache cleared: {cache.directory}")
+        return 0
+
+    entries = cache.entries()
+    total = sum(size for _, size, _ in entries)
+    print(
+        f"{cache.directory}: {len(entries)} entr{'y' if len(entries) == 1 else 'ies'}, "
+        f"{total / 2**20:.1f} of {cache.max_bytes / 2**20:.0f} MB"
+    )
+    for used, size, key in reversed(entries):
+        print(f"  {key[:16]}  {size / 2**20:8.1f} MB  last used {datetime.fromtimestamp(used):%Y-%m-%d %H:%M}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
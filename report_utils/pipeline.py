@@ -0,0 +1,334 @@
+"""
+In-Process Report Pipeline
+--------------------------
+
+Runs every report against one shared MIS DataFrame inside a single
+Python process.
+
+The schedulers used to start a fresh ``python`` subprocess per report,
+so each report paid for interpreter start-up, the pandas import and a
+full MIS load. Here the MIS is loaded once and every report script is
+imported and called as a stage.
+
+Stage contract:
+---------------
+- A report script exposes ``run_report(df)``; for a backfill (see
+  backfill.py) it is called as ``run_report(df, as_of=..., send=...)``
+  once per run date.
+- It may declare ``MIS_COLUMNS``, the MIS columns it reads. The pipeline
+  loads the union of all declared columns; a stage without the list
+  makes the pipeline load every column.
+- It may declare ``MIS_SHEETS``, its preferred sheet names (see
+  load_mis). Stages whose preferences resolve to the same sheet share
+  one load; a stage that wants another sheet gets its own.
+- Stages are named ``<folder>/<file>``; a second script with the name
+  of an earlier stage is not run and is logged as failed.
+- ``df`` is shared by all stages and must be treated as read-only.
+- A stage that raises (or calls ``sys.exit`` with a non-zero code) is
+  logged as failed; the remaining stages still run.
+- A report spec (``.toml``, see report_spec.py) can be passed instead of
+  a script; it writes its own outputs and mail.
+- A spec whose outputs are cached for this MIS, day and code (see
+  output_cache.py) is not run: the cached workbooks are restored and
+  mailed. When every stage is cached the MIS is not loaded at all.
+  ``--force`` rebuilds.
+- ``--as-of`` / ``--from`` / ``--to`` run every stage once per date on
+  the same loaded frame (``--mail`` also queues each day's mail). A
+  stage whose ``run_report`` takes no ``as_of`` (Ops Sanitization) has
+  no run date and is skipped in a backfill.
+
+Usage:
+------
+    python -m report_utils.pipeline <MIS workbook> <report script|spec> [...] [--force]
+    python -m report_utils.pipeline <MIS workbook> <...> --from 2026-10-10 --to 2026-10-14
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import re
+import sys
+import time
+import inspect
+import traceback
+import importlib.util
+from datetime import date
+
+from report_utils.backfill import RunDates, parse_run_dates
+from report_utils.metrics import ReportMetrics, report_metrics
+from report_utils.mis_shards import is_sharded
+from report_utils.mis_snapshot import load_mis, resolve_sheet
+from report_utils.output_cache import FORCE_FLAG, keep_outputs, output_key, reuse_outputs
+from report_utils.report_spec import load_spec, send_spec_mail, spec_outputs, spec_stage
+
+
+# ================= STAGE REGISTRY =================
+
+# Name of the callable every report script exposes
+STAGE_FUNCTION = "run_report"
+
+# Optional list of MIS columns a report script reads
+STAGE_COLUMNS = "MIS_COLUMNS"
+
+# Optional list of preferred MIS sheet names of a report script
+STAGE_SHEETS = "MIS_SHEETS"
+
+# Declarative report specs run without a script
+SPEC_SUFFIX = ".toml"
+
+# Registered stages, in execution order: name -> {"func", "columns", "sheets"}
+STAGES = {}
+
+
+def stage_name(script_path):
+    """
+    Readable stage name, e.g. "Dropout_Consultation_Report/main.py".
+    """
+    folder = os.path.basename(os.path.dirname(os.path.abspath(script_path)))
+    return f"{folder}/{os.path.basename(script_path)}"
+
+
+def load_stage(script_path):
+    """
+    Imports a report script by file path and returns (callable, columns,
+    sheets). The script's ``__main__`` block is not executed. Spec files
+    are compiled instead of imported.
+    """
+    if script_path.lower().endswith(SPEC_SUFFIX):
+        return (*spec_stage(script_path), None)
+
+    module_name = "report_stage_" + re.sub(r"\W+", "_", stage_name(script_path))
+    spec = importlib.util.spec_from_file_location(module_name, script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return (
+        getattr(module, STAGE_FUNCTION),
+        getattr(module, STAGE_COLUMNS, None),
+        getattr(module, STAGE_SHEETS, None),
+    )
+
+
+def register_stage(name, func, columns=None, sheets=None):
+    """
+    Adds a stage to the pipeline. ``columns`` = MIS columns it reads
+    (None = all columns), ``sheets`` = its preferred sheet names (None =
+    the pipeline's sheet). A name already registered raises ValueError.
+    """
+    if name in STAGES:
+        raise ValueError(f"Duplicate stage name '{name}'")
+    STAGES[name] = {"func": func, "columns": columns, "sheets": sheets}
+
+
+def required_columns(names=None):
+    """
+    Union of the columns the registered stages ``names`` (default: all)
+    read, or None when at least one of them needs the full frame.
+    """
+    union = []
+    for name in STAGES if names is None else names:
+        stage = STAGES[name]
+        if stage["columns"] is None:
+            return None
+        union.extend(c for c in stage["columns"] if c not in union)
+    return union
+
+
+def sheet_groups(mis_path, sheet_name=0):
+    """
+    Registered stages grouped by the sheet they read: a list of
+    (sheet selection, stage names), one MIS load each. Preferences are
+    resolved against the workbook, so ``["Export"]`` and ``0`` share a
+    load when Export is the first sheet. Shards may order their sheets
+    differently (and a workbook that cannot be read fails in load_mis),
+    so their preferences are then only grouped when identical.
+    """
+    groups = {}
+    for name, stage in STAGES.items():
+        wanted = sheet_name if stage["sheets"] is None else stage["sheets"]
+        if isinstance(wanted, (list, tuple)):
+            wanted = list(wanted)
+        key = repr(wanted)
+        if not is_sharded(mis_path):
+            try:
+                key = resolve_sheet(mis_path, wanted)
+            except (OSError, ValueError, IndexError, KeyError):
+                pass
+        groups.setdefault(key, (wanted, []))[1].append(name)
+    return list(groups.values())
+
+
+# ================= EXECUTION =================
+
+def run_stage(name, func, df, log=print, **kwargs):
+    """
+    Runs one stage with error isolation and returns a result dict.
+    ``kwargs`` (as_of, send) are passed on to the stage.
+    """
+    log(f"Stage {name} started")
+    started = time.perf_counter()
+    status, error = "ok", None
+
+    try:
+        func(df, **kwargs)
+    except SystemExit as e:
+        # Reports exit early on purpose (e.g. "nothing new to send")
+        if e.code not in (None, 0):
+            status, error = "failed", f"exit code {e.code}"
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+        log(traceback.format_exc().rstrip())
+
+    seconds = round(time.perf_counter() - started, 2)
+
+    if status == "ok":
+        log(f"Stage {name} completed in {seconds}s")
+    else:
+        log(f"Stage {name} FAILED after {seconds}s: {error}")
+
+    return {"stage": name, "status": status, "seconds": seconds, "error": error}
+
+
+def reuse_spec(mis_path, script, force=None, log=print, as_of=None, send=True):
+    """
+    Restores and mails a spec's cached outputs for run date ``as_of``
+    (default today). Returns (reused, cache key, output paths); the key
+    is stored again after a full run.
+    """
+    spec = load_spec(script)
+    # A fan-out writes one workbook per group with rows, so its outputs
+    # are only known after the run: it is always rebuilt
+    if spec.get("fanout") is not None:
+        return False, None, []
+
+    key = output_key(mis_path, spec, as_of or date.today())
+    outputs = spec_outputs(spec, as_of)
+
+    if not reuse_outputs(key, outputs, force, log=log):
+        return False, key, outputs
+
+    if send:
+        with report_metrics(script).stage("mail"):
+            send_spec_mail(spec, outputs, as_of)
+    return True, key, outputs
+
+
+def run_pipeline(mis_path, script_paths, log=print, sheet_name=0, force=None, run=None):
+    """
+    Loads the MIS once and runs every report script against it, once
+    per run date of ``run`` (RunDates; default: today only).
+    Returns one result dict per script and date.
+    """
+    run = run or RunDates([date.today()])
+    results = []
+    cached = {}
+    days = {}
+    STAGES.clear()
+
+    for script in script_paths:
+        name = stage_name(script)
+        if name in days:
+            # Stages are keyed by name: a second one would replace the first
+            log(f"Stage {name} is listed more than once ({script}): not run")
+            results.append({
+                "stage": name, "status": "failed", "seconds": 0.0,
+                "error": f"duplicate stage name: {script}",
+            })
+            continue
+        try:
+            days[name] = list(run.dates)
+            if script.lower().endswith(SPEC_SUFFIX):
+                for as_of in run.dates:
+                    reused, key, outputs = reuse_spec(
+                        mis_path, script, force, log, as_of, run.mail
+                    )
+                    label = _day_label(name, as_of, run)
+                    if reused:
+                        log(f"Stage {label} reused its cached outputs")
+                        results.append({"stage": label, "status": "ok", "seconds": 0.0, "error": None})
+                        days[name].remove(as_of)
+                    elif key is not None:
+                        cached[label] = (key, outputs)
+                if not days[name]:
+                    continue
+
+            register_stage(name, *load_stage(script))
+        except Exception as e:
+            log(f"Stage {name} could not be loaded: {type(e).__name__}: {e}")
+            results.append(
+                {"stage": name, "status": "failed", "seconds": 0.0, "error": str(e)}
+            )
+
+    if not STAGES:
+        return results
+
+    groups = sheet_groups(mis_path, sheet_name)
+    frames = {}
+    for wanted, names in groups:
+        sheet = "" if len(groups) == 1 else f" (sheet {wanted!r})"
+        log(f"Loading MIS once for {len(names)} stage(s){sheet}: {mis_path}")
+        started = time.perf_counter()
+        with ReportMetrics("pipeline").stage("load") as st:
+            df = load_mis(mis_path, wanted, columns=required_columns(names))
+            st.rows = len(df)
+        log(
+            f"MIS loaded: {len(df)} rows x {len(df.columns)} columns "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        frames.update((name, df) for name in names)
+
+    for name, stage in list(STAGES.items()):
+        df = frames[name]
+        if run.backfill and not _takes_run_date(stage["func"]):
+            log(f"Stage {name} has no run date: skipped in a backfill")
+            results.append({"stage": name, "status": "skipped", "seconds": 0.0, "error": None})
+            continue
+
+        for as_of in days[name]:
+            label = _day_label(name, as_of, run)
+            # A plain run calls the stage exactly as before: run_report(df)
+            kwargs = {"as_of": as_of, "send": run.mail} if run.backfill else {}
+            result = run_stage(label, stage["func"], df, log, **kwargs)
+            if result["status"] == "ok" and label in cached:
+                keep_outputs(*cached[label], log=log)
+            results.append(result)
+
+    return results
+
+
+def _day_label(name, as_of, run):
+    return f"{name} @ {as_of}" if run.backfill else name
+
+
+def _takes_run_date(func):
+    try:
+        params = inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return True
+    return "as_of" in params or any(p.kind is p.VAR_KEYWORD for p in params.values())
+
+
+def main(argv=None):
+    run = parse_run_dates(sys.argv[1:] if argv is None else argv)
+    argv = run.args
+    force = FORCE_FLAG in argv
+    argv = [a for a in argv if a != FORCE_FLAG]
+    if len(argv) < 2:
+        print(
+            "Usage: python -m report_utils.pipeline <MIS workbook> <report script|spec> [...] "
+            "[--force] [--as-of DATE | --from DATE --to DATE] [--mail]"
+        )
+        return 2
+
+    results = run_pipeline(argv[0], argv[1:], force=force or None, run=run)
+    failed = [r["stage"] for r in results if r["status"] == "failed"]
+    skipped = [r["stage"] for r in results if r["status"] == "skipped"]
+
+    print(
+        f"Pipeline finished: {len(results) - len(failed) - len(skipped)} ok, {len(failed)} failed"
+        + (f", {len(skipped)} skipped" if skipped else "")
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
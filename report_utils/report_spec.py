@@ -0,0 +1,544 @@
+"""
+Declarative Report Specs
+------------------------
+
+Reports are described in TOML files (filters, date window, hospitals,
+columns, recipients). This module compiles them into one query plan.
+
+The reports used to hard-code overlapping filters: Cancelled and Dropout
+both select "cancelled, yesterday, these hospitals", and
+"Consider Patient == yes" appears in nearly every script. In a compiled
+plan each distinct predicate gets one boolean mask per loaded frame, and
+every report that uses the predicate reuses that mask. The date window
+comes from the shared day index (date_index.py), so the whole nightly
+batch costs about one pass over each filtered column.
+
+Spec file layout:
+-----------------
+    date_column = "Appointment Date"
+
+    [sets]
+    allowed_hospitals = ["Aster Medcity", "Aster MIMS Kottakkal"]
+    kerala_units = { regions = ["Kerala"] }   # from hospitals.toml
+
+    [mail]
+    to = ["recipient@domain.com"]
+    cc = []
+    subject = "Appointments Report - {day:%d/%m/%Y}"
+    body = "Hi Team, ..."
+
+    [output]                       # optional
+    workbook = "cancelled.xlsx"    # all reports as sheets of one workbook
+    formats = ["csv.gz"]           # extra copies: "csv.gz", "parquet"
+
+    [fanout]                       # optional: one workbook + mail per group
+    by = "region"                  # or "hospital" (hospital_registry.py)
+    workbook = "cancelled_{group}.xlsx"
+
+    [[report]]
+    name = "cancelled_paid"
+    output = "cancelled_paid_yesterday.xlsx"
+    sheet = "Cancelled_Paid"       # sheet name (default: the report name)
+    window = [-1, -1]              # days relative to the run date, inclusive
+    columns = ["Patient Name", "Hospital Name", "Appointment Date"]
+    drop_duplicates = true
+    filters = [
+        { column = "Consider Patient", equals = "yes", optional = true },
+        { column = "Appt. Status", equals = "cancelled" },
+        { column = "Hospital Name", one_of = "allowed_hospitals" },
+    ]
+
+- ``one_of`` takes a list, or the name of a list in ``[sets]``.
+- ``column`` may be a list of aliases; the first one present is used.
+- Column names match ignoring case and surrounding spaces.
+- An ``optional`` filter is skipped when its column is missing; a missing
+  column on any other filter is an error.
+- Reports without ``window`` select from every row.
+- ``[mail] subject`` is required; subject and body may use ``{as_of}``
+  (the run date), ``{day}`` (the day before) and ``{start}`` / ``{end}``
+  (the reports' date window), e.g. ``{day:%d/%m/%Y}``. A report script
+  that mails its own workbook takes the same text through ``mail_text``.
+- With ``[fanout]`` the reports are evaluated once, split by region or
+  hospital, and each group's workbook goes to the group's recipients in
+  the hospital registry instead of ``[mail] to / cc``.
+
+Usage:
+------
+    spec = load_spec("Dropout_Consultation_Report/report_spec.toml")
+    plan = compile_plan([spec])
+    frames = plan.evaluate(df, as_of=date.today())
+
+A spec file can also be passed to the pipeline in place of a report
+script; it then writes its outputs and queues its mail on its own.
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import re
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    import tomli as tomllib
+
+from report_utils.backfill import dated_path, dated_subject
+from report_utils.categoricals import category_mask, normalise_value
+from report_utils.date_index import day_index
+from report_utils.frame_cache import frame_cached
+from report_utils.hospital_registry import (
+    GROUP_BY, HOSPITAL_COLUMN, load_registry, resolve_sets, split_groups
+)
+from report_utils.mail_spool import spool_message
+from report_utils.mailer import SMTP_PORT, SMTP_SERVER, build_message
+from report_utils.metrics import report_metrics
+from report_utils.mis_snapshot import column_key
+from report_utils.report_writer import parse_formats, write_excel, write_workbook
+from report_utils.row_keys import drop_duplicate_rows
+from report_utils.xlsx_stream import date_between, one_of
+
+
+# ================= SPEC FILES =================
+
+def load_spec(path):
+    """
+    Reads and validates a TOML spec file. The returned dict also carries
+    the spec's own path (``__path__``) so outputs can be placed next to it.
+    """
+    with open(path, "rb") as f:
+        spec = tomllib.load(f)
+
+    spec["__path__"] = os.path.abspath(path)
+    spec.setdefault("sets", {})
+    spec.setdefault("report", [])
+    spec.setdefault("output", {})
+
+    if not spec["report"]:
+        raise ValueError(f"{path}: no [[report]] entries")
+
+    # { regions = [...] } sets come from the hospital registry
+    resolve_sets(spec["sets"], path)
+    fanout = spec.get("fanout")
+    if fanout is not None and fanout.get("by", "region") not in GROUP_BY:
+        raise ValueError(f"{path}: [fanout] by must be one of {GROUP_BY}")
+
+    for report in spec["report"]:
+        if "name" not in report:
+            raise ValueError(f"{path}: every [[report]] needs a name")
+        for flt in report.get("filters", []):
+            if "column" not in flt or not ({"equals", "one_of"} & flt.keys()):
+                raise ValueError(
+                    f"{path}: report '{report['name']}' has a filter without "
+                    f"column and equals/one_of: {flt}"
+                )
+            values = flt.get("one_of")
+            if isinstance(values, str) and values not in spec["sets"]:
+                raise ValueError(
+                    f"{path}: report '{report['name']}' refers to unknown set '{values}'"
+                )
+    parse_formats(spec["output"].get("formats", []))
+
+    if "mail" in spec:
+        if not spec["mail"].get("subject"):
+            raise ValueError(f"{path}: [mail] needs a subject")
+        try:
+            mail_text(spec)
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"{path}: [mail] subject/body placeholder {e} is not known") from None
+    return spec
+
+
+def _aliases(column):
+    return tuple(column) if isinstance(column, list) else (column,)
+
+
+def resolve_column(df, column):
+    """
+    Actual frame column for a spec column (name or alias list), or None.
+    """
+    keys = {column_key(c): c for c in df.columns}
+    for alias in _aliases(column):
+        found = keys.get(column_key(alias))
+        if found is not None:
+            return found
+    return None
+
+
+# ================= PLAN =================
+
+class Predicate:
+    """
+    ``column`` matches one of ``values`` (case/space-insensitive).
+
+    Predicates are identified by ``key``, so the same filter written in
+    two specs is one predicate in the plan.
+    """
+
+    def __init__(self, column, values, optional=False):
+        self.column = column
+        self.values = frozenset(normalise_value(v) for v in values)
+        self.optional = optional
+        self.key = (tuple(column_key(a) for a in _aliases(column)), self.values)
+
+    def mask(self, df):
+        """
+        Boolean numpy mask over all rows of ``df``, cached per frame.
+        None when the column is missing.
+        """
+        col = resolve_column(df, self.column)
+        if col is None:
+            return None
+        return frame_cached(
+            df, ("predicate", self.key),
+            lambda: category_mask(df[col], self.values).to_numpy()
+        )
+
+
+class ReportPlan:
+    """
+    One compiled report: date window, predicates and output columns.
+    """
+
+    def __init__(self, spec, report, predicates):
+        self.name = report["name"]
+        self.spec = spec
+        self.output = report.get("output", f"{self.name}.xlsx")
+        self.sheet = report.get("sheet", self.name)
+        self.date_column = report.get("date_column", spec.get("date_column"))
+        self.window = report.get("window")
+        self.columns = report.get("columns")
+        self.drop_duplicates = report.get("drop_duplicates", False)
+        self.predicates = predicates
+
+    def dates(self, as_of):
+        """
+        (start, end) dates of the window for a run on ``as_of``.
+        """
+        start, end = self.window
+        return as_of + timedelta(days=start), as_of + timedelta(days=end)
+
+
+class QueryPlan:
+    """
+    All reports of one or more specs, sharing predicates.
+    """
+
+    def __init__(self):
+        self.predicates = {}
+        self.reports = {}
+
+    def add_spec(self, spec):
+        for report in spec["report"]:
+            if report["name"] in self.reports:
+                raise ValueError(f"Duplicate report name '{report['name']}'")
+            if report.get("window") and not report.get("date_column", spec.get("date_column")):
+                raise ValueError(
+                    f"{spec.get('__path__', 'spec')}: report '{report['name']}' has a "
+                    f"window but no date_column (set it on the report or the spec)"
+                )
+
+            predicates = []
+            for flt in report.get("filters", []):
+                values = flt.get("one_of", [flt.get("equals")])
+                if isinstance(values, str):
+                    values = spec["sets"][values]
+                pred = Predicate(flt["column"], values, flt.get("optional", False))
+                # Reuse an identical predicate from another report
+                pred = self.predicates.setdefault((pred.key, pred.optional), pred)
+                predicates.append(pred)
+
+            self.reports[report["name"]] = ReportPlan(spec, report, predicates)
+
+    def columns(self):
+        """
+        Every MIS column (including aliases) the plan reads, or None when
+        a report keeps all columns.
+        """
+        names = []
+
+        def add(column):
+            for alias in _aliases(column):
+                if alias not in names:
+                    names.append(alias)
+
+        for report in self.reports.values():
+            if report.columns is None:
+                return None
+            if report.date_column:
+                add(report.date_column)
+            for pred in report.predicates:
+                add(pred.column)
+            for col in report.columns:
+                add(col)
+        return names
+
+    def prefilter(self, as_of, last=None):
+        """
+        Row filters (xlsx_stream) that every report's rows pass: the
+        union of the date windows plus the predicates all reports share.
+        Used to cut standalone loads down before evaluation.
+
+        With ``last``, the windows cover every run date from ``as_of``
+        to ``last`` (a backfill, see backfill.py).
+        """
+        reports = list(self.reports.values())
+        filters = []
+
+        date_cols = {_aliases(r.date_column) for r in reports}
+        if all(r.window for r in reports) and len(date_cols) == 1:
+            windows = [r.dates(d) for r in reports for d in (as_of, last or as_of)]
+            filters.append(date_between(
+                date_cols.pop()[0],
+                min(w[0] for w in windows),
+                max(w[1] for w in windows),
+            ))
+
+        shared = set.intersection(*({id(p) for p in r.predicates} for r in reports))
+        for pred in reports[0].predicates:
+            if id(pred) in shared:
+                filters.append(one_of(_aliases(pred.column)[0], pred.values))
+        return filters
+
+    def select(self, df, name, as_of=None):
+        """
+        Rows and columns of report ``name``. Returns a new frame; ``df``
+        itself is never modified.
+        """
+        report = self.reports[name]
+        as_of = as_of or date.today()
+
+        date_col = None
+        if report.date_column:
+            date_col = resolve_column(df, report.date_column)
+            if date_col is None:
+                raise KeyError(f"{name}: date column {report.date_column!r} not found")
+
+        if report.window:
+            positions = day_index(df, date_col).positions(*report.dates(as_of))
+        else:
+            positions = np.arange(len(df))
+
+        keep = np.ones(len(positions), dtype=bool)
+        for pred in report.predicates:
+            mask = pred.mask(df)
+            if mask is None:
+                if pred.optional:
+                    continue
+                raise KeyError(f"{name}: filter column {pred.column!r} not found")
+            keep &= mask[positions]
+
+        rows = df.iloc[positions[keep]]
+
+        if report.columns is not None:
+            cols = []
+            for col in report.columns:
+                found = resolve_column(rows, col)
+                if found is not None and found not in cols:
+                    cols.append(found)
+            rows = rows[cols]
+
+        rows = rows.copy()
+        if date_col in rows.columns:
+            rows[date_col] = pd.to_datetime(rows[date_col], errors="coerce")
+        if report.drop_duplicates:
+            rows = drop_duplicate_rows(rows)
+        return rows
+
+    def evaluate(self, df, as_of=None):
+        """
+        Runs every report of the plan against ``df``.
+        Returns {report name: DataFrame}.
+        """
+        return {name: self.select(df, name, as_of) for name in self.reports}
+
+
+def compile_plan(specs):
+    """
+    Compiles loaded specs into one QueryPlan.
+    """
+    plan = QueryPlan()
+    for spec in specs:
+        plan.add_spec(spec)
+    return plan
+
+
+# ================= SPEC AS A PIPELINE STAGE =================
+
+def mail_text(spec, as_of=None):
+    """
+    (subject, body) of the spec's [mail] for run date ``as_of`` (default
+    today), with the placeholders of the module docstring filled in.
+    """
+    mail = spec.get("mail") or {}
+    as_of = as_of or date.today()
+    windows = [r["window"] for r in spec["report"] if r.get("window")]
+    fields = {
+        "as_of": as_of,
+        "day": as_of - timedelta(days=1),
+        "start": as_of + timedelta(days=min((w[0] for w in windows), default=0)),
+        "end": as_of + timedelta(days=max((w[1] for w in windows), default=0)),
+    }
+    return (
+        mail.get("subject", "").format(**fields),
+        mail.get("body", "").format(**fields),
+    )
+
+
+def send_spec_mail(spec, attachments, as_of=None, recipients=None, group=None):
+    """
+    Queues the spec's [mail] message with the given files attached in
+    the mail spool; the sender delivers it. A backfilled day's subject
+    names its run date. A fan-out group passes its own (to, cc) and
+    its name is added to the subject.
+    """
+    mail = spec.get("mail") or {}
+    to, cc = recipients or (mail.get("to", []), mail.get("cc", []))
+    if not to:
+        return
+
+    subject, body = mail_text(spec, as_of)
+    if group is not None:
+        subject = f"{subject} - {group}"
+    if as_of is not None:
+        subject = dated_subject(subject, as_of)
+
+    msg = build_message(
+        os.getenv("EMAIL_USER"), to, cc,
+        subject, body,
+        attachments=attachments
+    )
+    spool_message(
+        msg, to + cc, mail.get("server", SMTP_SERVER), mail.get("port", SMTP_PORT),
+        run_date=as_of
+    )
+
+
+def spec_outputs(spec, as_of=None):
+    """
+    Paths of the workbook(s) ``run_spec`` writes for a spec (dated for a
+    run date other than today).
+    """
+    out_dir = spec.get("output_dir") or os.path.dirname(spec["__path__"])
+    combined = spec["output"].get("workbook")
+    if combined:
+        paths = [os.path.join(out_dir, combined)]
+    else:
+        paths = [os.path.join(out_dir, r.output) for r in compile_plan([spec]).reports.values()]
+    if as_of is None:
+        return paths
+    return [dated_path(p, as_of) for p in paths]
+
+
+def run_spec(df, spec, as_of=None, send=True):
+    """
+    Evaluates a spec, writes its workbook(s) and mails them.
+    Outputs go to the spec's ``output_dir`` (default: the spec's folder):
+    one workbook per report, or a single workbook with one sheet per
+    report when ``[output] workbook`` is set. A run date other than
+    today gets dated outputs; ``send=False`` skips the mail.
+    """
+    out_dir = spec.get("output_dir") or os.path.dirname(spec["__path__"])
+    os.makedirs(out_dir, exist_ok=True)
+    as_of = as_of or date.today()
+
+    metrics = report_metrics(spec["__path__"])
+    plan = compile_plan([spec])
+    with metrics.stage("filter") as st:
+        frames = plan.evaluate(df, as_of)
+        st.rows = sum(len(f) for f in frames.values())
+    formats = spec["output"].get("formats", [])
+    combined = spec["output"].get("workbook")
+
+    if spec.get("fanout") is not None:
+        return run_fan_out(spec, plan, frames, out_dir, as_of, send, metrics)
+
+    with metrics.stage("write", rows=st.rows):
+        if combined:
+            path = dated_path(os.path.join(out_dir, combined), as_of)
+            write_workbook(
+                path,
+                {plan.reports[name].sheet: frame for name, frame in frames.items()},
+                formats
+            )
+            print(f"Reports {', '.join(frames)} written: {path}")
+            outputs = [path]
+        else:
+            outputs = []
+            for name, frame in frames.items():
+                report = plan.reports[name]
+                path = dated_path(os.path.join(out_dir, report.output), as_of)
+                write_excel(frame, path, report.sheet, formats)
+                print(f"Report '{name}' written: {path} ({len(frame)} rows)")
+                outputs.append(path)
+
+    if send:
+        with metrics.stage("mail"):
+            send_spec_mail(spec, outputs, as_of)
+
+
+def _group_file(pattern, group):
+    return pattern.format(group=re.sub(r"[^\w.-]+", "_", str(group)).strip("_"))
+
+
+def run_fan_out(spec, plan, frames, out_dir, as_of, send=True, metrics=None):
+    """
+    Writes and mails one workbook per region or hospital (``[fanout]``)
+    from frames evaluated once. The frames are split in one groupby pass
+    each; every group's workbook has one sheet per report. Groups
+    without rows get no mail. Returns the workbooks written.
+    """
+    fan = spec["fanout"]
+    by = fan.get("by", "region")
+    pattern = fan.get("workbook", "{group}.xlsx")
+    formats = spec["output"].get("formats", [])
+    registry = load_registry(fan.get("registry"))
+    metrics = metrics or report_metrics(spec["__path__"])
+
+    with metrics.stage("fanout") as st:
+        first = next(iter(frames.values()))
+        column = resolve_column(first, fan.get("column", HOSPITAL_COLUMN))
+        if column is None or any(column not in f.columns for f in frames.values()):
+            raise KeyError(
+                f"{spec['__path__']}: fan-out column {fan.get('column', HOSPITAL_COLUMN)!r} "
+                f"must be among every report's columns"
+            )
+        groups, unmatched = split_groups(frames, column, registry, by)
+        st.rows = len(groups)
+    if unmatched:
+        print(f"Fan-out: {unmatched} row(s) at hospitals not in the registry left out")
+
+    outputs = []
+    for group, group_frames in groups.items():
+        path = dated_path(os.path.join(out_dir, _group_file(pattern, group)), as_of)
+        with metrics.stage("write", rows=sum(len(f) for f in group_frames.values())):
+            write_workbook(
+                path,
+                {plan.reports[name].sheet: frame for name, frame in group_frames.items()},
+                formats
+            )
+        print(f"Fan-out {by} '{group}' written: {path}")
+        outputs.append(path)
+
+        if send:
+            recipients = registry.recipients(group, by)
+            if not recipients[0]:
+                print(f"Fan-out {by} '{group}': no recipients in the registry, not mailed")
+                continue
+            with metrics.stage("mail"):
+                send_spec_mail(spec, [path], as_of, recipients, group)
+
+    metrics.count("fanout_groups", len(groups))
+    return outputs
+
+
+def spec_stage(path):
+    """
+    (callable, columns) for a spec file, in the pipeline's stage format.
+    """
+    spec = load_spec(path)
+    return (lambda df, as_of=None, send=True: run_spec(df, spec, as_of, send)), \
+        compile_plan([spec]).columns()
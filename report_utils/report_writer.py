@@ -0,0 +1,405 @@
+"""
+Report Writer
+-------------
+
+Writes report frames to Excel through xlsxwriter in constant-memory mode,
+optionally as several sheets of one workbook, with CSV.gz / Parquet
+copies for machine consumers.
+
+Reports used to call ``DataFrame.to_excel``, which goes through openpyxl:
+every cell becomes a Python object held in memory until the workbook is
+saved. On the 15-day completed-consultations report that dominates the
+report's runtime and peak memory. xlsxwriter's ``constant_memory`` mode
+streams each row to disk as soon as it is written, so memory stays flat
+however many rows the report has.
+
+Output options:
+---------------
+- ``write_excel(df, path)``             one frame, one workbook
+- ``write_workbook(path, sheets)``      {sheet name: frame}, one workbook,
+                                        written in a single pass
+- ``write_chunks(path, chunks)``        an iterable of frames as one sheet,
+                                        never holding the whole table
+                                        (a ``.parquet`` path is written as
+                                        Parquet, one row group per chunk)
+- ``extra_formats=["csv.gz", "parquet"]`` (or REPORT_EXTRA_FORMATS=csv.gz,parquet)
+                                        also writes those files next to the
+                                        workbook; they are not mailed
+
+Cells match what ``to_excel`` produced: a bold header row, no index,
+datetime columns as ``yyyy-mm-dd hh:mm:ss``, dates as ``yyyy-mm-dd``,
+missing values as empty cells. Text is always written as text (a value
+starting with "=" never becomes a formula).
+
+If xlsxwriter is not installed, workbooks are written through openpyxl
+as before.
+
+Benchmark against the previous writer:
+--------------------------------------
+    python -m report_utils.report_writer bench --rows 200000
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import datetime
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from report_utils.mis_snapshot import _arrow_safe
+
+try:
+    import xlsxwriter
+except ImportError:  # constant-memory writer is optional
+    xlsxwriter = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # chunked Parquet output is optional
+    pa = None
+    pq = None
+
+
+# ================= CONFIG =================
+
+EXTRA_FORMATS_ENV = "REPORT_EXTRA_FORMATS"
+EXTRA_FORMATS = ("csv.gz", "parquet")
+
+# Rows converted to Python values at a time
+CHUNK_ROWS = 10_000
+
+# Excel limits
+MAX_ROWS = 1_048_576
+MAX_SHEET_NAME = 31
+
+DATE_FORMAT = "yyyy-mm-dd"
+DATETIME_FORMAT = "yyyy-mm-dd hh:mm:ss"
+
+
+# ================= EXTRA FORMATS =================
+
+def parse_formats(formats=None):
+    """
+    Validated list of extra formats; defaults to REPORT_EXTRA_FORMATS.
+    """
+    if formats is None:
+        formats = [f for f in os.getenv(EXTRA_FORMATS_ENV, "").split(",") if f.strip()]
+
+    formats = [f.strip().lower().lstrip(".") for f in formats]
+    unknown = [f for f in formats if f not in EXTRA_FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown output format(s) {unknown}; expected {list(EXTRA_FORMATS)}")
+    return formats
+
+
+def _stem(path):
+    root, ext = os.path.splitext(path)
+    return root if ext.lower() in (".xlsx", ".xls") else path
+
+
+def write_extra(df, stem, formats):
+    """
+    Writes ``df`` as ``<stem>.<format>`` for every format. Returns the paths.
+    """
+    paths = []
+    for fmt in formats:
+        path = f"{stem}.{fmt}"
+        if fmt == "csv.gz":
+            df.to_csv(path, index=False, compression="gzip")
+        else:
+            df.to_parquet(path, index=False)
+        paths.append(path)
+    return paths
+
+
+# ================= EXCEL =================
+
+def _sheet_name(name):
+    for ch in "[]:*?/\\":
+        name = name.replace(ch, "_")
+    return name[:MAX_SHEET_NAME] or "Sheet1"
+
+
+def _add_sheet(workbook, name, columns, header_fmt):
+    sheet = workbook.add_worksheet(_sheet_name(name))
+    sheet.write_row(0, 0, [str(c) for c in columns], header_fmt)
+    return sheet
+
+
+def _write_rows(sheet, first_row, df, datetime_fmt):
+    """
+    Writes the rows of ``df`` starting at sheet row ``first_row``.
+    """
+    # datetime64 columns keep their time part, like to_excel
+    formats = [
+        datetime_fmt if pd.api.types.is_datetime64_any_dtype(df[c]) else None
+        for c in df.columns
+    ]
+
+    for start in range(0, len(df), CHUNK_ROWS):
+        chunk = df.iloc[start:start + CHUNK_ROWS]
+        values = chunk.astype(object).to_numpy()
+        missing = chunk.isna().to_numpy()
+
+        for offset, (row, empty) in enumerate(zip(values, missing)):
+            r = first_row + start + offset
+            for c, value in enumerate(row):
+                if empty[c]:
+                    continue
+                sheet.write(r, c, value, formats[c])
+
+
+def _check_rows(name, rows):
+    if rows + 1 > MAX_ROWS:
+        raise ValueError(
+            f"Sheet '{name}' has {rows} rows; Excel allows {MAX_ROWS - 1}. "
+            f"Write it as csv.gz or parquet instead."
+        )
+
+
+def _write_sheet(workbook, name, df, header_fmt, datetime_fmt):
+    _check_rows(name, len(df))
+    sheet = _add_sheet(workbook, name, df.columns, header_fmt)
+    _write_rows(sheet, 1, df, datetime_fmt)
+
+
+def _write_openpyxl(path, sheets):
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=_sheet_name(name), index=False)
+
+
+def _open_workbook(path):
+    workbook = xlsxwriter.Workbook(path, {
+        "constant_memory": True,
+        "default_date_format": DATE_FORMAT,
+        "remove_timezone": True,
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+        "strings_to_numbers": False,
+    })
+    # A fixed creation time (today, midnight) makes a rebuild of the same
+    # rows byte-identical, so its mail keeps the same spool id
+    workbook.set_properties({
+        "created": datetime.datetime.combine(datetime.date.today(), datetime.time())
+    })
+    header_fmt = workbook.add_format({"bold": True, "border": 1})
+    datetime_fmt = workbook.add_format({"num_format": DATETIME_FORMAT})
+    return workbook, header_fmt, datetime_fmt
+
+
+def write_workbook(path, sheets, extra_formats=None):
+    """
+    Writes {sheet name: frame} as one workbook in a single pass.
+    Extra formats are written per sheet as ``<stem>.<sheet>.<format>``.
+    Returns the paths written, workbook first.
+    """
+    formats = parse_formats(extra_formats)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    if xlsxwriter is None:
+        _write_openpyxl(path, sheets)
+    else:
+        workbook, header_fmt, datetime_fmt = _open_workbook(path)
+        try:
+            for name, df in sheets.items():
+                _write_sheet(workbook, name, df, header_fmt, datetime_fmt)
+        finally:
+            workbook.close()
+
+    paths = [path]
+    for name, df in sheets.items():
+        stem = _stem(path) if len(sheets) == 1 else f"{_stem(path)}.{_sheet_name(name)}"
+        paths += write_extra(df, stem, formats)
+    return paths
+
+
+def write_excel(df, path, sheet_name="Sheet1", extra_formats=None):
+    """
+    Drop-in for ``df.to_excel(path, index=False, sheet_name=...)``.
+    Returns the paths written, workbook first.
+    """
+    return write_workbook(path, {sheet_name: df}, extra_formats)
+
+
+def can_write_chunks(path):
+    """
+    True if ``write_chunks`` can write this path here (xlsxwriter for
+    workbooks, pyarrow for .parquet).
+    """
+    if path.lower().endswith(".parquet"):
+        return pq is not None
+    return xlsxwriter is not None
+
+
+def _parquet_schema(table):
+    # Columns empty in the first chunk are typed as text
+    return pa.schema([
+        f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in table.schema
+    ])
+
+
+def _write_parquet_chunks(path, chunks):
+    """
+    Writes frames as row groups of one Parquet file. The column types
+    come from the first chunk.
+    """
+    writer, schema, rows = None, None, 0
+    try:
+        for df in chunks:
+            table = pa.Table.from_pandas(_arrow_safe(df), preserve_index=False)
+            if writer is None:
+                schema = _parquet_schema(table)
+                writer = pq.ParquetWriter(path, schema)
+            try:
+                table = table.cast(schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                raise ValueError(
+                    f"A chunk of {path} does not match the column types of the "
+                    f"first chunk ({e}); write it as .xlsx instead."
+                ) from e
+            writer.write_table(table)
+            rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_chunks(path, chunks, sheet_name="Sheet1"):
+    """
+    Writes an iterable of frames (same columns) as one sheet, one chunk
+    at a time, so the full table never has to be in memory. Needs
+    xlsxwriter (pyarrow for a .parquet path). Returns the number of data
+    rows written.
+    """
+    parquet = path.lower().endswith(".parquet")
+    if not can_write_chunks(path):
+        raise RuntimeError(f"Writing in chunks needs {'pyarrow' if parquet else 'xlsxwriter'}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if parquet:
+        return _write_parquet_chunks(path, chunks)
+
+    workbook, header_fmt, datetime_fmt = _open_workbook(path)
+    sheet, rows = None, 0
+    try:
+        for df in chunks:
+            if sheet is None:
+                sheet = _add_sheet(workbook, sheet_name, df.columns, header_fmt)
+            _check_rows(sheet_name, rows + len(df))
+            _write_rows(sheet, rows + 1, df, datetime_fmt)
+            rows += len(df)
+        if sheet is None:
+            workbook.add_worksheet(_sheet_name(sheet_name))
+    finally:
+        workbook.close()
+    return rows
+
+
+# ================= BENCHMARK =================
+
+def _sample_frame(rows, seed=0):
+    """
+    Synthetic frame shaped like the completed-consultations report.
+    """
+    rng = np.random.default_rng(seed)
+    doctors = np.array([f"Dr. Doctor {i}" for i in range(200)], dtype=object)
+    units = np.array(["Aster Medcity", "Aster MIMS Kottakkal", "Aster MIMS Hospital, Calicut"], dtype=object)
+    specs = np.array(["Cardiology", "Orthopaedics", "General Medicine", "Paediatrics"], dtype=object)
+
+    dates = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 15 * 86400, rows), unit="s")
+    return pd.DataFrame({
+        "Patient Name": [f"Patient {i}" for i in range(rows)],
+        "Contact Number": rng.integers(6_000_000_000, 9_999_999_999, rows).astype(str),
+        "UHID": [f"UH{i:08d}" for i in range(rows)],
+        "Date of Completed Appointment": dates.date,
+        "Doctor Name": doctors[rng.integers(0, len(doctors), rows)],
+        "Speciality": specs[rng.integers(0, len(specs), rows)],
+        "Unit": units[rng.integers(0, len(units), rows)],
+        "Appointment Date": dates,
+    })
+
+
+def _measure(fn):
+    """
+    (seconds, peak traced bytes). Timed on an untraced run, since
+    tracemalloc itself slows the writers down several times over.
+    """
+    started = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def benchmark(rows=100_000, log=print):
+    """
+    Times the previous writer (to_excel through openpyxl) against this
+    module's writers on a synthetic frame. Returns one dict per writer.
+    """
+    df = _sample_frame(rows)
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [
+            ("to_excel (openpyxl)", "openpyxl.xlsx",
+             lambda p: df.to_excel(p, index=False, engine="openpyxl")),
+            ("xlsxwriter constant_memory", "xlsxwriter.xlsx",
+             lambda p: write_excel(df, p, extra_formats=[])),
+            ("csv.gz", "frame", lambda p: write_extra(df, p, ["csv.gz"])),
+            ("parquet", "frame", lambda p: write_extra(df, p, ["parquet"])),
+        ]
+
+        for name, filename, fn in cases:
+            path = os.path.join(tmp, filename)
+            if name.startswith("xlsxwriter") and xlsxwriter is None:
+                log(f"{name:28} skipped (xlsxwriter not installed)")
+                continue
+            try:
+                seconds, peak = _measure(lambda: fn(path))
+            except ImportError as e:
+                log(f"{name:28} skipped ({str(e).splitlines()[0]})")
+                continue
+
+            written = path if os.path.exists(path) else f"{path}.{name}"
+            size = os.path.getsize(written)
+            results.append({
+                "writer": name, "rows": rows, "seconds": round(seconds, 3),
+                "peak_mb": round(peak / 2**20, 1), "file_mb": round(size / 2**20, 2),
+            })
+            log(f"{name:28} {seconds:8.2f}s  peak {peak / 2**20:8.1f} MB  file {size / 2**20:7.2f} MB")
+
+    return results
+
+
+# ================= CLI =================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m report_utils.report_writer")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_bench = sub.add_parser("bench", help="compare writers on a synthetic report")
+    p_bench.add_argument("--rows", type=int, default=100_000)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        print(f"Writing {args.rows} rows x 8 columns")
+        benchmark(args.rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
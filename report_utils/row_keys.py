@@ -0,0 +1,181 @@
+"""
+Row Keys
+--------
+
+Vectorised row keys for cross-run deduplication, and duplicate removal
+on factorized row codes.
+
+The Completed report used to build its dedup key with
+``out.apply(lambda r: mk_row_hash(...), axis=1)``: one Python row object,
+one joined string and one MD5 digest per row. Here the key columns are
+normalised as whole-column string operations and the joined strings are
+hashed in one ``hash_array`` call to a 64-bit key.
+
+Normalisation (identical to the old ``mk_row_hash``):
+-----------------------------------------------------
+    None            -> ""
+    anything else   -> str(value)     (NaN -> "nan", NaT -> "NaT",
+                                       Timestamp -> "2024-01-05 00:00:00")
+    pd.NA           -> "nan"          (a missing value of a nullable
+                                       column, see mis_schema.py, keys
+                                       like the NaN it used to be)
+    then            -> runs of whitespace collapsed to one space,
+                       stripped, lower-cased
+    columns joined with "|"
+
+Keys:
+-----
+- ``row_keys``     64-bit SipHash of the normalised string (pandas
+                   ``hash_array`` with a fixed hash key), as 16 hex chars.
+- ``legacy_keys``  MD5 hex digest (32 chars) of the same normalised
+                   string: exactly the key ``mk_row_hash`` produced, so
+                   keys already stored in the sent-log are still
+                   recognised. The two kinds never collide (different
+                   lengths).
+
+``already_sent`` checks the new keys first and falls back to legacy keys
+only for unmatched rows, and only while the store still holds legacy
+keys. Legacy keys age out of the sent-log with the report window, after
+which the MD5 path is never taken.
+
+Author: SKANDA N RAJ
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+# ================= CONFIG =================
+
+# Fixed SipHash key: keys must be identical across runs and machines
+HASH_KEY = "0123456789123456"
+
+
+# ================= NORMALISATION =================
+
+def _normalise(text):
+    # Object text: Python's ``re`` matches the same whitespace as
+    # str.split() (no-break spaces included); pyarrow's regex does not
+    return (
+        text.astype(object)
+            .str.replace(r"\s+", " ", regex=True)
+            .str.strip()
+            .str.lower()
+    )
+
+
+def _column_text(series):
+    """
+    Normalised text of one column, as ``mk_row_hash`` normalised a value.
+    Each distinct value is normalised once, then broadcast by code.
+    """
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+        # Mixed Python types: 1 and 1.0 are one distinct value but not one
+        # string, so these columns are converted value by value
+        return _normalise(series.astype(object).map(lambda v: "" if v is None else str(v)))
+
+    codes, uniques = pd.factorize(series)
+    text = _normalise(pd.Series(uniques.astype(object)).map(str)).to_numpy(dtype=object)
+    out = text[codes] if len(text) else np.empty(len(codes), dtype=object)
+
+    # Missing values: None -> "", NaN/NaT -> "nan"/"NaT" (str of the value),
+    # pd.NA -> "nan"
+    missing = np.flatnonzero(codes == -1)
+    if len(missing):
+        values = series.to_numpy(dtype=object)[missing]
+        out[missing] = [
+            "" if v is None else "nan" if v is pd.NA else " ".join(str(v).strip().lower().split())
+            for v in values
+        ]
+    return pd.Series(out, index=series.index)
+
+
+def normalised_rows(df, columns=None):
+    """
+    The "|"-joined normalised key string of every row.
+    """
+    columns = list(df.columns) if columns is None else list(columns)
+    parts = [_column_text(df[c]) for c in columns]
+    joined = parts[0].astype(object)
+    for part in parts[1:]:
+        joined = joined + "|" + part
+    return joined
+
+
+# ================= KEYS =================
+
+def row_keys(df, columns=None):
+    """
+    64-bit row keys (16 hex chars) over ``columns`` (default: all).
+    """
+    hashed = pd.util.hash_array(
+        normalised_rows(df, columns).to_numpy(dtype=object),
+        hash_key=HASH_KEY, categorize=False
+    )
+    digits = hashed.astype(">u8").tobytes().hex()
+    return pd.Series(
+        [digits[i:i + 16] for i in range(0, len(digits), 16)],
+        index=df.index, dtype=object
+    )
+
+
+def legacy_keys(df, columns=None):
+    """
+    MD5 keys exactly as the old ``mk_row_hash`` built them.
+    """
+    return normalised_rows(df, columns).map(
+        lambda s: hashlib.md5(s.encode("utf-8")).hexdigest()
+    )
+
+
+def already_sent(store, df, keys, columns=None):
+    """
+    Boolean mask of the rows of ``df`` whose key (``keys``) is in the
+    sent-key store, or whose legacy MD5 key is, while legacy keys remain.
+    """
+    sent = keys.isin(store.known(keys))
+
+    if store.has_legacy_keys() and not sent.all():
+        todo = df.loc[~sent]
+        old = legacy_keys(todo, columns)
+        sent.loc[~sent] = old.isin(store.known(old)).to_numpy()
+
+    return sent
+
+
+# ================= DUPLICATES =================
+
+def duplicated_rows(df, columns=None):
+    """
+    Exactly ``df.duplicated(subset=columns)``: values are compared as
+    typed, so ``1`` and ``"1"`` or NaN and ``"nan"`` differ, and missing
+    values match as they do in pandas. Each column is
+    factorized once and the per-column codes are combined into one
+    integer per row, instead of comparing the (often wide, object)
+    columns row by row.
+    """
+    subset = df if columns is None else df[list(columns)]
+    if subset.shape[1] == 1:
+        # What pandas does for one column too (None and NaN differ there)
+        return subset.iloc[:, 0].duplicated()
+
+    group, size = np.zeros(len(subset), dtype=np.int64), 1
+    for _, series in subset.items():
+        codes, uniques = pd.factorize(series)
+        width = len(uniques) + 1
+        if size * width >= 2**62:
+            # Renumber the codes so far so the combined code never overflows
+            group, seen = pd.factorize(group)
+            size = len(seen)
+        group = group * width + (codes + 1)
+        size *= width
+    return pd.Series(group, index=df.index).duplicated()
+
+
+def drop_duplicate_rows(df, columns=None):
+    """
+    ``df.drop_duplicates(subset=columns)`` through factorized row codes.
+    """
+    return df[~duplicated_rows(df, columns).to_numpy()]
@@ -0,0 +1,275 @@
+"""
+Structured Run Log
+------------------
+
+JSON-lines log for the schedulers, written by a background thread.
+
+``log_message()`` / ``log()`` used to build the log path (makedirs,
+exists, strftime) and open, append and close the daily file for every
+line, under a lock shared by the parallel jobs. The report scripts'
+own output only reached the console, so a failed job left nothing in
+the log but "FAILED".
+
+Here a call only prints the line and queues a record; one writer thread
+keeps the day's files open and writes whatever has queued up in one
+go, flushing when the queue runs empty.
+
+Files (``logs/`` or the folder given):
+--------------------------------------
+    <name>_<YYYY-MM-DD>.jsonl          scheduler messages
+    <name>_<YYYY-MM-DD>.<job>.jsonl    one job's stdout / stderr lines
+    *.jsonl.gz                         earlier days, compressed
+
+Each line is one record:
+
+    {"ts": "2026-10-17T19:44:02.513", "level": "info", "msg": "..."}
+    {"ts": ..., "level": "info", "job": "Dropout_Consultation_Report.main",
+     "stream": "stdout", "msg": "✅ Email sent successfully!"}
+
+Files roll over at midnight (by the record's timestamp). Files of
+earlier days are gzipped by the writer thread, at start-up and after
+each rollover.
+
+Usage:
+------
+    LOGGER = RunLogger(LOG_DIR, "scheduler_log")
+    LOGGER.log("Pre-cleanup done")
+    run_job(["python", script], job_name(script), LOGGER)   # raises CalledProcessError
+
+    for record in read_log("logs/scheduler_log_2026-10-16.jsonl.gz"): ...
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import re
+import sys
+import gzip
+import glob
+import json
+import queue
+import atexit
+import shutil
+import subprocess
+import threading
+from datetime import date, datetime
+
+
+# ================= CONFIG =================
+
+# Records written per batch before the files are flushed at the latest
+MAX_BATCH = 1000
+
+# Seconds close() waits for the writer to drain the queue
+CLOSE_TIMEOUT = 10
+
+_DAY = re.compile(r"_(\d{4}-\d{2}-\d{2})(?:\.|$)")
+
+_STOP = object()
+
+
+# ================= HELPERS =================
+
+def job_name(script):
+    """
+    Log stream name of a job: report folder + file stem (every report
+    script is called main.py).
+    """
+    path = os.path.abspath(script)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    name = f"{os.path.basename(os.path.dirname(path))}.{stem}"
+    return re.sub(r"[^\w.-]+", "_", name).strip("_.")
+
+
+def compress_old_logs(directory, name, today=None):
+    """
+    Gzips this log's .jsonl files of days before ``today``. Returns the
+    paths written.
+    """
+    today = today or date.today()
+    written = []
+    for path in glob.glob(os.path.join(directory, f"{glob.escape(name)}_*.jsonl")):
+        match = _DAY.search(os.path.basename(path))
+        if not match or match.group(1) >= today.isoformat():
+            continue
+
+        target = path + ".gz"
+        tmp = target + ".tmp"
+        with open(path, "rb") as src, open(tmp, "wb") as out:
+            # A day already compressed gets a second gzip member
+            if os.path.exists(target):
+                with open(target, "rb") as earlier:
+                    shutil.copyfileobj(earlier, out)
+            with gzip.GzipFile(fileobj=out, mode="wb") as dst:
+                shutil.copyfileobj(src, dst)
+        os.replace(tmp, target)
+        os.remove(path)
+        written.append(target)
+    return written
+
+
+def read_log(path):
+    """
+    Yields the records of a .jsonl or .jsonl.gz log (a line cut off by a
+    crash is skipped).
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+# ================= LOGGER =================
+
+class RunLogger:
+    """
+    Prints each message and hands the record to a background writer.
+    """
+
+    def __init__(self, directory, name, echo=True):
+        self.directory = directory
+        self.name = name
+        self.echo = echo
+
+        self._queue = queue.SimpleQueue()
+        self._print_lock = threading.Lock()
+        self._files = {}
+        self._day = None
+        self._closed = False
+
+        self._writer = threading.Thread(target=self._run, name=f"{name}-writer", daemon=True)
+        self._writer.start()
+
+        # Whatever is still queued is written when the process exits
+        atexit.register(self.close)
+
+    def log(self, message, level="info", **fields):
+        """
+        Prints ``[timestamp] message`` and queues the record. Extra
+        fields (job, stream, ...) are stored with it.
+        """
+        now = datetime.now()
+        if self.echo:
+            prefix = f"[{fields['job']}] " if "job" in fields else ""
+            with self._print_lock:
+                print(f"[{now:%Y-%m-%d %H:%M:%S}] {prefix}{message}", flush=True)
+
+        if not self._closed:
+            self._queue.put((now, level, str(message), fields))
+
+    def close(self):
+        """
+        Writes the queued records and stops the writer.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join(CLOSE_TIMEOUT)
+
+    # ----- writer thread -----
+
+    def _path(self, day, job=None):
+        suffix = f".{job}" if job else ""
+        return os.path.join(self.directory, f"{self.name}_{day.isoformat()}{suffix}.jsonl")
+
+    def _file(self, day, job):
+        # A record queued just before midnight by another thread stays
+        # in today's file rather than reopening yesterday's
+        if self._day is not None and day < self._day:
+            day = self._day
+        if day != self._day:
+            # Midnight: yesterday's files are complete
+            self._close_files()
+            self._day = day
+            self._compress()
+
+        key = job or ""
+        if key not in self._files:
+            os.makedirs(self.directory, exist_ok=True)
+            self._files[key] = open(self._path(day, job), "a", encoding="utf-8")
+        return self._files[key]
+
+    def _close_files(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def _compress(self):
+        try:
+            compress_old_logs(self.directory, self.name, self._day)
+        except OSError as e:
+            print(f"Old logs not compressed: {e}", file=sys.stderr)
+
+    def _write(self, batch):
+        for now, level, message, fields in batch:
+            record = {"ts": now.isoformat(timespec="milliseconds"), "level": level}
+            record.update(fields)
+            record["msg"] = message
+            self._file(now.date(), fields.get("job")).write(
+                json.dumps(record, ensure_ascii=False, default=str) + "\n"
+            )
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < MAX_BATCH:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            stop = _STOP in batch
+            # Logging must never break the scheduler
+            try:
+                self._write([r for r in batch if r is not _STOP])
+                for f in self._files.values():
+                    f.flush()
+            except OSError as e:
+                print(f"Log not written: {e}", file=sys.stderr)
+
+            if stop:
+                self._close_files()
+                return
+
+
+# ================= CHILD JOBS =================
+
+def _pump(pipe, logger, job, stream):
+    with pipe:
+        for line in pipe:
+            logger.log(line.rstrip("\r\n"), job=job, stream=stream)
+
+
+def run_job(cmd, job, logger, **popen_kwargs):
+    """
+    Runs a child process, sending each stdout / stderr line to the job's
+    log stream as it is printed. Raises CalledProcessError on a non-zero
+    exit, like ``subprocess.run(..., check=True)``.
+    """
+    env = dict(popen_kwargs.pop("env", None) or os.environ)
+    # Lines as they are printed, emoji included (Windows consoles are cp1252)
+    env.setdefault("PYTHONUNBUFFERED", "1")
+    env.setdefault("PYTHONIOENCODING", "utf-8")
+
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        encoding="utf-8", errors="replace", env=env, **popen_kwargs
+    )
+    pumps = [
+        threading.Thread(target=_pump, args=(proc.stdout, logger, job, "stdout"), daemon=True),
+        threading.Thread(target=_pump, args=(proc.stderr, logger, job, "stderr"), daemon=True),
+    ]
+    for t in pumps:
+        t.start()
+
+    code = proc.wait()
+    for t in pumps:
+        t.join()
+
+    if code:
+        raise subprocess.CalledProcessError(code, cmd)
+    return code
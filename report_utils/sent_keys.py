@@ -0,0 +1,225 @@
+"""
+Sent-Key Store
+--------------
+
+Remembers which report rows were already emailed, in an indexed SQLite
+table instead of an ever-growing CSV.
+
+The Completed Consultations report used to read all of
+``state/sent_completed_keys.csv`` into a set on every run and append to it
+forever, although only rows inside the report window can ever come back.
+Here every key carries the date of its row and the date it was sent:
+
+- Membership checks are an indexed lookup (primary key), done in one query
+  for the whole batch.
+- Keys whose row date is before the report window are evicted, since
+  those rows can never be selected again. Keys without a row date
+  (migrated from the CSV) are evicted ``keep_days`` after they were sent.
+- The database runs in WAL mode. ``transaction()`` takes the write lock
+  up front (``BEGIN IMMEDIATE``), so two runs at the same time never both
+  decide to send the same row: the second one waits and then sees the
+  first one's keys.
+- If anything fails inside the transaction (writing the workbook,
+  queueing the mail), nothing is recorded and the rows go out next run.
+
+Migration:
+----------
+Pass the old CSV as ``legacy_csv``. Its keys are imported once (sent
+today, row date unknown) and the file is renamed to ``*.csv.migrated``.
+
+Usage:
+------
+    with SentKeyStore(STATE_DB, keep_days=15, legacy_csv=OLD_STATE_FILE) as store:
+        with store.transaction():
+            store.evict(start_date)
+            sent = store.known(out["__key"])
+            out_new = out[~out["__key"].isin(sent)]
+            ...  # write the report, queue the mail
+            store.add(out_new["__key"], out_new["Appointment Date"])
+
+Author: SKANDA N RAJ
+"""
+
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pandas as pd
+
+
+# ================= CONFIG =================
+
+# A concurrent run holds the write lock while it writes its report and
+# queues its mail; wait this long for it before giving up
+BUSY_TIMEOUT_SECONDS = 600
+
+# Keys are looked up / inserted in batches of this size
+BATCH_SIZE = 5_000
+
+# MD5 hex keys written by the old mk_row_hash (see row_keys.py)
+LEGACY_KEY_LENGTH = 32
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sent_keys (
+    key      TEXT PRIMARY KEY,
+    row_date TEXT,
+    sent_on  TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sent_keys_row_date ON sent_keys (row_date);
+CREATE INDEX IF NOT EXISTS sent_keys_sent_on ON sent_keys (sent_on);
+"""
+
+
+def _iso(value):
+    """
+    ISO date string for a date-like value, None when missing/unparseable.
+    """
+    if value is None:
+        return None
+    ts = pd.to_datetime(value, errors="coerce")
+    return None if pd.isna(ts) else ts.date().isoformat()
+
+
+def _batches(items):
+    items = list(items)
+    for start in range(0, len(items), BATCH_SIZE):
+        yield items[start:start + BATCH_SIZE]
+
+
+# ================= STORE =================
+
+class SentKeyStore:
+    """
+    Sent-log of row keys in a SQLite file.
+    """
+
+    def __init__(self, path, keep_days=None, legacy_csv=None):
+        self.path = path
+        self.keep_days = keep_days
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        if legacy_csv:
+            self.migrate_csv(legacy_csv)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    # ---------- transactions ----------
+
+    @contextmanager
+    def transaction(self):
+        """
+        Holds the store's write lock for the block; commits at the end,
+        rolls back if the block raises (including SystemExit).
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    @contextmanager
+    def _write(self):
+        # Joins an open transaction, otherwise runs in its own
+        if self._conn.in_transaction:
+            yield
+        else:
+            with self.transaction():
+                yield
+
+    # ---------- keys ----------
+
+    def known(self, keys):
+        """
+        The subset of ``keys`` already in the store.
+        """
+        found = set()
+        for batch in _batches({str(k) for k in keys if k is not None}):
+            marks = ",".join("?" * len(batch))
+            found.update(
+                row[0] for row in self._conn.execute(
+                    f"SELECT key FROM sent_keys WHERE key IN ({marks})", batch
+                )
+            )
+        return found
+
+    def add(self, keys, row_dates=None, sent_on=None):
+        """
+        Records ``keys`` as sent. ``row_dates`` (same length) are the dates
+        of the rows, used for eviction. Keys already present are kept.
+        """
+        keys = [str(k) for k in keys]
+        row_dates = [None] * len(keys) if row_dates is None else [_iso(d) for d in row_dates]
+        sent_on = (sent_on or date.today()).isoformat()
+
+        with self._write():
+            for batch in _batches(zip(keys, row_dates)):
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO sent_keys (key, row_date, sent_on) VALUES (?, ?, ?)",
+                    [(k, d, sent_on) for k, d in batch]
+                )
+
+    def evict(self, window_start, today=None):
+        """
+        Deletes keys that can no longer match: row date before
+        ``window_start``, or (no row date) sent more than ``keep_days``
+        ago. Returns the number of keys deleted.
+        """
+        today = today or date.today()
+        with self._write():
+            deleted = self._conn.execute(
+                "DELETE FROM sent_keys WHERE row_date < ?", (_iso(window_start),)
+            ).rowcount
+            if self.keep_days is not None:
+                cutoff = (today - timedelta(days=self.keep_days)).isoformat()
+                deleted += self._conn.execute(
+                    "DELETE FROM sent_keys WHERE row_date IS NULL AND sent_on < ?", (cutoff,)
+                ).rowcount
+        return deleted
+
+    def has_legacy_keys(self):
+        """
+        True while the store still holds old MD5 (32-char) keys.
+        """
+        return self._conn.execute(
+            "SELECT 1 FROM sent_keys WHERE length(key) = ? LIMIT 1", (LEGACY_KEY_LENGTH,)
+        ).fetchone() is not None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM sent_keys").fetchone()[0]
+
+    # ---------- migration ----------
+
+    def migrate_csv(self, csv_path):
+        """
+        Imports the keys of an old sent-log CSV (column ``key``) once and
+        renames the CSV to ``*.migrated``. Returns the number of keys read.
+        """
+        if not os.path.exists(csv_path):
+            return 0
+
+        try:
+            keys = pd.read_csv(csv_path, dtype=str)["key"].dropna().tolist()
+        except (KeyError, ValueError, pd.errors.EmptyDataError):
+            keys = []
+
+        self.add(keys)
+        try:
+            os.replace(csv_path, csv_path + ".migrated")
+        except FileNotFoundError:
+            pass  # a concurrent run migrated it first
+        return len(keys)
@@ -0,0 +1,250 @@
+"""
+Streaming MIS Reader
+--------------------
+
+Reads the MIS worksheet row by row (openpyxl ``read_only`` mode) and drops
+rows that fail the report's filters while parsing.
+
+Every report keeps only a small slice of the MIS (e.g. yesterday's
+cancelled rows at a handful of hospitals). Loading the whole sheet into
+pandas first makes memory grow with the size of the export; streaming
+keeps it proportional to the rows that actually match.
+
+Filters:
+--------
+    equals("Appt. Status", "cancelled")
+    one_of("Hospital Name", allowed_hospitals)
+    one_of("Appt. Payment Status", ["paid", "cash"])
+    date_between("Appointment Date", yesterday, today)
+
+- Text comparisons ignore case and surrounding spaces.
+- A filter on a column that is not in the workbook is skipped, the same
+  way reports skip "Consider Patient" when it is missing.
+- Filters are a pre-filter: reports still apply their own rules on the
+  rows that come back, so the result never changes, only the cost.
+
+Column projection:
+------------------
+``stream_columns`` hands out a column subset of every row in chunks of
+STREAM_CHUNK_ROWS rows, without ever building the whole frame; paired
+with ``report_writer.write_chunks`` a sheet can be copied with memory
+bounded by one chunk, however large the workbook.
+
+Author: SKANDA N RAJ
+"""
+
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils.datetime import from_excel
+
+from report_utils.categoricals import category_mask
+from report_utils.mis_snapshot import column_key, pick_sheet, project_columns
+
+
+# Rows per chunk handed out by stream_columns
+STREAM_CHUNK_ROWS = 5_000
+
+
+# ================= FILTERS =================
+
+def _norm_text(value):
+    return "" if value is None else str(value).strip().lower()
+
+
+def _as_date(value):
+    """
+    Converts a cell value to a date, or None if it is not a date.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        try:
+            return from_excel(value).date()
+        except (ValueError, OverflowError):
+            return None
+    try:
+        return pd.Timestamp(str(value).strip()).date()
+    except (ValueError, TypeError):
+        return None
+
+
+class RowFilter:
+    """
+    A predicate on one MIS column.
+
+    ``test(value)`` is used on single cells while streaming,
+    ``mask(series)`` on a column of an already-loaded frame.
+    """
+
+    def __init__(self, column, test, mask, label):
+        self.column = column
+        self.test = test
+        self.mask = mask
+        self.label = label
+
+    def __repr__(self):
+        return f"RowFilter({self.label})"
+
+
+def equals(column, value):
+    """
+    Keeps rows whose column equals ``value`` (case/space-insensitive).
+    """
+    return one_of(column, [value])
+
+
+def one_of(column, values):
+    """
+    Keeps rows whose column is one of ``values`` (case/space-insensitive).
+    """
+    wanted = {_norm_text(v) for v in values}
+    return RowFilter(
+        column,
+        test=lambda v: _norm_text(v) in wanted,
+        mask=lambda s: category_mask(s, wanted),
+        label=f"{column} in {sorted(wanted)}",
+    )
+
+
+def date_between(column, start, end):
+    """
+    Keeps rows whose date falls in [start, end] (both inclusive).
+    """
+    def mask(s):
+        days = pd.to_datetime(s, errors="coerce").dt.normalize()
+        return days.between(pd.Timestamp(start), pd.Timestamp(end))
+
+    def test(v):
+        d = _as_date(v)
+        return d is not None and start <= d <= end
+
+    return RowFilter(column, test=test, mask=mask, label=f"{start} <= {column} <= {end}")
+
+
+def apply_filters(df, filters):
+    """
+    Applies filters to an already-loaded frame. Filters on columns the
+    frame does not have are skipped.
+    """
+    if not filters:
+        return df
+
+    keys = {column_key(c): c for c in df.columns}
+    keep = pd.Series(True, index=df.index)
+    for f in filters:
+        col = keys.get(column_key(f.column))
+        if col is not None:
+            keep &= f.mask(df[col]).fillna(False).astype(bool)
+    return df[keep]
+
+
+# ================= STREAMING READ =================
+
+def _open_rows(wb, sheet_name):
+    """
+    (header, row iterator) of a worksheet; header names are stripped and
+    empty header cells named like pandas does. ``sheet_name`` is resolved
+    like load_mis's (index, name or preferred names).
+    """
+    ws = wb[pick_sheet(wb.sheetnames, sheet_name)]
+    rows = ws.iter_rows(values_only=True)
+
+    raw_header = next(rows, None) or ()
+    header = [
+        str(h).strip() if h is not None else f"Unnamed: {i}"
+        for i, h in enumerate(raw_header)
+    ]
+    return header, rows
+
+
+def read_header(path, sheet_name=0):
+    """
+    Header row of a worksheet (stripped names), without reading the rows
+    below it.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        header, _ = _open_rows(wb, sheet_name)
+    finally:
+        wb.close()
+    return header
+
+
+def _cell(row, i):
+    return row[i] if i < len(row) else None
+
+
+def stream_mis(path, sheet_name=0, columns=None, filters=None):
+    """
+    Streams a worksheet and returns only the rows that pass every filter,
+    limited to ``columns`` (None = all columns).
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        header, rows = _open_rows(wb, sheet_name)
+        position = {column_key(h): i for i, h in enumerate(header)}
+
+        names = project_columns(header, columns)
+        keep_idx = [header.index(n) for n in names]
+
+        tests = [
+            (position[column_key(f.column)], f.test)
+            for f in (filters or [])
+            if column_key(f.column) in position
+        ]
+
+        records = []
+        for row in rows:
+            if not any(v is not None for v in row):
+                continue
+            if all(test(_cell(row, i)) for i, test in tests):
+                records.append(tuple(_cell(row, i) for i in keep_idx))
+    finally:
+        wb.close()
+
+    return pd.DataFrame.from_records(records, columns=names)
+
+
+@contextmanager
+def stream_columns(path, columns, sheet_name=0, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Streams ``columns`` of a worksheet, matched by header position, as
+    DataFrame chunks. Yields (names, chunks): the header names found, in
+    the requested order, and an iterator of chunks of at most
+    ``chunk_rows`` rows. Requested columns missing from the header are
+    left out. The workbook stays open until the block ends.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        header, rows = _open_rows(wb, sheet_name)
+        position = {}
+        for i, h in enumerate(header):
+            position.setdefault(column_key(h), i)
+
+        found = [column_key(c) for c in columns if column_key(c) in position]
+        keep_idx = [position[k] for k in dict.fromkeys(found)]
+        names = [header[i] for i in keep_idx]
+
+        def chunks():
+            records, sent = [], False
+            for row in rows:
+                if not any(v is not None for v in row):
+                    continue
+                records.append(tuple(_cell(row, i) for i in keep_idx))
+                if len(records) == chunk_rows:
+                    yield pd.DataFrame.from_records(records, columns=names)
+                    records, sent = [], True
+            # An empty sheet still gives one (header-only) chunk
+            if records or not sent:
+                yield pd.DataFrame.from_records(records, columns=names)
+
+        yield names, chunks()
+    finally:
+        wb.close()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import report_utils from the repository root, like the report scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
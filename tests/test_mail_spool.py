@@ -0,0 +1,128 @@
+import os
+import time
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from report_utils import mail_spool
+from report_utils.mail_spool import INFLIGHT, PENDING, SENT, drain, message_id, spool_message
+from report_utils.mailer import build_message
+from report_utils.report_writer import write_excel
+
+TO = ["b@domain.com", "a@domain.com"]
+CC = ["c@domain.com"]
+
+
+def _message(attachment):
+    return build_message(
+        "from@domain.com", TO, CC, "Cancelled Appointments", "Hi Team,",
+        attachments=[attachment],
+    )
+
+
+def _attachment(tmp_path, name="report.csv", text="a,b\n1,2\n"):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_same_message_built_twice_has_same_id(tmp_path):
+    path = _attachment(tmp_path)
+    first, second = _message(path), _message(path)
+
+    # MIMEMultipart picks a new boundary per message
+    assert first.as_bytes() != second.as_bytes()
+    assert message_id(first, TO + CC, date(2026, 10, 12)) == message_id(second, TO + CC, date(2026, 10, 12))
+
+
+def test_id_ignores_recipient_order():
+    msg = build_message("from@domain.com", TO, CC, "Subject", "Body")
+    assert message_id(msg, TO + CC) == message_id(msg, list(reversed(TO + CC)))
+
+
+def test_id_changes_with_content_and_run_date(tmp_path):
+    path = _attachment(tmp_path)
+    msg = _message(path)
+    base = message_id(msg, TO + CC, date(2026, 10, 12))
+
+    assert message_id(msg, TO + CC, date(2026, 10, 13)) != base
+    assert message_id(msg, TO, date(2026, 10, 12)) != base
+    other = _message(_attachment(tmp_path, text="a,b\n1,3\n"))
+    assert message_id(other, TO + CC, date(2026, 10, 12)) != base
+
+
+def test_rebuilt_message_is_spooled_once(tmp_path):
+    path = _attachment(tmp_path)
+    root = str(tmp_path / "spool")
+
+    first = spool_message(_message(path), TO + CC, root=root, run_date=date(2026, 10, 12))
+    second = spool_message(_message(path), TO + CC, root=root, run_date=date(2026, 10, 12))
+
+    assert first == second
+    assert sorted(os.listdir(os.path.join(root, PENDING))) == [f"{first}.eml", f"{first}.json"]
+
+
+def test_rebuilt_workbook_keeps_its_bytes(tmp_path):
+    pytest.importorskip("xlsxwriter")
+    df = pd.DataFrame({"Patient Name": ["A", "B"], "Appointment Date": pd.to_datetime(["2026-10-11"] * 2)})
+    write_excel(df, str(tmp_path / "first.xlsx"))
+    time.sleep(1.1)
+    write_excel(df, str(tmp_path / "second.xlsx"))
+
+    assert (tmp_path / "first.xlsx").read_bytes() == (tmp_path / "second.xlsx").read_bytes()
+
+
+class _Transport:
+    """
+    Records sends; ``during_send`` runs while a message is in flight.
+    """
+
+    def __init__(self, during_send=None):
+        self.debug = False
+        self.sent = []
+        self.during_send = during_send
+
+    def send(self, msg, recipients):
+        self.sent.append(msg["Subject"])
+        if self.during_send:
+            self.during_send()
+        return {}
+
+
+def _spool_old(tmp_path, root):
+    msg_id = spool_message(_message(_attachment(tmp_path)), TO + CC, root=root)
+    # Spooled (or last retried) well before the stale-claim age
+    old = time.time() - 2 * mail_spool.STALE_CLAIM_SECONDS
+    os.utime(os.path.join(root, PENDING, f"{msg_id}.json"), (old, old))
+    return msg_id
+
+
+def test_claim_of_old_message_is_not_taken_by_second_sender(tmp_path, monkeypatch):
+    root = str(tmp_path / "spool")
+    msg_id = _spool_old(tmp_path, root)
+    second = []
+    transport = _Transport(during_send=lambda: second.append(drain(root, log=lambda m: None)))
+    monkeypatch.setattr(mail_spool, "get_transport", lambda *a: transport)
+
+    counts = drain(root, log=lambda m: None)
+
+    assert transport.sent == ["Cancelled Appointments"]
+    assert counts["sent"] == 1 and second[0]["sent"] == 0
+    assert sorted(os.listdir(os.path.join(root, SENT))) == [f"{msg_id}.eml", f"{msg_id}.json"]
+    assert not os.listdir(os.path.join(root, INFLIGHT))
+
+
+def test_claim_without_message_body_is_put_back(tmp_path, monkeypatch):
+    root = str(tmp_path / "spool")
+    msg_id = _spool_old(tmp_path, root)
+    os.remove(os.path.join(root, PENDING, f"{msg_id}.eml"))
+    transport = _Transport()
+    monkeypatch.setattr(mail_spool, "get_transport", lambda *a: transport)
+
+    logged = []
+    counts = drain(root, log=logged.append)
+
+    assert transport.sent == [] and counts["sent"] == 0
+    assert os.listdir(os.path.join(root, PENDING)) == [f"{msg_id}.json"]
+    assert any("not sent" in m for m in logged)
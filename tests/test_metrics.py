@@ -0,0 +1,13 @@
+import os
+
+from report_utils.metrics import _prom_name, report_metrics
+
+
+def test_jenkins_variant_gets_its_own_report_name():
+    folder = os.path.join("repo", "Dropout_Consultation_Report")
+    local = report_metrics(os.path.join(folder, "main.py")).report
+    jenkins = report_metrics(os.path.join(folder, "main(Jenkins_version).py")).report
+
+    assert local == "Dropout_Consultation_Report"
+    assert jenkins == "Dropout_Consultation_Report/main(Jenkins_version)"
+    assert _prom_name(jenkins) == "dropout_consultation_report_main_jenkins_version"
@@ -0,0 +1,57 @@
+import os
+
+import pandas as pd
+import pytest
+
+from report_utils.mis_cdc import baseline_paths, capture_changes, latest_events
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("openpyxl")
+
+
+def _export(path, statuses):
+    path.parent.mkdir(exist_ok=True)
+    pd.DataFrame({
+        "Appointment ID": [f"A{i}" for i in range(len(statuses))],
+        "Appt. Status": statuses,
+    }).to_excel(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    monkeypatch.setenv("MIS_CDC_DIR", str(tmp_path / "cdc"))
+    monkeypatch.setenv("MIS_SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    return tmp_path
+
+
+def test_same_named_exports_keep_their_own_baseline(shared):
+    north = _export(shared / "north" / "MIS.xlsx", ["booked", "booked"])
+    south = _export(shared / "south" / "MIS.xlsx", ["done"])
+    quiet = lambda m: None
+
+    assert baseline_paths(north) != baseline_paths(south)
+    capture_changes(north, log=quiet)
+    capture_changes(south, log=quiet)
+
+    _export(shared / "north" / "MIS.xlsx", ["booked", "cancelled"])
+    summary = capture_changes(north, log=quiet)
+
+    assert (summary["inserts"], summary["deletes"], summary["updated_rows"]) == (0, 0, 1)
+    assert list(latest_events(north)["new"]) == ["cancelled"]
+    assert latest_events(south).empty
+
+
+def test_baseline_of_old_layout_is_adopted(shared):
+    path = _export(shared / "north" / "MIS.xlsx", ["booked"])
+    capture_changes(path, log=lambda m: None)
+
+    # Rename the baseline to the old <stem>.baseline layout
+    for new in baseline_paths(path):
+        os.replace(new, os.path.join(os.path.dirname(new), "MIS.baseline" + os.path.splitext(new)[1]))
+
+    _export(shared / "north" / "MIS.xlsx", ["done"])
+    summary = capture_changes(path, log=lambda m: None)
+
+    assert summary["updated_rows"] == 1
+    assert all(os.path.exists(p) for p in baseline_paths(path))
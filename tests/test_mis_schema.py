@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from report_utils.mis_schema import apply_schema, convert_column
+
+
+def test_identifiers_keep_leading_zeros():
+    df = pd.DataFrame({
+        "UHID": ["00123", "235974892", None],
+        "Mobile": ["09876543210", "+91 9845012345", "9845012345"],
+    })
+    out = apply_schema(df.copy())
+
+    assert list(out["UHID"].iloc[:2]) == ["00123", "235974892"]
+    assert list(out["Mobile"]) == ["09876543210", "+91 9845012345", "9845012345"]
+
+
+def test_whole_float_identifiers_read_back_as_integers():
+    df = pd.DataFrame({"UHID": [235974892.0, np.nan], "Doctor HIS ID": [41.0, 7.0]})
+    out = apply_schema(df.copy())
+
+    assert out["UHID"].iloc[0] == "235974892"
+    assert pd.isna(out["UHID"].iloc[1])
+    assert list(out["Doctor HIS ID"]) == ["41", "7"]
+
+
+def test_numeric_conversion_refuses_codes():
+    assert convert_column(pd.Series(["00123", "5"], dtype=object), "Int64") is None
+    assert convert_column(pd.Series(["+5", "6"], dtype=object), "Float64") is None
+
+    out = convert_column(pd.Series(["0", "0.5", " 12 "], dtype=object), "Float64")
+    assert list(out) == [0.0, 0.5, 12.0]
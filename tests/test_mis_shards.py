@@ -0,0 +1,20 @@
+from report_utils.mis_shards import is_sharded, shard_files
+
+
+def test_bracketed_workbook_name_is_not_a_glob(tmp_path):
+    path = tmp_path / "MIS [Oct].xlsx"
+    path.write_bytes(b"")
+
+    assert not is_sharded(str(path))
+    assert shard_files(str(path)) == [str(path)]
+
+
+def test_globs_and_manifests_are_sharded(tmp_path):
+    for name in ("MIS_a.xlsx", "MIS_b.xlsx"):
+        (tmp_path / name).write_bytes(b"")
+
+    assert shard_files(str(tmp_path / "MIS_*.xlsx")) == [
+        str(tmp_path / "MIS_a.xlsx"), str(tmp_path / "MIS_b.xlsx")
+    ]
+    assert shard_files(str(tmp_path / "MIS_[ab].xlsx")) == shard_files(str(tmp_path / "MIS_?.xlsx"))
+    assert is_sharded(str(tmp_path / "mis_manifest.txt"))
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from report_utils.mis_snapshot import load_mis, snapshot_paths
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("openpyxl")
+
+
+def _workbook(folder, status):
+    folder.mkdir()
+    path = folder / "MIS.xlsx"
+    pd.DataFrame({"Appt. Status": [status]}).to_excel(path, index=False)
+    return str(path)
+
+
+def test_same_named_workbooks_get_their_own_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setenv("MIS_SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    first = _workbook(tmp_path / "north", "done")
+    second = _workbook(tmp_path / "south", "cancelled")
+
+    assert snapshot_paths(first, "Sheet1") != snapshot_paths(second, "Sheet1")
+    assert list(load_mis(first)["Appt. Status"]) == ["done"]
+    assert list(load_mis(second)["Appt. Status"]) == ["cancelled"]
+    # Both snapshots stay valid side by side
+    assert list(load_mis(first)["Appt. Status"]) == ["done"]
+
+
+def test_snapshot_next_to_workbook_keeps_its_name(tmp_path, monkeypatch):
+    monkeypatch.delenv("MIS_SNAPSHOT_DIR", raising=False)
+    path = _workbook(tmp_path / "north", "done")
+
+    data_path, meta_path = snapshot_paths(path, "Sheet1")
+    assert data_path == str(tmp_path / "north" / ".mis_snapshot" / "MIS.Sheet1.arrow")
+    assert meta_path.endswith("MIS.Sheet1.json")
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+from report_utils.pipeline import run_pipeline
+
+pytest.importorskip("openpyxl")
+
+STAGE = '''
+SEEN = []
+MIS_COLUMNS = ["Appt. Status"]
+{sheets}
+
+def run_report(df):
+    SEEN.append(list(df["Appt. Status"]))
+    print("{folder}", list(df["Appt. Status"]))
+'''
+
+
+@pytest.fixture
+def mis(tmp_path, monkeypatch):
+    monkeypatch.setenv("MIS_SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    monkeypatch.setenv("REPORT_METRICS_DIR", str(tmp_path / "metrics"))
+    path = tmp_path / "MIS.xlsx"
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({"Appt. Status": ["summary"]}).to_excel(writer, sheet_name="Summary", index=False)
+        pd.DataFrame({"Appt. Status": ["done", "cancelled"]}).to_excel(writer, sheet_name="Export", index=False)
+    return str(path)
+
+
+def _stage(tmp_path, folder, sheets=None, name="main.py"):
+    path = tmp_path / folder / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(STAGE.format(
+        folder=folder, sheets="" if sheets is None else f"MIS_SHEETS = {sheets!r}"
+    ))
+    return str(path)
+
+
+def test_stages_read_their_own_sheet(tmp_path, mis, capsys):
+    scripts = [_stage(tmp_path, "Plain"), _stage(tmp_path, "Export", ["Export"])]
+    results = run_pipeline(mis, scripts, log=lambda m: None)
+
+    assert [r["status"] for r in results] == ["ok", "ok"]
+    out = capsys.readouterr().out
+    assert "Plain ['summary']" in out
+    assert "Export ['done', 'cancelled']" in out
+
+
+def test_same_sheet_is_loaded_once(tmp_path, mis):
+    logged = []
+    scripts = [_stage(tmp_path, "A", ["Summary"]), _stage(tmp_path, "B")]
+    run_pipeline(mis, scripts, log=logged.append)
+
+    assert len([m for m in logged if m.startswith("Loading MIS")]) == 1
+
+
+def test_duplicate_stage_names_are_rejected(tmp_path, mis, capsys):
+    first = _stage(tmp_path / "one", "Report")
+    second = _stage(tmp_path / "two", "Report", ["Export"])
+    results = run_pipeline(mis, [first, second], log=lambda m: None)
+
+    assert [(r["stage"], r["status"]) for r in results] == [
+        ("Report/main.py", "failed"), ("Report/main.py", "ok")
+    ]
+    assert "duplicate stage name" in results[0]["error"]
+    assert "Report ['summary']" in capsys.readouterr().out
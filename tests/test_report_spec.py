@@ -0,0 +1,51 @@
+from datetime import date
+
+import pytest
+
+from report_utils.report_spec import compile_plan, load_spec, mail_text
+
+SPEC = '''
+date_column = "Appointment Date"
+
+[mail]
+to = ["a@domain.com"]
+subject = "{subject}"
+body = "Rows of {{day:%d/%m/%Y}}"
+
+[[report]]
+name = "cancelled"
+window = [-15, -1]
+filters = [{{ column = "Appt. Status", equals = "cancelled" }}]
+'''
+
+
+def _spec(tmp_path, text):
+    path = tmp_path / "report_spec.toml"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_mail_text_fills_run_date_placeholders(tmp_path):
+    spec = load_spec(_spec(tmp_path, SPEC.format(subject="Cancelled {start:%d/%m} to {end:%d/%m}")))
+
+    subject, body = mail_text(spec, date(2026, 10, 17))
+    assert subject == "Cancelled 02/10 to 16/10"
+    assert body == "Rows of 16/10/2026"
+
+
+def test_mail_without_subject_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="needs a subject"):
+        load_spec(_spec(tmp_path, SPEC.format(subject="")))
+
+
+def test_unknown_mail_placeholder_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="placeholder"):
+        load_spec(_spec(tmp_path, SPEC.format(subject="Cancelled {hospital}")))
+
+
+def test_window_without_date_column_is_rejected(tmp_path):
+    spec = load_spec(_spec(tmp_path, SPEC.format(subject="Cancelled").replace(
+        'date_column = "Appointment Date"', ""
+    )))
+    with pytest.raises(ValueError, match="window but no date_column"):
+        compile_plan([spec])
@@ -0,0 +1,108 @@
+import hashlib
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from report_utils.row_keys import (
+    already_sent,
+    drop_duplicate_rows,
+    duplicated_rows,
+    legacy_keys,
+    row_keys,
+)
+from report_utils.sent_keys import SentKeyStore
+
+KEY_COLUMNS = ["Patient Name", "UHID", "Doctor Name", "Hospital Name", "Appointment Date"]
+
+
+def mk_row_hash(*values):
+    # The Completed report's key before row_keys.py, kept verbatim
+    normed = []
+    for v in values:
+        s = "" if v is None else str(v)
+        s = " ".join(s.strip().lower().split())
+        normed.append(s)
+    joined = "|".join(normed)
+    return hashlib.md5(joined.encode("utf-8")).hexdigest()
+
+
+def baseline_keys(df, columns):
+    return df.apply(lambda r: mk_row_hash(*(r[c] for c in columns)), axis=1)
+
+
+def _frame():
+    return pd.DataFrame({
+        "Patient Name": ["  Asha  Rao ", "asha rao", None, np.nan, "Ravi\tK", "Ravi K"],
+        "UHID": [235974892.0, np.nan, 17.0, 18.0, np.nan, 20.0],
+        "Doctor Name": pd.Categorical(["Dr. A", "dr. a ", "Dr. B", None, "Dr. B", "Dr. A"]),
+        "Hospital Name": ["Aster CMI Hospital", "ASTER CMI HOSPITAL", "", " ", "x", "y"],
+        "Appointment Date": pd.to_datetime([
+            pd.Timestamp("2024-01-05"), pd.Timestamp("2024-01-05 09:30"), pd.NaT,
+            pd.Timestamp("2024-01-06"), pd.Timestamp("2024-01-07"), pd.NaT,
+        ]),
+    })
+
+
+def test_legacy_keys_match_mk_row_hash():
+    df = _frame()
+    assert list(legacy_keys(df, KEY_COLUMNS)) == list(baseline_keys(df, KEY_COLUMNS))
+
+
+def test_legacy_keys_match_mk_row_hash_on_date_cells():
+    # Plain dates (object column) key as "2024-01-05", timestamps with a time
+    df = pd.DataFrame({
+        "Patient Name": ["a", "b", "c"],
+        "Appointment Date": [date(2024, 1, 5), pd.Timestamp("2024-01-05"), None],
+    })
+    columns = ["Patient Name", "Appointment Date"]
+    assert list(legacy_keys(df, columns)) == list(baseline_keys(df, columns))
+
+
+def test_nullable_missing_keys_like_the_nan_it_replaces():
+    # An integer column with blank cells, as openpyxl hands it over
+    raw = _frame()
+    raw["UHID"] = pd.Series([235974892, np.nan, 17, 18, np.nan, 20], dtype=object)
+    typed = raw.copy()
+    typed["UHID"] = typed["UHID"].astype("Int64")
+
+    assert typed["UHID"].isna().sum() == 2
+    assert list(legacy_keys(typed, KEY_COLUMNS)) == list(baseline_keys(raw, KEY_COLUMNS))
+    assert list(row_keys(typed, KEY_COLUMNS)) == list(row_keys(raw, KEY_COLUMNS))
+
+
+def test_already_sent_matches_store_of_legacy_keys(tmp_path):
+    df = _frame()
+    with SentKeyStore(str(tmp_path / "sent.sqlite")) as store:
+        store.add(baseline_keys(df.iloc[:3], KEY_COLUMNS))
+        assert store.has_legacy_keys()
+
+        sent = already_sent(store, df, row_keys(df, KEY_COLUMNS), KEY_COLUMNS)
+    assert list(sent) == [True, True, True, False, False, False]
+
+
+def test_already_sent_matches_new_keys(tmp_path):
+    df = _frame()
+    keys = row_keys(df, KEY_COLUMNS)
+    with SentKeyStore(str(tmp_path / "sent.sqlite")) as store:
+        store.add(keys.iloc[-2:])
+        sent = already_sent(store, df, keys, KEY_COLUMNS)
+    assert list(sent) == [False, False, False, False, True, True]
+
+
+def test_duplicates_match_drop_duplicates():
+    df = pd.DataFrame({
+        "a": [1, "1", 1, np.nan, "nan", np.nan, None, 1.0],
+        "b": pd.Categorical(["x", "x", "x", "y", "y", "y", "y", "x"]),
+        "c": pd.to_datetime(["2024-01-05"] * 3 + [None] * 5),
+    })
+    assert list(duplicated_rows(df)) == list(df.duplicated())
+    assert list(duplicated_rows(df, ["a"])) == list(df.duplicated(subset=["a"]))
+    assert drop_duplicate_rows(df).equals(df.drop_duplicates())
+
+
+def test_duplicates_of_high_cardinality_columns():
+    # Enough distinct values that the combined codes must be renumbered
+    values = np.arange(40_000)
+    df = pd.DataFrame({c: np.r_[values, values[:100]] % (40_000 - i) for i, c in enumerate("abcdef")})
+    assert list(duplicated_rows(df)) == list(df.duplicated())